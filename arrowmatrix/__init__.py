@@ -1,4 +1,41 @@
+import os
+
 __version__ = "0.1.0a1"
 
 from .parquet import ParquetMatrix
-from .feather import FeatherMatrix
\ No newline at end of file
+from .feather import FeatherMatrix
+from .sparse import SparseMatrix
+from .dataset import ArrowMatrixDataset
+from . import shared
+
+
+def open_matrix(filename, **kwargs):
+	"""
+	Open an arrowmatrix file, detecting whether it is Parquet, Feather or sparse.
+
+	A directory is opened as an `ArrowMatrixDataset`.
+
+	Parameters
+	----------
+	filename : path-like
+		The file (or dataset directory) to open.
+	**kwargs
+		Other keyword arguments are passed to the class constructor.
+
+	Returns
+	-------
+	ParquetMatrix, FeatherMatrix, SparseMatrix or ArrowMatrixDataset
+	"""
+	if os.path.isdir(filename):
+		return ArrowMatrixDataset(filename, **kwargs)
+	with open(filename, 'rb') as f:
+		magic = f.read(6)
+	if magic[:4] == b'PAR1':
+		return ParquetMatrix(filename, **kwargs)
+	if magic == b'ARROW1':
+		import pyarrow as pa
+		metadata = pa.ipc.open_file(filename).schema.metadata or {}
+		if b'SPARSE' in metadata:
+			return SparseMatrix(filename, **kwargs)
+		return FeatherMatrix(filename, **kwargs)
+	raise ValueError(f"{filename} is not a Parquet or Feather arrowmatrix file")
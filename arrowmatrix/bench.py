@@ -0,0 +1,726 @@
+"""
+Benchmarks for arrowmatrix read paths.
+
+These functions time alternative ways of reading the same data from
+an arrowmatrix, using `util.timing`, and return the timings so they
+can be compared or plotted.
+
+The whole suite can also be run on synthetic skims from the command
+line, writing machine-readable results for regression tracking:
+
+    python -m arrowmatrix.bench --shape 2000 2000 --columns 20 --output results.json
+"""
+
+import os
+import sys
+import json
+import importlib.util
+import time
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .util import timing
+
+
+def random_takers(shape, size, seed=0):
+	"""
+	Generate random index positions within a matrix.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrix.
+	size : int
+		The number of positions to generate.
+	seed : int, default 0
+		Random seed.
+
+	Returns
+	-------
+	list[numpy.ndarray]
+		One array of positions for each dimension.
+	"""
+	rng = np.random.default_rng(seed)
+	return [rng.integers(0, s, size=size) for s in shape]
+
+
+def bench_get_rc_methods(mx, names, size=10000, repeat=7, seed=0, quiet=False):
+	"""
+	Compare `get_rc` methods 1 to 4 against `get_rc_array`.
+
+	Parameters
+	----------
+	mx : AbstractArrowMatrix
+		The matrix to read from.
+	names : Collection[str]
+		The names of the matrix tables to read in each call.
+	size : int, default 10000
+		The number of cells to read from each matrix table.
+	repeat : int, default 7
+		The number of timing runs for each method.
+	seed : int, default 0
+		Random seed for the index positions.
+	quiet : bool, default False
+		Do not print results.
+
+	Returns
+	-------
+	pandas.DataFrame
+		Mean, std, min and max time per call for each method.
+	"""
+	names = list(names)
+	indexes = random_takers(mx.shape, size, seed=seed)
+	out = np.empty((size, len(names)), dtype='float64')
+	candidates = {
+		f'get_rc method={method}': (
+			lambda method=method: mx.get_rc(names, *indexes, method=method, attach_index=False)
+		)
+		for method in (1, 2, 3, 4)
+	}
+	candidates['get_rc_array'] = lambda: mx.get_rc_array(names, *indexes)
+	candidates['get_rc_array(out=...)'] = lambda: mx.get_rc_array(names, *indexes, out=out)
+	results = {}
+	for label, func in candidates.items():
+		if not quiet:
+			print(f"{label}: ", end="")
+		timings = timing(func, repeat=repeat, quiet=quiet)
+		results[label] = {
+			'mean': np.mean(timings),
+			'std': np.std(timings),
+			'min': np.min(timings),
+			'max': np.max(timings),
+		}
+	return pd.DataFrame.from_dict(results, orient='index')
+
+
+def bench_max_workers(mx, names=None, size=10000, workers=None, repeat=5, seed=0, quiet=False):
+	"""
+	Measure how multi-column reads scale with the number of threads.
+
+	Two operations are timed for each number of workers: `get_rc`
+	over all the names, and reading the full columns as is done by
+	`from_arrow`.
+
+	Parameters
+	----------
+	mx : AbstractArrowMatrix
+		The matrix to read from.
+	names : Collection[str], optional
+		The names of the matrix tables to read in each call.
+		Defaults to all matrix tables.
+	size : int, default 10000
+		The number of cells to read from each matrix table in `get_rc`.
+	workers : Collection[int], optional
+		The numbers of threads to try.  Defaults to powers of two
+		up to the number of cores.
+	repeat : int, default 5
+		The number of timing runs for each case.
+	seed : int, default 0
+		Random seed for the index positions.
+	quiet : bool, default False
+		Do not print results.
+
+	Returns
+	-------
+	pandas.DataFrame
+		Mean and min time per call, and speedup of the mean relative
+		to a single thread, for each operation and number of workers.
+	"""
+	if names is None:
+		names = mx.list_matrices()
+	names = list(names)
+	if workers is None:
+		cores = os.cpu_count() or 1
+		workers = [1]
+		while workers[-1] * 2 <= cores:
+			workers.append(workers[-1] * 2)
+		if workers[-1] != cores:
+			workers.append(cores)
+	indexes = random_takers(mx.shape, size, seed=seed)
+	rows = []
+	for max_workers in workers:
+		candidates = {
+			'get_rc': lambda: mx.get_rc(
+				names, *indexes, attach_index=False, max_workers=max_workers,
+			),
+			'read_columns': lambda: mx._get_arrow_table_parallel(
+				names, max_workers=max_workers,
+			),
+		}
+		for label, func in candidates.items():
+			if not quiet:
+				print(f"{label} max_workers={max_workers}: ", end="")
+			timings = timing(func, repeat=repeat, quiet=quiet)
+			rows.append(dict(
+				operation=label,
+				max_workers=max_workers,
+				mean=np.mean(timings),
+				min=np.min(timings),
+			))
+	result = pd.DataFrame(rows).set_index(['operation', 'max_workers'])
+	single = result['mean'].xs(workers[0], level='max_workers')
+	result['speedup'] = single.reindex(result.index.get_level_values(0)).to_numpy() / result['mean']
+	return result
+
+
+def _convert_hdf5(cls, omx_filename, to_filename, kwargs):
+	# run in a fresh process, so the peak RSS reflects only this conversion
+	import contextlib
+	from .util import MemoryUsage
+	# keep stdout clean for results, e.g. JSON from `main`
+	with contextlib.redirect_stdout(sys.stderr):
+		usage = MemoryUsage()
+		start = time.time()
+		cls.from_hdf5(omx_filename, to_filename, overwrite=True, **kwargs)
+		duration = time.time() - start
+		usage.check(silent=True)
+	# ru_maxrss is reported in kilobytes on Linux, bytes on macOS
+	scale = 1 if sys.platform == 'darwin' else 1024
+	return dict(
+		seconds=duration,
+		peak_rss=usage.max_memory_history[-1] * scale,
+		start_rss=usage.memory_history[1],
+	)
+
+
+def _convert_hdf5_in_fresh_process(cls, omx_filename, to_filename, kwargs):
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor
+	context = multiprocessing.get_context('spawn')
+	with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+		return pool.submit(
+			_convert_hdf5, cls, omx_filename, to_filename, kwargs,
+		).result()
+
+
+def bench_hdf5_conversion(cls, omx_filename, to_filename, memory_budgets=(None,), quiet=False, **kwargs):
+	"""
+	Measure the time and peak memory usage of converting an HDF5 OMX file.
+
+	Each conversion is run in a separate fresh process, so that
+	peak memory usage is measured independently.  Requires `psutil`.
+
+	Parameters
+	----------
+	cls : type
+		The arrowmatrix class to convert to, e.g. `ParquetMatrix`.
+	omx_filename : path-like
+		The source openmatrix file.
+	to_filename : path-like
+		The destination file, which is overwritten by each conversion.
+	memory_budgets : Collection[int or None]
+		The values of `memory_budget` to try.  None loads the whole
+		file before writing.
+	quiet : bool, default False
+		Do not print results.
+	**kwargs
+		Other keyword arguments are passed to `from_hdf5`.
+
+	Returns
+	-------
+	pandas.DataFrame
+		Conversion time, peak RSS, and RSS at process start, for each
+		memory budget.
+	"""
+	from .util import si_units
+	rows = []
+	for memory_budget in memory_budgets:
+		r = _convert_hdf5_in_fresh_process(
+			cls, omx_filename, to_filename, dict(kwargs, memory_budget=memory_budget),
+		)
+		if not quiet:
+			budget = 'None' if memory_budget is None else si_units(memory_budget)
+			print(
+				f"memory_budget={budget}: {si_units(r['seconds'], 's')}, "
+				f"peak RSS {si_units(r['peak_rss'])}"
+			)
+		rows.append(dict(memory_budget=memory_budget, **r))
+	return pd.DataFrame(rows)
+
+
+def bench_hdf5_processes(cls, omx_filename, to_filename, processes=(1, 2, 4), quiet=False, **kwargs):
+	"""
+	Measure the speedup of converting an HDF5 OMX file with worker processes.
+
+	Each conversion is run in a separate fresh process.  The baseline
+	is the plain `from_hdf5` conversion, which loads the whole file
+	in this process before writing.  Requires `psutil`.
+
+	Parameters
+	----------
+	cls : type
+		The arrowmatrix class to convert to, e.g. `ParquetMatrix`.
+	omx_filename : path-like
+		The source openmatrix file.
+	to_filename : path-like
+		The destination file, which is overwritten by each conversion.
+	processes : Collection[int]
+		The numbers of worker processes to try.
+	quiet : bool, default False
+		Do not print results.
+	**kwargs
+		Other keyword arguments are passed to `from_hdf5`, e.g.
+		`memory_budget` or `compression`.
+
+	Returns
+	-------
+	pandas.DataFrame
+		Conversion time, peak RSS, and speedup relative to the
+		baseline, for each number of processes.  The baseline is
+		shown as 0 processes.
+	"""
+	from .util import si_units
+	baseline_kwargs = {k: v for k, v in kwargs.items() if k != 'memory_budget'}
+	rows = [dict(
+		processes=0,
+		**_convert_hdf5_in_fresh_process(cls, omx_filename, to_filename, baseline_kwargs),
+	)]
+	for n in processes:
+		rows.append(dict(
+			processes=n,
+			**_convert_hdf5_in_fresh_process(
+				cls, omx_filename, to_filename, dict(kwargs, processes=n),
+			),
+		))
+	result = pd.DataFrame(rows)
+	result['speedup'] = result['seconds'].iloc[0] / result['seconds']
+	if not quiet:
+		for _, r in result.iterrows():
+			print(
+				f"processes={r['processes']}: {si_units(r['seconds'], 's')}, "
+				f"peak RSS {si_units(r['peak_rss'])}, speedup {r['speedup']:.2f}"
+			)
+	return result
+
+
+def duplicated_takers(shape, size, duplicate_ratio=0.0, span=1.0, seed=0):
+	"""
+	Generate random index positions with repeats and limited spread.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrix.
+	size : int
+		The number of positions to generate.
+	duplicate_ratio : float, default 0
+		The fraction of positions that repeat another position, so
+		that there are about `size * (1 - duplicate_ratio)` distinct cells.
+	span : float, default 1
+		The fraction of the matrix, as a contiguous range of origin
+		rows, within which the positions fall.  Smaller values give
+		more locality.
+	seed : int, default 0
+		Random seed.
+
+	Returns
+	-------
+	list[numpy.ndarray]
+		One array of positions for each dimension.
+	"""
+	rng = np.random.default_rng(seed)
+	n_cells = int(np.prod(shape))
+	region = max(1, int(n_cells * span))
+	n_unique = max(1, min(region, int(round(size * (1 - duplicate_ratio)))))
+	cells = rng.choice(region, size=n_unique, replace=False)
+	flat = np.concatenate([cells, rng.choice(cells, size=size - n_unique)])
+	rng.shuffle(flat)
+	return list(np.unravel_index(flat, shape))
+
+
+def bench_dedup(
+		mx, names, size=100000, duplicate_ratios=(0.0, 0.5, 0.9, 0.99),
+		spans=(1.0, 0.01), repeat=5, seed=0, quiet=False,
+):
+	"""
+	Compare `get_rc` with and without `dedup`, varying repeats and locality.
+
+	Parameters
+	----------
+	mx : AbstractArrowMatrix
+		The matrix to read from.
+	names : str or Collection[str]
+		The names of the matrix tables to read in each call.
+	size : int, default 100000
+		The number of cells to read from each matrix table.
+	duplicate_ratios : Collection[float]
+		The fractions of repeated positions to try.
+	spans : Collection[float]
+		The fractions of the matrix to spread positions across.
+	repeat : int, default 5
+		The number of timing runs for each case.
+	seed : int, default 0
+		Random seed for the index positions.
+	quiet : bool, default False
+		Do not print results.
+
+	Returns
+	-------
+	pandas.DataFrame
+		Mean time per call with and without `dedup`, and the speedup
+		from `dedup`, for each duplicate ratio and span.
+	"""
+	rows = []
+	for span in spans:
+		for duplicate_ratio in duplicate_ratios:
+			indexes = duplicated_takers(mx.shape, size, duplicate_ratio, span, seed=seed)
+			row = dict(span=span, duplicate_ratio=duplicate_ratio)
+			for dedup in (False, True):
+				if not quiet:
+					print(f"span={span} duplicate_ratio={duplicate_ratio} dedup={dedup}: ", end="")
+				timings = timing(
+					lambda: mx.get_rc(names, *indexes, attach_index=False, dedup=dedup),
+					repeat=repeat, quiet=quiet,
+				)
+				row['dedup' if dedup else 'plain'] = np.mean(timings)
+			rows.append(row)
+	result = pd.DataFrame(rows).set_index(['span', 'duplicate_ratio'])
+	result['speedup'] = result['plain'] / result['dedup']
+	return result
+
+
+def bench_footprint(matrices, names, size=10000, repeat=5, seed=0, quiet=False):
+	"""
+	Compare file size and lookup speed of the same data in different files.
+
+	Parameters
+	----------
+	matrices : Mapping[str, AbstractArrowMatrix]
+		Matrices holding the same data (e.g. dense Feather, dense
+		Parquet and sparse files), keyed by a label.
+	names : str or Collection[str]
+		The names of the matrix tables to read in each call.
+	size : int, default 10000
+		The number of cells to read from each matrix table by `get_rc`.
+	repeat : int, default 5
+		The number of timing runs for each case.
+	seed : int, default 0
+		Random seed for the index positions.
+	quiet : bool, default False
+		Do not print results.
+
+	Returns
+	-------
+	pandas.DataFrame
+		File size in bytes, and mean time per `get_rc` and per
+		`get_matrix` call, for each labelled matrix.
+	"""
+	if isinstance(names, str):
+		names = [names]
+	rows = []
+	for label, mx in matrices.items():
+		indexes = random_takers(mx.shape, size, seed=seed)
+		row = dict(label=label, file_size=os.path.getsize(mx.filename))
+		if not quiet:
+			print(f"{label} get_rc: ", end="")
+		row['get_rc'] = np.mean(timing(
+			lambda: mx.get_rc(names, *indexes, attach_index=False),
+			repeat=repeat, quiet=quiet,
+		))
+		if not quiet:
+			print(f"{label} get_matrix: ", end="")
+		row['get_matrix'] = np.mean(timing(
+			lambda: [mx.get_matrix(name) for name in names],
+			repeat=repeat, quiet=quiet,
+		))
+		rows.append(row)
+	return pd.DataFrame(rows).set_index('label')
+
+
+# writer options for each codec, by format
+CODEC_OPTIONS = {
+	'feather': {
+		'uncompressed': dict(compression='uncompressed'),
+		'lz4': dict(compression='lz4'),
+		'zstd': dict(compression='zstd'),
+	},
+	'parquet': {
+		'uncompressed': dict(compression='none'),
+		'lz4': dict(compression='lz4'),
+		'zstd': dict(compression='zstd'),
+	},
+}
+
+
+def synthetic_skims(shape=(1000, 1000), n_columns=10, seed=0):
+	"""
+	Generate synthetic skims, with structure similar to real travel times.
+
+	Values grow with the distance between zones placed at random in a
+	unit square, plus noise, rounded to two decimals, so they compress
+	about as well as real skims.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrices.  Zones are placed for the first
+		two dimensions, any further dimensions (e.g. time periods)
+		scale the values.
+	n_columns : int
+		The number of matrices.
+	seed : int, default 0
+		Random seed.
+
+	Returns
+	-------
+	pyarrow.Table
+		A tall table with one float32 column per matrix, and OMX_VERSION
+		and SHAPE metadata, ready to write with `_write_arrow_table`.
+	"""
+	from .common import OMX_VERSION
+	shape = tuple(int(i) for i in shape)
+	rng = np.random.default_rng(seed)
+	xy = rng.random((max(shape[:2]), 2))
+	if len(shape) == 1:
+		base = np.linalg.norm(xy[:shape[0]], axis=1)
+	else:
+		base = np.linalg.norm(xy[:shape[0], None, :] - xy[None, :shape[1], :], axis=-1)
+	base = base.reshape(base.shape + (1,) * (len(shape) - base.ndim))
+	base = np.broadcast_to(base, shape)
+	scales = [1 + np.arange(size) / size for size in shape[2:]]
+	for d, scale in enumerate(scales):
+		base = base * scale.reshape((1, 1) + (1,) * d + (-1,) + (1,) * (len(scales) - d - 1))
+	columns = {}
+	for n in range(n_columns):
+		values = base * rng.uniform(10, 60) + rng.exponential(0.5, size=shape)
+		columns[f'SKIM_{n:03d}'] = np.round(values, 2).astype(np.float32).reshape(-1)
+	table = pa.table(columns)
+	return table.replace_schema_metadata({
+		b'OMX_VERSION': OMX_VERSION,
+		b'SHAPE': str(shape).encode(),
+	})
+
+
+def _write_synthetic_omx(table, shape, filename):
+	import openmatrix as omx # import here, optional dependency
+	with omx.open_file(filename, 'w') as f:
+		for name, column in zip(table.column_names, table.columns):
+			f[name] = column.to_numpy().reshape(shape)
+
+
+def _stats(timings):
+	return dict(
+		mean=float(np.mean(timings)),
+		std=float(np.std(timings)),
+		min=float(np.min(timings)),
+		max=float(np.max(timings)),
+	)
+
+
+def bench_suite(
+		shape=(1000, 1000),
+		n_columns=10,
+		formats=('feather', 'parquet'),
+		codecs=('uncompressed', 'lz4', 'zstd'),
+		chunk_cells=(None,),
+		rc_sizes=(100, 10000),
+		n_names=3,
+		repeat=5,
+		conversion=True,
+		workdir=None,
+		seed=0,
+		quiet=True,
+):
+	"""
+	Run the benchmark suite over formats, codecs and chunk sizes.
+
+	For each combination, a file of synthetic skims is written and
+	these operations are timed: opening the file, `get_matrix`,
+	`get_rc` for each number of cells, and `__getitem__` blocks of
+	rows and of columns.  If `openmatrix` and `psutil` are installed
+	and `conversion` is set, the time and peak RSS of converting the
+	skims from an HDF5 OMX file are measured too, each conversion in
+	a fresh process.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the synthetic matrices.
+	n_columns : int
+		The number of synthetic matrices.
+	formats : Collection[{'feather', 'parquet'}]
+	codecs : Collection[{'uncompressed', 'lz4', 'zstd'}]
+	chunk_cells : Collection[int or None]
+		The chunk sizes to write with, as Feather `chunksize` or
+		Parquet `row_group_size`.  None uses the default for each
+		format, i.e. a single record batch for uncompressed Feather,
+		record batches of whole origin rows for compressed Feather,
+		and origin-aligned row groups for Parquet.
+	rc_sizes : Collection[int]
+		The numbers of cells to read with `get_rc`.
+	n_names : int
+		The number of matrices read by `get_rc` in each call.
+	repeat : int
+		The number of timing runs for each operation.
+	conversion : bool, default True
+		Measure conversion from HDF5, if possible.
+	workdir : path-like, optional
+		The directory to write files in.  Defaults to a temporary
+		directory, which is removed afterwards.
+	seed : int, default 0
+		Random seed.
+	quiet : bool, default True
+		Do not print results as they are measured.
+
+	Returns
+	-------
+	dict
+		With the suite 'parameters', the 'environment' (versions and
+		platform), and a list of 'results', each a flat dict with the
+		format, codec, chunk_cells, operation, size, file_size, and
+		timing statistics in seconds (or conversion seconds and
+		peak_rss in bytes).
+	"""
+	from . import FeatherMatrix, ParquetMatrix
+	classes = {'feather': FeatherMatrix, 'parquet': ParquetMatrix}
+	chunk_option = {'feather': 'chunksize', 'parquet': 'row_group_size'}
+	shape = tuple(int(i) for i in shape)
+	parameters = dict(
+		shape=list(shape), n_columns=n_columns, formats=list(formats), codecs=list(codecs),
+		chunk_cells=list(chunk_cells), rc_sizes=list(rc_sizes), n_names=n_names,
+		repeat=repeat, seed=seed,
+	)
+	table = synthetic_skims(shape, n_columns, seed=seed)
+	names = table.column_names[:n_names]
+	results = []
+
+	def record(**r):
+		results.append(r)
+		if not quiet:
+			print(json.dumps(r), file=sys.stderr)
+
+	tmp = None
+	if workdir is None:
+		tmp = tempfile.TemporaryDirectory(prefix='arrowmatrix-bench-')
+		workdir = tmp.name
+	try:
+		omx_filename = None
+		if conversion:
+			missing = [
+				module for module in ('openmatrix', 'psutil')
+				if importlib.util.find_spec(module) is None
+			]
+			if missing:
+				if not quiet:
+					print(f"skipping conversion benchmarks, {', '.join(missing)} not installed", file=sys.stderr)
+			else:
+				omx_filename = os.path.join(workdir, 'synthetic.omx')
+				_write_synthetic_omx(table, shape, omx_filename)
+		for fmt in formats:
+			cls = classes[fmt]
+			for codec in codecs:
+				for cells in chunk_cells:
+					kwargs = dict(CODEC_OPTIONS[fmt][codec])
+					if cells is not None:
+						kwargs[chunk_option[fmt]] = int(cells)
+					filename = os.path.join(workdir, f'synthetic_{fmt}_{codec}_{cells}.amx')
+					case = dict(format=fmt, codec=codec, chunk_cells=cells)
+					if omx_filename is not None:
+						r = _convert_hdf5_in_fresh_process(cls, omx_filename, filename, kwargs)
+						record(**case, operation='convert', size=None, **r)
+					else:
+						if os.path.exists(filename):
+							os.remove(filename)
+						cls._write_arrow_table(filename, table, shape, **kwargs)
+					case['file_size'] = os.path.getsize(filename)
+					record(**case, operation='open', size=None, **_stats(
+						timing(lambda: cls(filename), repeat=repeat, quiet=True)
+					))
+					mx = cls(filename)
+					record(**case, operation='get_matrix', size=int(np.prod(shape)), **_stats(
+						timing(lambda: mx.get_matrix(names[0]), repeat=repeat, quiet=True)
+					))
+					for size in rc_sizes:
+						indexes = random_takers(shape, size, seed=seed)
+						record(**case, operation='get_rc', size=size * len(names), **_stats(
+							timing(
+								lambda: mx.get_rc(names, *indexes, attach_index=False),
+								repeat=repeat, quiet=True,
+							)
+						))
+					block = max(1, shape[0] // 10)
+					record(**case, operation='getitem_rows', size=block * int(np.prod(shape[1:])), **_stats(
+						timing(lambda: mx[names[0], :block], repeat=repeat, quiet=True)
+					))
+					if len(shape) > 1:
+						block = max(1, shape[1] // 10)
+						cells_selected = block * int(np.prod(shape)) // shape[1]
+						record(**case, operation='getitem_columns', size=cells_selected, **_stats(
+							timing(lambda: mx[names[0], :, :block], repeat=repeat, quiet=True)
+						))
+					mx = None
+	finally:
+		if tmp is not None:
+			tmp.cleanup()
+	return dict(
+		parameters=parameters,
+		environment=_environment(),
+		results=results,
+	)
+
+
+def _environment():
+	from . import __version__
+	return dict(
+		arrowmatrix=__version__,
+		numpy=np.__version__,
+		pandas=pd.__version__,
+		pyarrow=pa.__version__,
+		python=platform.python_version(),
+		platform=platform.platform(),
+		cpu_count=os.cpu_count(),
+		timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+	)
+
+
+def main(argv=None):
+	"""Run the benchmark suite from the command line."""
+	import argparse
+	parser = argparse.ArgumentParser(
+		prog='python -m arrowmatrix.bench',
+		description='Benchmark arrowmatrix formats, codecs and chunk sizes on synthetic skims.',
+	)
+	parser.add_argument('--shape', type=int, nargs='+', default=[1000, 1000])
+	parser.add_argument('--columns', type=int, default=10, help='number of synthetic matrices')
+	parser.add_argument('--formats', nargs='+', default=['feather', 'parquet'], choices=sorted(CODEC_OPTIONS))
+	parser.add_argument('--codecs', nargs='+', default=['uncompressed', 'lz4', 'zstd'],
+		choices=sorted(CODEC_OPTIONS['feather']))
+	parser.add_argument('--chunk-cells', type=int, nargs='+', default=None,
+		help='chunk sizes to write with, in cells (default: the format default)')
+	parser.add_argument('--rc-sizes', type=int, nargs='+', default=[100, 10000])
+	parser.add_argument('--names', type=int, default=3, help='number of matrices read by each get_rc')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--no-conversion', action='store_true', help='skip the HDF5 conversion benchmark')
+	parser.add_argument('--workdir', default=None, help='directory for files (default: a temporary directory)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', '-o', default=None, help='JSON file to write (default: stdout)')
+	parser.add_argument('--verbose', '-v', action='store_true', help='print each result to stderr as it is measured')
+	args = parser.parse_args(argv)
+	result = bench_suite(
+		shape=args.shape,
+		n_columns=args.columns,
+		formats=args.formats,
+		codecs=args.codecs,
+		chunk_cells=args.chunk_cells or [None],
+		rc_sizes=args.rc_sizes,
+		n_names=args.names,
+		repeat=args.repeat,
+		conversion=not args.no_conversion,
+		workdir=args.workdir,
+		seed=args.seed,
+		quiet=not args.verbose,
+	)
+	if args.output is None:
+		json.dump(result, sys.stdout, indent=1)
+		print()
+	else:
+		with open(args.output, 'w') as f:
+			json.dump(result, f, indent=1)
+	return result
+
+
+if __name__ == '__main__':
+	main()
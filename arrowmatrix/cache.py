@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+
+
+class ColumnCache:
+	"""
+	A least-recently-used cache of decoded columns, with a byte budget.
+
+	Parameters
+	----------
+	max_bytes : int
+		The maximum total decoded size of the cached columns.
+		When adding a column would exceed this budget, the least
+		recently used columns are evicted.  Columns larger than
+		the whole budget are never cached.
+	"""
+
+	def __init__(self, max_bytes):
+		self.max_bytes = int(max_bytes)
+		self._columns = OrderedDict()
+		self._lock = threading.Lock()
+		self.nbytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self._columns)
+
+	def __contains__(self, name):
+		return name in self._columns
+
+	def get(self, name):
+		"""
+		Get a cached column, counting a hit or a miss.
+
+		Parameters
+		----------
+		name : str
+
+		Returns
+		-------
+		pyarrow.ChunkedArray or None
+		"""
+		with self._lock:
+			column = self._columns.get(name)
+			if column is None:
+				self.misses += 1
+			else:
+				self._columns.move_to_end(name)
+				self.hits += 1
+			return column
+
+	def put(self, name, column):
+		"""
+		Add a column to the cache, evicting others as needed.
+
+		Parameters
+		----------
+		name : str
+		column : pyarrow.ChunkedArray
+		"""
+		size = column.nbytes
+		if size > self.max_bytes:
+			return
+		with self._lock:
+			if name in self._columns:
+				self.nbytes -= self._columns.pop(name).nbytes
+			while self._columns and self.nbytes + size > self.max_bytes:
+				_, evicted = self._columns.popitem(last=False)
+				self.nbytes -= evicted.nbytes
+				self.evictions += 1
+			self._columns[name] = column
+			self.nbytes += size
+
+	def discard(self, name):
+		"""Remove a column from the cache, if it is present."""
+		with self._lock:
+			column = self._columns.pop(name, None)
+			if column is not None:
+				self.nbytes -= column.nbytes
+
+	def clear(self):
+		"""Remove all columns from the cache.  Counters are not reset."""
+		with self._lock:
+			self._columns.clear()
+			self.nbytes = 0
+
+	def info(self):
+		"""dict : Counters and current size of the cache."""
+		return dict(
+			hits=self.hits,
+			misses=self.misses,
+			evictions=self.evictions,
+			columns=len(self._columns),
+			nbytes=self.nbytes,
+			max_bytes=self.max_bytes,
+		)
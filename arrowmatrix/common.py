@@ -2,7 +2,15 @@
 import os
 import ast
 import json
+import time
+import operator
+import collections
+import asyncio
+import fnmatch
 import pathlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import pyarrow as pa
@@ -10,6 +18,13 @@ import pyarrow.feather as pf
 from abc import ABC, abstractmethod
 
 from .exceptions import MissingShapeError
+from .cache import ColumnCache
+from .downcast import narrowest_dtype, cast_values, downcast_metadata, downcast_table
+from .statistics import STATISTICS, StatisticsAccumulator, statistics_metadata, read_statistics, remove_statistics
+from .lookup import LookupIndex, lookup_metadata, read_lookups
+from .fold import PERIODS, fold_spec, fold_schema, fold_table
+from .instrument import ReadStats, current_call, instrumented, timed, count
+from .overlay import Overlay, has_overlay, overlay_path
 
 OMX_VERSION = b'0.3.0a'
 
@@ -60,6 +75,280 @@ def omx_hdf5_2_to_arrow(
 	table = table.cast(new_schema)
 	return table
 
+def column_options(names, option, default=None):
+	"""
+	Resolve a per-column writer option.
+
+	Parameters
+	----------
+	names : Collection[str]
+		The column names being written.
+	option : scalar or Mapping[str, scalar]
+		The option value.  If given as a mapping, the keys are
+		shell-style wildcard patterns (e.g. "DIST*") that are
+		matched against each column name in order, and the value
+		of the first matching pattern is used for that column.
+	default : scalar, optional
+		The value for columns that match no pattern.  If None,
+		these columns are omitted from the result.
+
+	Returns
+	-------
+	scalar or dict
+		The option unchanged if it is not a mapping, otherwise
+		a dict of values keyed by column name.
+	"""
+	if not isinstance(option, dict):
+		return option
+	result = {}
+	for name in names:
+		for pattern, value in option.items():
+			if fnmatch.fnmatchcase(name, pattern):
+				result[name] = value
+				break
+		else:
+			if default is not None:
+				result[name] = default
+	return result
+
+
+def _open_omx(omx_file):
+	"""
+	Open an HDF5 OMX file if given a path.
+
+	Returns
+	-------
+	omx.File
+		The open file.
+	bool
+		Whether the file was opened here, and so should be
+		closed by the caller when finished.
+	"""
+	import openmatrix as omx # import here, optional dependency
+	if isinstance(omx_file, (str, pathlib.Path)):
+		return omx.open_file(omx_file), True
+	assert isinstance(omx_file, omx.File)
+	return omx_file, False
+
+
+def omx_hdf5_2_schema(omx_file):
+	"""
+	Build the arrow schema for the 2-d part of an HDF5 OMX file.
+
+	No matrix data is read, only the names, data types and
+	shape of the matrices.
+
+	Parameters
+	----------
+	omx_file : omx.File
+
+	Returns
+	-------
+	pyarrow.Schema
+	"""
+	shape = tuple(int(i) for i in omx_file.shape())
+	fields = [
+		pa.field(node.name, pa.from_numpy_dtype(node.dtype))
+		for node in omx_file.list_nodes(where="/data")
+	]
+	return pa.schema(fields, metadata={
+		b'OMX_VERSION': OMX_VERSION,
+		b'SHAPE': str(shape).encode(),
+	})
+
+
+def downcast_omx_hdf5_2_schema(omx_file, schema, tolerance=0):
+	"""
+	Choose the narrowest acceptable type for each matrix in an HDF5 OMX file.
+
+	Matrices are read one at a time, so memory usage is bounded
+	by the size of the largest single matrix.
+
+	Parameters
+	----------
+	omx_file : omx.File
+	schema : pyarrow.Schema
+		The schema of the output, as given by `omx_hdf5_2_schema`.
+	tolerance : float, default 0
+		The largest absolute change in any value that is acceptable.
+
+	Returns
+	-------
+	pyarrow.Schema
+		The schema with narrowed types, and the original type of
+		each narrowed matrix recorded in the 'DOWNCAST' metadata.
+	"""
+	fields = []
+	casts = {}
+	for field in schema:
+		values = omx_file.get_node(f"/data/{field.name}")[:]
+		dtype = narrowest_dtype(values, tolerance=tolerance)
+		if dtype != values.dtype:
+			casts[field.name] = str(field.type)
+			field = pa.field(field.name, pa.from_numpy_dtype(dtype))
+		fields.append(field)
+	return pa.schema(fields, metadata=downcast_metadata(schema.metadata, casts))
+
+
+def _downcast_tolerance(downcast):
+	"""Interpret a `downcast` argument as a tolerance, or None if disabled."""
+	if downcast is None or downcast is False:
+		return None
+	if downcast is True:
+		return 0
+	return float(downcast)
+
+
+def rows_per_slab(schema, memory_budget):
+	"""
+	The number of origin rows that fit in a memory budget.
+
+	Parameters
+	----------
+	schema : pyarrow.Schema
+		The schema of the data, including SHAPE metadata.
+	memory_budget : int
+		The maximum size in bytes of the decoded data for
+		all columns in one slab.
+
+	Returns
+	-------
+	int
+		The number of origin rows per slab, at least 1.
+	"""
+	shape = table_shape(schema)
+	row_cells = int(np.prod(shape[1:]))
+	row_bytes = row_cells * sum(np.dtype(field.type.to_pandas_dtype()).itemsize for field in schema)
+	return max(1, int(memory_budget // max(row_bytes, 1)))
+
+
+def iter_omx_hdf5_2_slabs(omx_file, schema, slab_rows):
+	"""
+	Read the 2-d part of an HDF5 OMX file in slabs of origin rows.
+
+	Parameters
+	----------
+	omx_file : omx.File
+	schema : pyarrow.Schema
+		The schema of the output, as given by `omx_hdf5_2_schema`.
+	slab_rows : int
+		The number of origin rows in each slab.
+
+	Yields
+	------
+	start, stop : int
+		The origin rows included in this slab.
+	pyarrow.Table
+		The tall table of data for these rows of all matrices.
+	"""
+	shape = table_shape(schema)
+	nodes = [omx_file.get_node(f"/data/{field.name}") for field in schema]
+	for start in range(0, shape[0], slab_rows):
+		stop = min(start + slab_rows, shape[0])
+		arrays = [
+			pa.array(cast_values(node[start:stop].reshape(-1), field.type.to_pandas_dtype()))
+			for node, field in zip(nodes, schema)
+		]
+		yield start, stop, pa.Table.from_arrays(arrays, schema=schema)
+
+
+_worker_omx_file = None
+
+def _open_worker_omx(filename):
+	global _worker_omx_file
+	import openmatrix as omx # import here, optional dependency
+	_worker_omx_file = omx.open_file(filename)
+
+
+def _read_worker_omx(names, start, stop):
+	return [
+		_worker_omx_file.get_node(f"/data/{name}")[start:stop].reshape(-1)
+		for name in names
+	]
+
+
+def iter_omx_hdf5_2_slabs_parallel(filename, schema, slab_rows, processes):
+	"""
+	Read the 2-d part of an HDF5 OMX file in slabs, using worker processes.
+
+	The columns of each slab are split into groups, which are read
+	and decoded by a pool of worker processes, each holding its own
+	handle on the source file.  The next slab is read while the
+	current one is being consumed.
+
+	Parameters
+	----------
+	filename : path-like
+		The path to the openmatrix file.
+	schema : pyarrow.Schema
+		The schema of the output, as given by `omx_hdf5_2_schema`.
+	slab_rows : int
+		The number of origin rows in each slab.
+	processes : int
+		The number of worker processes.
+
+	Yields
+	------
+	start, stop : int
+		The origin rows included in this slab.
+	pyarrow.Table
+		The tall table of data for these rows of all matrices.
+	"""
+	import multiprocessing
+	from concurrent.futures import ProcessPoolExecutor
+	shape = table_shape(schema)
+	names = schema.names
+	n_groups = min(processes * 4, len(names))
+	bounds = np.linspace(0, len(names), n_groups + 1).astype(int)
+	groups = [names[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+	context = multiprocessing.get_context('spawn')
+
+	with ProcessPoolExecutor(
+			max_workers=processes,
+			mp_context=context,
+			initializer=_open_worker_omx,
+			initargs=(str(filename),),
+	) as pool:
+		def submit(start):
+			stop = min(start + slab_rows, shape[0])
+			futures = [pool.submit(_read_worker_omx, group, start, stop) for group in groups]
+			return start, stop, futures
+
+		starts = list(range(0, shape[0], slab_rows))
+		pending = submit(starts[0])
+		for next_start in starts[1:] + [None]:
+			start, stop, futures = pending
+			if next_start is not None:
+				pending = submit(next_start)
+			arrays = [
+				pa.array(cast_values(values, field.type.to_pandas_dtype()))
+				for values, field in zip(
+					(values for future in futures for values in future.result()),
+					schema,
+				)
+			]
+			yield start, stop, pa.Table.from_arrays(arrays, schema=schema)
+
+
+def omx_hdf5_lookups(omx_file):
+	"""
+	Read the 1-d lookups of an HDF5 OMX file that match its first dimension.
+
+	Parameters
+	----------
+	omx_file : omx.File
+
+	Returns
+	-------
+	pyarrow.Table
+		One column for each lookup, possibly none.
+	"""
+	shape = omx_file.shape()
+	if not omx_file.list_nodes(where="/lookup"):
+		return pa.table({})
+	return omx_hdf5_1_to_arrow(omx_file, shape=None if shape[0] == shape[1] else int(shape[0]))
+
+
 def omx_hdf5_1_to_arrow(
 		omx_file,
 		*,
@@ -107,14 +396,326 @@ def omx_hdf5_1_to_arrow(
 	return table
 
 
+def table_shape(table):
+	"""
+	Read the matrix shape from the metadata of a pyarrow.Table.
+
+	Parameters
+	----------
+	table : pyarrow.Table or pyarrow.Schema
+
+	Returns
+	-------
+	tuple or None
+	"""
+	metadata = table.schema.metadata if isinstance(table, pa.Table) else table.metadata
+	if not metadata or b'SHAPE' not in metadata:
+		return None
+	shape = ast.literal_eval(metadata[b'SHAPE'].decode())
+	if isinstance(shape, int):
+		shape = (shape,)
+	return tuple(shape)
+
+
+def table_tile(table):
+	"""
+	Read the tile shape from the metadata of a pyarrow.Table.
+
+	Parameters
+	----------
+	table : pyarrow.Table or pyarrow.Schema
+
+	Returns
+	-------
+	tuple or None
+		The shape of the tiles, or None if the data is stored
+		in row-major order.
+	"""
+	metadata = table.schema.metadata if isinstance(table, pa.Table) else table.metadata
+	if not metadata or b'TILE' not in metadata:
+		return None
+	return tuple(ast.literal_eval(metadata[b'TILE'].decode()))
+
+
+def normalize_tile(shape, tile):
+	"""
+	Normalize a tile shape for a matrix.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrix.
+	tile : int or tuple or None
+		The tile shape.  An int gives the same tile size on every
+		dimension.  A tuple shorter than `shape`, or None entries,
+		give tiles spanning the whole of the remaining dimensions.
+
+	Returns
+	-------
+	tuple or None
+		The tile shape with one positive int per dimension, each no
+		larger than the matrix, or None if `tile` is None or the tiles
+		would cover the whole matrix (i.e. row-major order).
+	"""
+	if tile is None:
+		return None
+	if isinstance(tile, (int, np.integer)):
+		tile = (tile,) * len(shape)
+	tile = tuple(tile)
+	if len(tile) > len(shape):
+		raise ValueError(f"tile {tile} has more dimensions than shape {shape}")
+	tile = tile + (None,) * (len(shape) - len(tile))
+	tile = tuple(
+		size if t is None else min(int(t), size)
+		for t, size in zip(tile, shape)
+	)
+	if any(t < 1 for t in tile):
+		raise ValueError(f"tile sizes must be positive, not {tile}")
+	if all(t == size for t, size in zip(tile[1:], shape[1:])):
+		# tiles of whole rows are already row-major order
+		return None
+	return tile
+
+
+def _tile_blocks(shape, tile):
+	"""
+	Iterate over tiles in storage order.
+
+	Tiles are stored in row-major order of the grid of tiles, and the
+	cells in each tile are stored in row-major order.  Tiles at the
+	upper edge of each dimension are clipped to the matrix, not padded.
+
+	Yields
+	------
+	offset : int
+		The flat storage position of the first cell in the tile.
+	block : tuple[slice]
+		The region of the matrix covered by the tile.
+	"""
+	grid = [range(0, size, t) for size, t in zip(shape, tile)]
+	offset = 0
+	for corner in np.ndindex(*[len(g) for g in grid]):
+		block = tuple(
+			slice(g[c], min(g[c] + t, size))
+			for g, c, t, size in zip(grid, corner, tile, shape)
+		)
+		yield offset, block
+		offset += int(np.prod([b.stop - b.start for b in block]))
+
+
+def tile_sizes(shape, tile):
+	"""The number of cells in each tile, in storage order."""
+	return [
+		int(np.prod([b.stop - b.start for b in block]))
+		for _, block in _tile_blocks(shape, tile)
+	]
+
+
+def tile_array(arr, tile):
+	"""
+	Rearrange an N-d array from row-major order into tiled storage order.
+
+	Parameters
+	----------
+	arr : numpy.ndarray
+		The matrix, with its full shape.
+	tile : tuple
+		The normalized tile shape.
+
+	Returns
+	-------
+	numpy.ndarray
+		A flat array in tiled storage order.
+	"""
+	return np.concatenate([arr[block].reshape(-1) for _, block in _tile_blocks(arr.shape, tile)])
+
+
+def untile_array(flat, shape, tile):
+	"""
+	Rearrange a flat array from tiled storage order into an N-d array.
+
+	Parameters
+	----------
+	flat : numpy.ndarray
+		The data in tiled storage order.
+	shape : tuple
+		The shape of the matrix.
+	tile : tuple
+		The normalized tile shape.
+
+	Returns
+	-------
+	numpy.ndarray
+	"""
+	result = np.empty(shape, dtype=flat.dtype)
+	for offset, block in _tile_blocks(shape, tile):
+		block_shape = tuple(b.stop - b.start for b in block)
+		result[block] = flat[offset:offset + int(np.prod(block_shape))].reshape(block_shape)
+	return result
+
+
+def tiled_positions(indexes, shape, tile):
+	"""
+	Convert positions on each dimension to flat tiled storage positions.
+
+	Parameters
+	----------
+	indexes : Sequence[array-like of int]
+		The positions on each dimension, which broadcast together.
+	shape : tuple
+		The shape of the matrix.
+	tile : tuple
+		The normalized tile shape.
+
+	Returns
+	-------
+	numpy.ndarray
+	"""
+	indexes = [np.asarray(index, dtype=np.int64) for index in indexes]
+	tile_pos = [index // t for index, t in zip(indexes, tile)]
+	# the size of the (possibly clipped) tile holding each position, on each dimension
+	extents = [np.minimum(t, size - p * t) for p, t, size in zip(tile_pos, tile, shape)]
+	ndims = len(shape)
+	result = 0
+	# cells in all earlier tiles: on each dimension, the tiles before this one,
+	# within the extent of this tile on earlier dimensions
+	before = 1
+	for d in range(ndims):
+		result = result + tile_pos[d] * tile[d] * before * int(np.prod(shape[d+1:]))
+		before = before * extents[d]
+	# position within this tile
+	inner = 1
+	for d in reversed(range(ndims)):
+		result = result + (indexes[d] - tile_pos[d] * tile[d]) * inner
+		inner = inner * extents[d]
+	return result
+
+
+def _map_columns(table, func, metadata):
+	"""Apply a function to the numpy values of every column of a table."""
+	return pa.Table.from_arrays(
+		[
+			pa.array(func(_column_to_numpy(column)), type=field.type)
+			for field, column in zip(table.schema, table.columns)
+		],
+		schema=table.schema.with_metadata(metadata),
+	)
+
+
+def retile_table(table, shape, tile):
+	"""
+	Rearrange a tall table into a tiled (or row-major) storage order.
+
+	Parameters
+	----------
+	table : pyarrow.Table
+		The data, in the storage order given by its 'TILE' metadata,
+		or row-major order if it has none.
+	shape : tuple
+		The shape of the matrix.
+	tile : int or tuple or None
+		The new tile shape (see `normalize_tile`), or None for
+		row-major order.
+
+	Returns
+	-------
+	pyarrow.Table
+		The data in the new storage order, with the tile shape
+		recorded in the 'TILE' metadata.
+	"""
+	shape = tuple(shape)
+	tile = normalize_tile(shape, tile)
+	current = table_tile(table)
+	if current == tile:
+		return table
+	metadata = {
+		k: v for k, v in (table.schema.metadata or {}).items()
+		if k != b'TILE'
+	}
+	if tile is not None:
+		metadata[b'TILE'] = str(tile).encode()
+
+	def rearrange(values):
+		if current is None:
+			arr = values.reshape(shape)
+		else:
+			arr = untile_array(values, shape, current)
+		if tile is None:
+			return arr.reshape(-1)
+		return tile_array(arr, tile)
+
+	return _map_columns(table, rearrange, metadata)
+
+
+def add_statistics(table, shape, filename=None):
+	"""
+	Compute statistics of each matrix in a table, and store them with it.
+
+	Parameters
+	----------
+	table : pyarrow.Table
+		The data, in the storage order given by its 'TILE' metadata.
+	shape : tuple
+	filename : path-like, optional
+		The file the table is about to be written to, next to which
+		the statistics by position are written.
+
+	Returns
+	-------
+	pyarrow.Table
+		The table with statistics in the 'STATISTICS' metadata,
+		see `arrowmatrix.statistics`.
+	"""
+	shape = tuple(shape)
+	tile = table_tile(table)
+	accumulator = StatisticsAccumulator(table.column_names, shape)
+	for name, column in zip(table.column_names, table.columns):
+		values = _column_to_numpy(column)
+		if tile is not None:
+			values = untile_array(values, shape, tile)
+		accumulator.add(0, shape[0], {name: values})
+	metadata = statistics_metadata(table.schema.metadata, accumulator.to_table(), filename)
+	return table.replace_schema_metadata(metadata)
+
+
+def _fold_labels(fold):
+	"""Interpret a `fold` argument as the labels to fold, or None if disabled."""
+	if fold is None or fold is False:
+		return None
+	if fold is True:
+		return PERIODS
+	return tuple(fold)
+
+
+def _fold_slabs(slabs, spec, schema):
+	"""Fold each slab of origin rows read from a source."""
+	for start, stop, slab in slabs:
+		yield start, stop, fold_table(slab, spec, schema)
+
+
 def check_write_file(filename, overwrite=False):
 	assert isinstance(filename, (str, pathlib.Path))
 	if os.path.exists(filename) and not overwrite:
 		raise FileExistsError(filename)
+	if has_overlay(filename):
+		# updates of the file being overwritten must not apply to the new file
+		if not overwrite:
+			raise FileExistsError(overlay_path(filename))
+		import shutil
+		shutil.rmtree(overlay_path(filename))
+	if overwrite:
+		remove_statistics(filename)
 
 
 class AbstractArrowMatrix(ABC):
 
+	# Whether files of this class can be updated with `update`, and are
+	# opened with any updates written next to them.
+	_updatable = True
+
+	# The updates of the file, see `update`.
+	_overlay = None
+
 	@classmethod
 	def from_hdf5(
 			cls,
@@ -123,12 +724,200 @@ class AbstractArrowMatrix(ABC):
 			*,
 			overwrite=False,
 			shape=None,
+			memory_budget=None,
+			progress=False,
+			processes=None,
+			downcast=None,
+			tile=None,
+			statistics=False,
+			fold=None,
+			**kwargs,
 	):
+		"""
+		Convert an HDF5 OMX file to an arrowmatrix file.
+
+		Parameters
+		----------
+		omx_file : path-like or omx.File or pd.DataFrame
+			The source data, as the path to an openmatrix file,
+			or an open file handle, or as pre-loaded tall-format
+			pandas DataFrame.
+		to_filename : path-like
+			The location to write the data file.
+		overwrite : bool, default False
+			Overwrite any existing file at `to_filename`.
+		shape : tuple, optional
+			Only needed if `omx_file` is a pre-loaded DataFrame.
+		memory_budget : int, optional
+			If given, the matrices are streamed from the source into
+			the output file in slabs of origin rows, with each slab
+			holding at most this many bytes of decoded data (but
+			always at least one origin row).  Otherwise, the whole
+			file is loaded into memory and written at once.
+		progress : bool, default False
+			When streaming, report time and memory usage after
+			each slab is written.  Requires `psutil`.
+		processes : int, optional
+			Read and decode the source matrices using a pool of this
+			many worker processes, while the output is written by
+			this process.  The source must be given as a path.  If
+			`memory_budget` is not also given, each worker reads
+			entire matrices.
+		downcast : bool or float, optional
+			Store each matrix using the narrowest data type that can
+			represent it, e.g. float32 or int16 instead of float64.
+			If True, only lossless casts are used.  If a number, casts
+			that change no value by more than this absolute tolerance
+			are used.  The original types are recorded in the
+			'DOWNCAST' metadata, see `get_matrix` and `get_rc`.
+		tile : int or tuple, optional
+			Store each matrix in tiles of this shape, instead of in
+			row-major order, so that reads of a subregion (e.g. a block
+			of destination columns) touch only the tiles that cover it.
+			An int gives the same tile size on every dimension.  The
+			tile shape is recorded in the 'TILE' metadata.  When
+			streaming, slabs hold a whole number of rows of tiles.
+		statistics : bool, default False
+			Compute the minimum, maximum, sum and count of nonzero
+			values of each matrix, overall and by position on each
+			dimension, see `aggregate`.  Statistics of whole matrices
+			are stored in the 'STATISTICS' metadata, and statistics by
+			position in a file next to the data, '<to_filename>.stats'
+			(see `arrowmatrix.statistics`).  When streaming, the source
+			is read twice, once to compute the statistics.
+		fold : bool or Sequence[str], optional
+			Fold families of matrices named like 'SOV_TIME__AM' into a
+			single matrix 'SOV_TIME' with an extra last dimension for
+			the period (see `arrowmatrix.fold`).  If True, the periods
+			'EA', 'AM', 'MD', 'PM' and 'EV' are folded, in that order,
+			otherwise the given suffixes.  Matrices not in any family
+			are repeated along the new dimension.
+		**kwargs
+			Other keyword arguments are passed to the writer.  For
+			`compression` and `compression_level`, a dict mapping
+			wildcard patterns of matrix names to values can be given
+			to choose different codecs for different matrices (see
+			`column_options`), where the file format supports it.
+
+		Returns
+		-------
+		AbstractArrowMatrix
+		"""
 		check_write_file(to_filename, overwrite=overwrite)
-		table = omx_hdf5_2_to_arrow(omx_file, shape=shape)
-		cls._write_arrow_table(to_filename, table, shape)
+		if processes and not isinstance(omx_file, (str, pathlib.Path)):
+			raise TypeError("must give the source as a path to use processes")
+		if (memory_budget is not None or processes) and not isinstance(omx_file, pd.DataFrame):
+			cls._stream_hdf5(
+				omx_file, to_filename, memory_budget,
+				progress=progress, processes=processes, downcast=downcast, tile=tile,
+				statistics=statistics, fold=fold, **kwargs,
+			)
+			return cls(to_filename)
+		if isinstance(omx_file, pd.DataFrame):
+			table = omx_hdf5_2_to_arrow(omx_file, shape=shape)
+		else:
+			omx_file, close_omx = _open_omx(omx_file)
+			try:
+				table = omx_hdf5_2_to_arrow(omx_file, shape=shape)
+				table = table.replace_schema_metadata(
+					lookup_metadata(table.schema.metadata, omx_hdf5_lookups(omx_file))
+				)
+			finally:
+				if close_omx:
+					omx_file.close()
+		labels = _fold_labels(fold)
+		if labels is not None:
+			table = fold_table(table, fold_spec(table.column_names, labels))
+		tolerance = _downcast_tolerance(downcast)
+		if tolerance is not None:
+			table = downcast_table(table, tolerance=tolerance)
+		if statistics:
+			table = add_statistics(table, table_shape(table), to_filename)
+		if tile is not None:
+			table = retile_table(table, table_shape(table), tile)
+		cls._write_arrow_table(to_filename, table, table_shape(table), **kwargs)
 		return cls(to_filename)
 
+	@classmethod
+	def _stream_hdf5(
+			cls, omx_file, to_filename, memory_budget,
+			progress=False, processes=None, downcast=None, tile=None, statistics=False,
+			fold=None, **kwargs,
+	):
+		source_filename = omx_file
+		omx_file, close_omx = _open_omx(omx_file)
+		try:
+			schema = omx_hdf5_2_schema(omx_file)
+			schema = schema.with_metadata(lookup_metadata(schema.metadata, omx_hdf5_lookups(omx_file)))
+			tolerance = _downcast_tolerance(downcast)
+			if tolerance is not None:
+				schema = downcast_omx_hdf5_2_schema(omx_file, schema, tolerance=tolerance)
+			if memory_budget is None:
+				slab_rows = table_shape(schema)[0]
+			else:
+				slab_rows = rows_per_slab(schema, memory_budget)
+			# the source is read with its own schema, and may be folded before writing
+			source_schema = schema
+			labels = _fold_labels(fold)
+			if labels is not None:
+				spec = fold_spec(source_schema.names, labels)
+				schema = fold_schema(source_schema, spec)
+
+			def read_slabs(parallel=False):
+				# unfolded slabs are read with the output schema, including its metadata
+				read_schema = schema if labels is None else source_schema
+				if parallel:
+					slabs = iter_omx_hdf5_2_slabs_parallel(source_filename, read_schema, slab_rows, processes)
+				else:
+					slabs = iter_omx_hdf5_2_slabs(omx_file, read_schema, slab_rows)
+				if labels is not None:
+					slabs = _fold_slabs(slabs, spec, schema)
+				return slabs
+
+			shape = table_shape(schema)
+			tile = normalize_tile(shape, tile)
+			if statistics:
+				accumulator = StatisticsAccumulator(schema.names, shape)
+				for start, stop, slab in read_slabs():
+					accumulator.add(start, stop, {
+						name: _column_to_numpy(column)
+						for name, column in zip(slab.column_names, slab.columns)
+					})
+					del slab
+				schema = schema.with_metadata(
+					statistics_metadata(schema.metadata, accumulator.to_table(), to_filename)
+				)
+			if tile is not None:
+				# each slab holds whole rows of tiles, so the tiled slabs
+				# are consecutive ranges of the tiled storage order
+				slab_rows = max(1, slab_rows // tile[0]) * tile[0]
+				schema = schema.with_metadata({**schema.metadata, b'TILE': str(tile).encode()})
+			slabs = read_slabs(parallel=bool(processes))
+			if progress:
+				from .util import MemoryUsage
+				usage = MemoryUsage()
+				start_time = time.time()
+			writer = cls._open_writer(to_filename, schema, shape, slab_rows=slab_rows, **kwargs)
+			try:
+				for start, stop, slab in slabs:
+					if tile is not None:
+						slab_shape = (stop - start, *shape[1:])
+						slab = _map_columns(
+							slab,
+							lambda values: tile_array(values.reshape(slab_shape), tile),
+							schema.metadata,
+						)
+					writer.write(slab)
+					del slab
+					if progress:
+						print(f"rows {start}:{stop} of {shape[0]}, ", end="")
+						usage.check(time_checkpoint=start_time)
+			finally:
+				writer.close()
+		finally:
+			if close_omx:
+				omx_file.close()
+
 	@classmethod
 	def from_dataframe(
 			cls,
@@ -137,19 +926,78 @@ class AbstractArrowMatrix(ABC):
 			*,
 			overwrite=False,
 			shape=None,
+			downcast=None,
+			tile=None,
+			statistics=False,
 	):
 		check_write_file(to_filename, overwrite=overwrite)
 		if shape is None:
 			if isinstance(dataframe.index, pd.MultiIndex):
 				shape = [i.size for i in dataframe.index.levels]
 		table = omx_hdf5_1_to_arrow(dataframe, shape=shape)
-		cls._write_arrow_table(to_filename, table, shape)
+		tolerance = _downcast_tolerance(downcast)
+		if tolerance is not None:
+			table = downcast_table(table, tolerance=tolerance)
+		if statistics:
+			table = add_statistics(table, table_shape(table), to_filename)
+		if tile is not None:
+			table = retile_table(table, table_shape(table), tile)
+		cls._write_arrow_table(to_filename, table, table_shape(table))
 		return cls(to_filename)
 
 	@classmethod
-	def from_arrow(cls, source, to_filename, names=None, overwrite=False, **kwargs):
+	def from_arrow(
+			cls, source, to_filename, names=None, overwrite=False,
+			max_workers=None, downcast=None, tile=None, statistics=False, **kwargs,
+	):
+		"""
+		Copy matrices from another arrowmatrix into a new file.
+
+		Parameters
+		----------
+		source : AbstractArrowMatrix
+			The matrices to copy.
+		to_filename : path-like
+			The location to write the data file.
+		names : Collection[str], optional
+			The matrices to copy.  Defaults to all matrices.
+		overwrite : bool, default False
+			Overwrite any existing file at `to_filename`.
+		max_workers : int, optional
+			Read groups of columns from the source in parallel
+			using a pool of this many threads.
+		downcast : bool or float, optional
+			Store each matrix using the narrowest acceptable data
+			type, see `from_hdf5`.
+		tile : int or tuple, optional
+			Store each matrix in tiles of this shape, see `from_hdf5`.
+			If not given, the new file is stored in row-major order,
+			even if the source is tiled.
+		statistics : bool, default False
+			Compute and store statistics of each matrix, see `from_hdf5`.
+			Otherwise, any statistics stored with the source are
+			dropped.
+		**kwargs
+			Other keyword arguments are passed to the writer.
+
+		Returns
+		-------
+		AbstractArrowMatrix
+		"""
 		check_write_file(to_filename, overwrite=overwrite)
-		table = source._get_arrow_table(names=names)
+		table = source._get_arrow_table_parallel(names=names, max_workers=max_workers)
+		tolerance = _downcast_tolerance(downcast)
+		if tolerance is not None:
+			table = downcast_table(table, tolerance=tolerance)
+		if statistics:
+			table = add_statistics(table, source.shape, to_filename)
+		elif b'STATISTICS' in (table.schema.metadata or {}):
+			# the source statistics may cover other matrices, or other values if downcast
+			table = table.replace_schema_metadata({
+				k: v for k, v in table.schema.metadata.items()
+				if k not in (b'STATISTICS', b'AXIS_STATISTICS')
+			})
+		table = retile_table(table, source.shape, tile)
 		cls._write_arrow_table(to_filename, table, source.shape, **kwargs)
 		return cls(to_filename)
 
@@ -174,12 +1022,25 @@ class AbstractArrowMatrix(ABC):
 			filename,
 			omx_version=None,
 			shape=None,
+			cache_bytes=None,
 	):
 		self.filename = filename
 		self._omx_version = omx_version
 		if isinstance(shape, int):
 			shape = (shape,)
+		elif shape is not None:
+			shape = tuple(shape)
 		self._shape = shape
+		self._cache = ColumnCache(cache_bytes) if cache_bytes else None
+		self._prefetched = {}
+		self._prefetch_lock = threading.Lock()
+		self._executor = None
+		self._tile = table_tile(self.schema)
+		self._lookup_indexes = {}
+		self._instrumentation = None
+		# files updated with `update` are read with their updates
+		if self._updatable and has_overlay(filename):
+			self._overlay = Overlay(filename, self._storage_schema)
 
 	@property
 	def shape(self):
@@ -195,6 +1056,247 @@ class AbstractArrowMatrix(ABC):
 	def omx_version(self):
 		return self._omx_version
 
+	@property
+	def tile(self):
+		"""tuple or None : The shape of the storage tiles, or None for row-major order."""
+		return self._tile
+
+	@property
+	def cache(self):
+		"""ColumnCache or None : The decoded column cache, if enabled."""
+		return self._cache
+
+	@property
+	def overlay(self):
+		"""ArrowMatrixDataset or None : The updates of this file, see `update`."""
+		return None if self._overlay is None else self._overlay.dataset
+
+	@property
+	def instrumentation(self):
+		"""callable or None : The instrumentation callback, if enabled (see `instrument`)."""
+		return self._instrumentation
+
+	def instrument(self, callback=True):
+		"""
+		Enable or disable instrumentation of reads.
+
+		When enabled, each call of `get_rc`, `get_rc_table`,
+		`get_rc_array`, `get_matrix` or indexing reports an event to
+		the callback, with the time spent reading, taking and
+		converting data, the bytes read, and the numbers of columns
+		and takers.  See `arrowmatrix.instrument` for details.
+
+		Parameters
+		----------
+		callback : callable or bool, default True
+			Called with a dict for each event.  If True, a new
+			`ReadStats` is used to aggregate events.  If False or
+			None, instrumentation is disabled.
+
+		Returns
+		-------
+		callable or None
+			The callback, e.g. the `ReadStats`.
+		"""
+		if callback is True:
+			callback = ReadStats()
+		elif callback is False:
+			callback = None
+		self._instrumentation = callback
+		return callback
+
+	@property
+	def downcasts(self):
+		"""dict : The original types of matrices stored with narrower types."""
+		metadata = self.schema.metadata or {}
+		return {
+			name: pa.type_for_alias(original)
+			for name, original in json.loads(metadata.get(b'DOWNCAST', b'{}')).items()
+		}
+
+	@functools.cached_property
+	def lookups(self):
+		"""
+		dict : The 1-d lookups stored with the file, by name.
+
+		These are the zone ID lookups, and for folded files (see
+		`folded`) also the labels of the folded dimension.
+		"""
+		lookups = read_lookups(self.schema.metadata)
+		folded = self.folded
+		if folded is not None:
+			lookups.setdefault(folded['axis_name'], np.asarray(folded['labels']))
+		return lookups
+
+	@functools.cached_property
+	def folded(self):
+		"""
+		dict or None : How matrices were folded into an extra last dimension.
+
+		See `arrowmatrix.fold.fold_spec`.  None if the file is not folded.
+		"""
+		metadata = self.schema.metadata or {}
+		if b'FOLDED' not in metadata:
+			return None
+		return json.loads(metadata[b'FOLDED'])
+
+	def lookup_index(self, name):
+		"""
+		Get the index for translating the labels of a lookup to positions.
+
+		The index is built on first use and cached.
+
+		Parameters
+		----------
+		name : str
+			The name of the lookup.
+
+		Returns
+		-------
+		LookupIndex
+		"""
+		index = self._lookup_indexes.get(name)
+		if index is None:
+			try:
+				labels = self.lookups[name]
+			except KeyError:
+				raise KeyError(f"no lookup named {name!r}, lookups are {list(self.lookups)}") from None
+			index = self._lookup_indexes[name] = LookupIndex(labels)
+		return index
+
+	def _lookup_positions(self, indexes, by):
+		"""Translate the labels on each dimension to positions."""
+		if isinstance(by, str):
+			by = [by] * len(indexes)
+		elif len(by) != len(indexes):
+			raise ValueError(f"by has {len(by)} lookups, expected one per dimension ({len(indexes)})")
+		result = []
+		for d, (index, name) in enumerate(zip(indexes, by)):
+			if name is not None:
+				lookup = self.lookup_index(name)
+				if len(lookup) != self.shape[d]:
+					raise ValueError(
+						f"lookup {name!r} has {len(lookup)} labels, but dimension {d} has size {self.shape[d]}"
+					)
+				index = lookup.positions(index)
+			result.append(index)
+		return result
+
+	@functools.cached_property
+	def statistics(self):
+		"""
+		dict or None : Statistics stored when the file was written.
+
+		Maps (matrix name, axis) to a dict of arrays of each statistic,
+		with axis None for the whole matrix.  See `aggregate`.
+		"""
+		return self._read_statistics(by_position=True)
+
+	@functools.cached_property
+	def _whole_statistics(self):
+		"""dict or None : The stored statistics of whole matrices only."""
+		return self._read_statistics(by_position=False)
+
+	def _read_statistics(self, by_position=True):
+		"""
+		Read the statistics stored when the file was written.
+
+		The statistics by position are in a separate file, which is
+		read only if `by_position` is true.
+		"""
+		stats = read_statistics(self.schema.metadata, self.filename if by_position else None)
+		if self._overlay is not None:
+			stats = self._overlay.read_statistics(stats, by_position)
+		return stats
+
+	def aggregate(self, name, stat, axis=None):
+		"""
+		Get a summary statistic of a matrix.
+
+		Statistics stored when the file was written (see the
+		`statistics` argument of `from_hdf5`) are used without reading
+		any matrix data.  Otherwise, the minimum and maximum of a whole
+		matrix are taken from storage statistics where the format has
+		them (i.e. Parquet row group statistics), and anything else is
+		computed by reading the matrix.
+
+		Parameters
+		----------
+		name : str
+			The name of the matrix.
+		stat : {'min', 'max', 'sum', 'count'}
+			The statistic, where 'count' is the number of nonzero
+			values.  Missing (NaN) values are ignored.
+		axis : int, optional
+			Summarize each position on this dimension, over all the
+			other dimensions, e.g. with axis 0 the row sums or the
+			maximum travel time from each origin.  If not given,
+			summarize the whole matrix.
+
+		Returns
+		-------
+		scalar or numpy.ndarray
+			A scalar for the whole matrix, or a 1-d array with one
+			value for each position on `axis`.
+		"""
+		if stat not in STATISTICS:
+			raise ValueError(f"stat must be one of {STATISTICS}, not {stat!r}")
+		if name not in self.list_matrices():
+			raise KeyError(name)
+		if axis is not None:
+			if axis < 0:
+				axis += self.ndims
+			if not 0 <= axis < self.ndims:
+				raise ValueError(f"axis {axis} is out of bounds for {self.ndims} dimensions")
+		stored = self._whole_statistics if axis is None else self.statistics
+		if stored is not None and (name, axis) in stored:
+			values = stored[name, axis][stat]
+			return values[0] if axis is None else values
+		if axis is None and stat in ('min', 'max') and not self._routes_to_overlay([name]):
+			min_max = self._storage_min_max(name)
+			if min_max is not None:
+				return min_max[0] if stat == 'min' else min_max[1]
+		accumulator = StatisticsAccumulator([name], self.shape)
+		accumulator.add(0, self.shape[0], {name: self.get_matrix(name)})
+		values = accumulator.get(name, axis)[stat]
+		return values[0] if axis is None else values
+
+	def _storage_min_max(self, name):
+		"""
+		Get the minimum and maximum of a matrix from storage statistics.
+
+		Subclasses for formats that keep statistics of stored data
+		override this.
+
+		Returns
+		-------
+		tuple or None
+			The minimum and maximum, or None if not available.
+		"""
+		return None
+
+	@property
+	def schema(self):
+		"""pyarrow.Schema : The schema of the file, including metadata, with any updates."""
+		if self._overlay is not None:
+			return self._overlay.schema
+		return self._storage_schema
+
+	@property
+	@abstractmethod
+	def _storage_schema(self):
+		"""pyarrow.Schema : The schema of the data stored in the file, including metadata."""
+
+	def _routes_to_overlay(self, names):
+		"""
+		Whether any of these columns are read from the updates of the file.
+
+		The methods of this class route reads of updated columns to the
+		overlay, so subclasses that read stored data directly should
+		leave such reads to them.
+		"""
+		return self._overlay is not None and any(name in self._overlay.updated for name in names)
+
 	def _get_rc_preprocess(self, indexes, attach_index=('i','j')):
 		index_names = []
 		for index, letter in zip(indexes, 'ijklmnopqrstuvwxyz'):
@@ -203,29 +1305,173 @@ class AbstractArrowMatrix(ABC):
 			np.asarray(index).reshape(-1)
 			for index in indexes
 		]
-		if attach_index:
-			idx = pd.MultiIndex.from_arrays(
-				indexes,
-				names=index_names,
-			)
-		else:
-			idx = None
-		return indexes, idx
+		if attach_index:
+			idx = pd.MultiIndex.from_arrays(
+				indexes,
+				names=index_names,
+			)
+		else:
+			idx = None
+		return indexes, idx
+
+	@abstractmethod
+	def _read_arrow_table(self, names=None):
+		"""
+		Read a pyarrow.Table for named columns from the source.
+
+		Parameters
+		----------
+		names : Collection[str], optional
+			Column names to load.  If not given, load all columns.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+
+	def _get_arrow_table(self, names=None):
+		"""
+		Get a pyarrow.Table for named columns.
+
+		Updated columns are read from the overlay (see `update`).
+		Columns requested earlier with `prefetch` are served from
+		the background read.  If the column cache is enabled, cached
+		columns are served from the cache.  All the remaining columns
+		are read from the source in a single read.
+
+		Parameters
+		----------
+		names : Collection[str], optional
+			Column names to load.  If not given, load all columns.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+		if self._overlay is not None:
+			if names is None:
+				names = self.list_matrices()
+			updated, stored = self._overlay.split(names)
+			if updated:
+				tables = [self._overlay.dataset._get_arrow_table(updated)]
+				if stored:
+					tables.append(self._get_arrow_table(stored))
+				return self._overlay.combine(names, *tables)
+		if self._cache is None and not self._prefetched:
+			return timed('read', self._read_arrow_table, names=names)
+		if names is None:
+			names = self.list_matrices()
+		columns = {}
+		missing = []
+		for name in names:
+			column = self._pop_prefetched(name)
+			if column is not None:
+				if self._cache is not None:
+					self._cache.put(name, column)
+			elif self._cache is not None:
+				column = self._cache.get(name)
+			if column is None:
+				missing.append(name)
+			else:
+				columns[name] = column
+		if missing and self._cache is None:
+			table = timed('read', self._read_arrow_table, names=missing)
+			columns.update(zip(table.column_names, table.columns))
+		elif missing:
+			table = timed('read', self._read_arrow_table, names=missing)
+			for name, column in zip(table.column_names, table.columns):
+				self._cache.put(name, column)
+				columns[name] = column
+		return pa.Table.from_arrays(
+			[columns[name] for name in names],
+			names=list(names),
+			metadata=self.schema.metadata,
+		)
+
+	def _reads_whole_columns(self, names):
+		"""
+		Whether reads of these columns should load whole columns.
+
+		This is true when whole columns are already available (or
+		wanted) in memory, from the column cache or from `prefetch`,
+		so subclasses should not read only parts of the columns.
+		"""
+		return self._cache is not None or any(name in self._prefetched for name in names)
+
+	def _pop_prefetched(self, name):
+		with self._prefetch_lock:
+			future = self._prefetched.pop(name, None)
+		if future is None:
+			return None
+		return future.result().column(name)
+
+	def prefetch(self, names):
+		"""
+		Start reading named columns in a background thread.
+
+		A later read of these columns (e.g. through `get_rc` or
+		`get_matrix`) uses the prefetched data, so disk reads and
+		decompression of upcoming matrices can overlap with other
+		work.  Each prefetched column is used once; if the column
+		cache is enabled, it is added to the cache when used.
+
+		Parameters
+		----------
+		names : str or Collection[str]
+			The names of the matrix tables to read.
+		"""
+		if isinstance(names, str):
+			names = [names]
+		# columns with zero-copy numpy views are never read through arrow
+		# tables, and updated columns are read from the overlay
+		names = [
+			name for name in names
+			if self._column_array(name) is None and not self._routes_to_overlay([name])
+		]
+		with self._prefetch_lock:
+			names = [
+				name for name in names
+				if name not in self._prefetched
+				and (self._cache is None or name not in self._cache)
+			]
+			if not names:
+				return
+			if self._executor is None:
+				self._executor = ThreadPoolExecutor(
+					max_workers=1, thread_name_prefix='arrowmatrix-prefetch',
+				)
+			future = self._executor.submit(self._read_arrow_table, names=names)
+			for name in names:
+				self._prefetched[name] = future
 
-	@abstractmethod
-	def _get_arrow_table(self, names=None):
+	async def aget_rc(self, names, *indexes, executor=None, **kwargs):
 		"""
-		Get a pyarrow.Table for named columns.
+		Extract values by index, without blocking the event loop.
+
+		The read runs in an executor, so other coroutines can run
+		while the data is read and decoded.  This is the asyncio
+		version of `get_rc`, and accepts the same arguments.
 
 		Parameters
 		----------
-		names : Collection[str], optional
-			Column names to load.  If not given, load all columns.
+		names : str or Collection[str]
+			The names of one or more matrix tables to load.
+		*indexes : array-like or int
+			The various index positions to load.
+		executor : concurrent.futures.Executor, optional
+			The executor to run the read in.  Defaults to the
+			event loop's default executor.
+		**kwargs
+			Other keyword arguments are passed to `get_rc`.
 
 		Returns
 		-------
-		pyarrow.Table
+		pandas.DataFrame or pandas.Series
 		"""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(
+			executor, functools.partial(self.get_rc, names, *indexes, **kwargs),
+		)
 
 	@staticmethod
 	@abstractmethod
@@ -245,7 +1491,35 @@ class AbstractArrowMatrix(ABC):
 			to optimize the data structure on write.
 		"""
 
-	def get_matrix(self, name):
+	@staticmethod
+	@abstractmethod
+	def _open_writer(filename, schema, shape, slab_rows=None, **kwargs):
+		"""
+		Open a writer to build a file incrementally.
+
+		Parameters
+		----------
+		filename : path-like
+			The location to write the data file.
+		schema : pyarrow.Schema
+			The schema of the data, including any required metadata.
+		shape : tuple
+			The shape of the data being written.
+		slab_rows : int, optional
+			The most origin rows in each table written.  Writers that
+			buffer what is written should not buffer more than this,
+			so streaming stays within its memory budget.
+
+		Returns
+		-------
+		writer
+			An object with a `write(table)` method, accepting
+			consecutive row slices of the full table, and a
+			`close()` method to finish the file.
+		"""
+
+	@instrumented('get_matrix')
+	def get_matrix(self, name, upcast=False):
 		"""
 		Load a matrix into memory.
 
@@ -257,21 +1531,143 @@ class AbstractArrowMatrix(ABC):
 		----------
 		name : str
 			The name of the matrix to load.
+		upcast : bool, default False
+			If the matrix was stored with a narrower data type
+			than it originally had, cast it back to the original.
 
 		Returns
 		-------
 		numpy.ndarray
 		"""
-		t = self._get_arrow_table(names=[name])
-		return t.to_pandas().to_numpy().reshape(self.shape)
+		count(columns=1)
+		arr = self._column_array(name)
+		if arr is None:
+			t = self._get_arrow_table(names=[name])
+			arr = timed('convert', t.to_pandas).to_numpy().reshape(-1)
+		if self._tile is not None:
+			result = untile_array(arr, self.shape, self._tile)
+		else:
+			result = arr.reshape(self.shape)
+		if upcast and name in self.downcasts:
+			result = result.astype(self.downcasts[name].to_pandas_dtype())
+		return result
+
+
+	def _column_array(self, name):
+		"""
+		Get a flat numpy view of a column, if one is available without copying.
+
+		Subclasses that can expose column data directly as a
+		numpy array (e.g. a memory-mapped, uncompressed, single
+		chunk column) override this to enable numpy fast paths.
+
+		Parameters
+		----------
+		name : str
+
+		Returns
+		-------
+		numpy.ndarray or None
+			A flat, read-only array in row-major order, or None
+			if no zero-copy view is available.
+		"""
+		if self._routes_to_overlay([name]):
+			return self._overlay.dataset._column_array(name)
+		return None
+
+	def _take(self, names, takers):
+		"""
+		Get a pyarrow.Table of named columns, at the given flat positions.
+
+		Subclasses can override this to avoid loading rows that
+		are not needed.
+
+		Parameters
+		----------
+		names : Collection[str]
+			Column names to load.
+		takers : array-like of int
+			Flat (row-major) positions to take.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+		if len(takers) == 0:
+			return self.schema.empty_table().select(list(names))
+		if self._routes_to_overlay(names):
+			updated, stored = self._overlay.split(names)
+			tables = [self._overlay.dataset._take(updated, takers)]
+			if stored:
+				tables.append(self._take(stored, takers))
+			return self._overlay.combine(names, *tables)
+		table = self._get_arrow_table(names=names)
+		return timed('take', table.take, takers)
+
+	def _get_arrow_table_parallel(self, names=None, takers=None, max_workers=None):
+		"""
+		Get a pyarrow.Table for named columns, using a thread pool.
+
+		The names are split into up to `max_workers` contiguous groups,
+		each group is read (and taken from, if `takers` is given) in its
+		own thread, and the resulting columns are assembled in order.
+
+		Parameters
+		----------
+		names : Collection[str], optional
+			Column names to load.  If not given, load all columns.
+		takers : array-like of int, optional
+			Flat (row-major) positions to take.
+		max_workers : int, optional
+			The number of threads to use.  If not given or less than
+			2, everything is read in the calling thread.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+		call = current_call()
 
+		def read(group):
+			if takers is None:
+				return self._get_arrow_table(names=group)
+			return self._take(group, takers)
 
-	def _get_rc_by_takers(self, names, takers, method=4, dtype='float64'):
+		def read_in_worker(group):
+			# count the stages of worker threads in the calling thread's call
+			call.attach()
+			try:
+				return read(group)
+			finally:
+				call.detach()
+
+		if not max_workers or max_workers < 2:
+			return read(names)
+		if names is None:
+			names = self.list_matrices()
+		names = list(names)
+		n_groups = min(max_workers, len(names))
+		if n_groups < 2:
+			return read(names)
+		bounds = np.linspace(0, len(names), n_groups + 1).astype(int)
+		groups = [names[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+		with ThreadPoolExecutor(max_workers=n_groups) as pool:
+			tables = list(pool.map(read if call is None else read_in_worker, groups))
+		return pa.Table.from_arrays(
+			[column for table in tables for column in table.columns],
+			names=names,
+			metadata=self.schema.metadata,
+		)
+
+	def _get_rc_by_takers(self, names, takers, method=4, dtype='float64', max_workers=None):
 		if isinstance(names, str):
 			# extracting a single column is faster than multiple columns
 			# as we avoid the overhead of interpreting how the different
 			# columns should be joined together in a dataframe.
-			return self._get_arrow_table(names=[names]).take(takers).column(0).to_pandas()
+			arr = self._column_array(names)
+			if arr is not None:
+				return pd.Series(timed('take', operator.getitem, arr, takers), name=names)
+			return timed('convert', self._take([names], takers).column(0).to_pandas)
 		else:
 			# Marginally slower for small data loads
 
@@ -299,30 +1695,68 @@ class AbstractArrowMatrix(ABC):
 					columns=names,
 				)
 			elif method==4:
-				result = self._get_arrow_table(names=names).take(takers).to_pandas()
+				arrays = [self._column_array(name) for name in names]
+				if all(arr is not None for arr in arrays):
+					result = pd.DataFrame({
+						name: timed('take', operator.getitem, arr, takers)
+						for name, arr in zip(names, arrays)
+					})
+				else:
+					result = timed('convert', self._get_arrow_table_parallel(
+						names, takers=takers, max_workers=max_workers,
+					).to_pandas)
 			else:
 				raise ValueError(f"undefined method {method}")
 
 			return result
 
-	def _takers(self, *indexes, attach_index=False):
+	def _takers(self, *indexes, attach_index=False, by=None):
 		if len(indexes) != self.ndims:
 			raise ValueError(f'number of indexes ({len(indexes)}) does not match ndims ({self.ndims})')
 		indexes, idx = self._get_rc_preprocess(indexes, attach_index)
-		n = 1
-		takers = indexes[0] * np.prod(self.shape[n:])
-		for index in indexes[1:]:
-			n += 1
-			if n >= self.ndims:
-				takers += index
-			else:
-				takers += index * np.prod(self.shape[n:])
-		return takers, idx
+		if by is not None:
+			indexes = self._lookup_positions(indexes, by)
+		return self._flat_positions(indexes), idx
+
+	def _flat_positions(self, indexes):
+		"""
+		Convert positions on each dimension to flat storage positions.
+
+		Parameters
+		----------
+		indexes : Sequence[array-like of int]
+			The positions on each dimension, which broadcast together.
+
+		Returns
+		-------
+		numpy.ndarray
+		"""
+		if self._tile is not None:
+			return tiled_positions(indexes, self.shape, self._tile)
+		return sum(
+			np.asarray(index) * np.int64(stride)
+			for index, stride in zip(indexes, _row_major_strides(self.shape))
+		)
 
 	def get_raw(self, names=None):
 		return self._get_arrow_table(names=names).to_pandas()
 
-	def get_rc_table(self, names, *indexes):
+	def _upcast(self, result):
+		"""Cast downcast columns of a pandas result back to their original types."""
+		downcasts = self.downcasts
+		if isinstance(result, pd.Series):
+			if result.name in downcasts:
+				result = result.astype(downcasts[result.name].to_pandas_dtype())
+			return result
+		dtypes = {
+			name: downcasts[name].to_pandas_dtype()
+			for name in result.columns
+			if name in downcasts
+		}
+		return result.astype(dtypes) if dtypes else result
+
+	@instrumented('get_rc_table')
+	def get_rc_table(self, names, *indexes, max_workers=None, dedup=False, by=None):
 		"""
 		Extract values by index.
 
@@ -333,18 +1767,41 @@ class AbstractArrowMatrix(ABC):
 		*indexes : array-like or int
 			The various index positions to load.  The number
 			of tuple values must match the number of dimensions.
+		max_workers : int, optional
+			Read and take from groups of columns in parallel
+			using a pool of this many threads.
+		dedup : bool, default False
+			Gather each distinct cell only once, in storage order,
+			and then scatter the values back to the requested order.
+			This is faster when many positions are repeated or the
+			positions are scattered across a large file.
+		by : str or Sequence[str], optional
+			Interpret the indexes as labels of this lookup (e.g. zone
+			IDs, see `lookups`) instead of as zero-based positions.  A
+			sequence gives one lookup per dimension, with None for
+			dimensions indexed by position.
 
 		Returns
 		-------
 		pyarrow.Table
 		"""
-		takers, _ = self._takers(*indexes, attach_index=False)
+		takers, _ = self._takers(*indexes, attach_index=False, by=by)
+		if dedup:
+			takers, inverse = np.unique(takers, return_inverse=True)
+		count(columns=1 if isinstance(names, str) else len(names), takers=np.size(takers))
 		if isinstance(names, str):
-			return self._get_arrow_table(names=[names]).take(takers)
+			result = self._take([names], takers)
 		else:
-			return self._get_arrow_table(names=names).take(takers)
+			result = self._get_arrow_table_parallel(names, takers=takers, max_workers=max_workers)
+		if dedup:
+			result = result.take(inverse)
+		return result
 
-	def get_rc(self, names, *indexes, method=4, attach_index=True, dtype='float64'):
+	@instrumented('get_rc')
+	def get_rc(
+			self, names, *indexes, method=4, attach_index=True, dtype='float64',
+			max_workers=None, upcast=False, dedup=False, by=None,
+	):
 		"""
 		Extract values by index.
 
@@ -361,72 +1818,658 @@ class AbstractArrowMatrix(ABC):
 			of length equal to the number of dimensions of
 			the matrix to use these values as the names of
 			the levels of the reulting MultiIndex.
+		max_workers : int, optional
+			When loading multiple matrix tables, read and take
+			from groups of columns in parallel using a pool of
+			this many threads.
+		upcast : bool, default False
+			For matrices stored with a narrower data type than they
+			originally had, cast the values back to the original.
+		dedup : bool, default False
+			Gather each distinct cell only once, in storage order,
+			and then scatter the values back to the requested order.
+			This is faster when many positions are repeated or the
+			positions are scattered across a large file.
+		by : str or Sequence[str], optional
+			Interpret the indexes as labels of this lookup (e.g. zone
+			IDs, see `lookups`) instead of as zero-based positions.  A
+			sequence gives one lookup per dimension, with None for
+			dimensions indexed by position.
 
 		Returns
 		-------
 		pandas.DataFrame
+			With the given indexes (labels, if `by` is given) as
+			the index, if `attach_index` is set.
 		"""
-		takers, idx = self._takers(*indexes, attach_index=attach_index)
-		result = self._get_rc_by_takers(names, takers, method=method, dtype=dtype)
+		takers, idx = self._takers(*indexes, attach_index=attach_index, by=by)
+		if dedup:
+			takers, inverse = np.unique(takers, return_inverse=True)
+		count(columns=1 if isinstance(names, str) else len(names), takers=np.size(takers))
+		result = self._get_rc_by_takers(
+			names, takers, method=method, dtype=dtype, max_workers=max_workers,
+		)
+		if dedup:
+			result = result.take(inverse)
+		if upcast:
+			result = self._upcast(result)
 		if idx is None:
 			result.reset_index(inplace=True, drop=True)
 		else:
 			result.index = idx
 		return result
 
-	@abstractmethod
+	def get_rc_period(self, names, *indexes, period, by=None, **kwargs):
+		"""
+		Extract values by index, with a period for each record, from a folded file.
+
+		For files written with `fold` (see `from_hdf5`), each record
+		is read from its own period in a single vectorized gather,
+		e.g. for a trip table with mixed departure periods.
+
+		Parameters
+		----------
+		names : str or Collection[str]
+			The names of one or more folded matrices, e.g. 'SOV_TIME'.
+		*indexes : array-like or int
+			The index positions (or labels, if `by` is given) on
+			every dimension except the folded one.
+		period : array-like
+			The period of each record, as labels of the folded
+			dimension (e.g. 'AM'), or as positions if integers.
+		by : str or Sequence[str], optional
+			Interpret the other indexes as labels of this lookup,
+			as for `get_rc`.
+		**kwargs
+			Other keyword arguments are passed to `get_rc`.
+
+		Returns
+		-------
+		pandas.DataFrame or pandas.Series
+		"""
+		folded = self.folded
+		if folded is None:
+			raise ValueError("get_rc_period requires a folded file, see from_hdf5(fold=...)")
+		period = np.asarray(period)
+		period_by = None if period.dtype.kind in 'iu' else folded['axis_name']
+		if by is None and period_by is None:
+			all_by = None
+		else:
+			if by is None or isinstance(by, str):
+				by = [by] * len(indexes)
+			all_by = [*by, period_by]
+		return self.get_rc(names, *indexes, period, by=all_by, **kwargs)
+
+	@instrumented('get_rc_array')
+	def get_rc_array(
+			self, names, *indexes, out=None, dtype='float64', max_workers=None, dedup=False,
+			by=None,
+	):
+		"""
+		Extract values by index into a 2-d numpy array.
+
+		Unlike `get_rc`, this does not construct any pandas objects,
+		and can fill a preallocated array supplied by the caller.
+
+		Parameters
+		----------
+		names : str or Collection[str]
+			The names of one or more matrix tables to load.
+		*indexes : array-like or int
+			The various index positions to load.  The number
+			of tuple values must match the number of dimensions.
+		out : numpy.ndarray, optional
+			An array of shape (n, k) to fill, where n is the number of
+			index positions and k is the number of names.  If not
+			given, a new array is allocated.
+		dtype : dtype, default 'float64'
+			The dtype of the array to allocate, if `out` is not given.
+		max_workers : int, optional
+			Read and take from groups of columns in parallel
+			using a pool of this many threads.
+		dedup : bool, default False
+			Gather each distinct cell only once, in storage order,
+			and then scatter the values back to the requested order.
+		by : str or Sequence[str], optional
+			Interpret the indexes as labels of this lookup (e.g. zone
+			IDs, see `lookups`) instead of as zero-based positions.  A
+			sequence gives one lookup per dimension, with None for
+			dimensions indexed by position.
+
+		Returns
+		-------
+		numpy.ndarray
+		"""
+		if isinstance(names, str):
+			names = [names]
+		takers, _ = self._takers(*indexes, attach_index=False, by=by)
+		inverse = None
+		if dedup:
+			takers, inverse = np.unique(takers, return_inverse=True)
+		n_rows = len(takers) if inverse is None else len(inverse)
+		count(columns=len(names), takers=len(takers))
+		if out is None:
+			out = np.empty((n_rows, len(names)), dtype=dtype)
+		elif out.shape != (n_rows, len(names)):
+			raise ValueError(
+				f"out has shape {out.shape}, expected {(n_rows, len(names))}"
+			)
+		arrays = [self._column_array(name) for name in names]
+		missing = [name for name, arr in zip(names, arrays) if arr is None]
+		if missing:
+			table = self._get_arrow_table_parallel(
+				missing, takers=takers, max_workers=max_workers,
+			)
+		for n, (name, arr) in enumerate(zip(names, arrays)):
+			if arr is None:
+				values = timed('convert', table.column(name).to_numpy)
+			else:
+				values = timed('take', operator.getitem, arr, takers)
+			out[:, n] = values if inverse is None else values[inverse]
+		return out
+
 	def list_matrices(self):
 		"""list : Get a list of matrices in this file."""
+		return self.schema.names
+
+	def update(self, matrices, **kwargs):
+		"""
+		Add or replace matrices, without rewriting the file.
+
+		The matrices are written to an overlay next to the file,
+		'<filename>.overlay', as uncompressed Feather files, so the
+		cost is proportional to the updated data, not to the file.
+		Updated matrices hide matrices of the same name in the file,
+		and new matrices are added after the others.  The updates are
+		seen by this object, and whenever the file is opened again.
+		Use `compact` to merge them into the file.
+
+		Parameters
+		----------
+		matrices : Mapping[str, array-like]
+			The new values of each matrix, with the shape of the file.
+		**kwargs
+			Other keyword arguments are passed to the Feather writer,
+			e.g. `compression`.
+		"""
+		from .overlay import update
+		update(self, matrices, **kwargs)
+
+	def compact(self, to_filename=None, **kwargs):
+		"""
+		Rewrite the file with the matrices added or replaced by `update`.
+
+		Parameters
+		----------
+		to_filename : path-like, optional
+			Write the compacted file here, leaving the file and its
+			updates as they are.  By default the file is replaced, and
+			its updates are removed.
+		**kwargs
+			Other keyword arguments are passed to `from_arrow`, e.g.
+			`compression`, as the original writer options are not
+			recorded in the file.  Statistics are stored if the file
+			has them, unless `statistics` is given.
+
+		Returns
+		-------
+		AbstractArrowMatrix
+			The compacted file.  When the file is replaced, this
+			object still reads the old file, and should be discarded.
+		"""
+		from .overlay import compact
+		return compact(self, to_filename, **kwargs)
+
+	def iter_rows(self, names, rows_per_chunk=None, read_ahead=0, upcast=False):
+		"""
+		Iterate over matrices in chunks of consecutive origin rows.
+
+		The stored data is read one stored chunk (e.g. Parquet row
+		group or Feather record batch) at a time, as the iteration
+		reaches it, so computations over all origins (e.g. logsums
+		over many skims) need memory for a few rows of each matrix,
+		rather than for whole matrices as with `get_matrix`.
+
+		Parameters
+		----------
+		names : str or Collection[str]
+			The names of the matrices to read.
+		rows_per_chunk : int, optional
+			The number of origin rows in each chunk; the last chunk
+			may be smaller.  Defaults to about `ROWS_CHUNK_CELLS`
+			cells of each matrix.  For tiled files, it is rounded up
+			to whole rows of tiles.
+		read_ahead : int, default 0
+			The number of stored chunks to read ahead in a background
+			thread, so reading and decompressing the next chunks can
+			overlap with processing the current one.
+		upcast : bool, default False
+			If matrices were stored with narrower data types than
+			they originally had, cast them back to the originals.
+
+		Yields
+		------
+		tuple[slice, dict[str, numpy.ndarray]]
+			The origin rows of the chunk, and the block of each
+			matrix for those rows, of shape (rows, *shape[1:]).
+			Blocks may be read-only views of the stored data.
+
+		Notes
+		-----
+		Compressed stored chunks are never split when read, so memory
+		use is bounded by the larger of `rows_per_chunk` and the stored
+		chunks.  Compressed Feather files are written in record batches
+		of about `feather.RECORD_BATCH_TARGET_CELLS` cells, but one
+		written as a single record batch (e.g. with `chunksize` set to
+		the number of cells) is read whole.  Uncompressed memory-mapped
+		Feather files are sliced without copying, whatever their record
+		batches.
+		"""
+		if isinstance(names, str):
+			names = [names]
+		names = list(names)
+		n_rows = self.shape[0]
+		row_cells = int(np.prod(self.shape[1:]))
+		band = self._tile[0] if self._tile is not None else 1
+		if rows_per_chunk is None:
+			rows_per_chunk = max(1, ROWS_CHUNK_CELLS // max(row_cells, 1))
+		if rows_per_chunk < 1:
+			raise ValueError(f"rows_per_chunk must be at least 1, not {rows_per_chunk}")
+		# tiled files store each row of tiles as a contiguous range
+		rows_per_chunk = -(-rows_per_chunk // band) * band
+		downcasts = self.downcasts if upcast else {}
+		pending = {name: [] for name in names}
+		row = 0
+		bounds = self._chunk_bounds(rows_per_chunk * row_cells)
+		for stop, arrays in self._iter_spans(names, bounds, read_ahead):
+			for name in names:
+				pending[name].append(arrays[name])
+			while row < n_rows and min(row + rows_per_chunk, n_rows) * row_cells <= stop:
+				row_stop = min(row + rows_per_chunk, n_rows)
+				block_shape = (row_stop - row, *self.shape[1:])
+				blocks = {}
+				for name in names:
+					flat = _pop_cells(pending[name], (row_stop - row) * row_cells)
+					if self._tile is not None:
+						block = untile_array(flat, block_shape, self._tile)
+					else:
+						block = flat.reshape(block_shape)
+					if name in downcasts:
+						block = block.astype(downcasts[name].to_pandas_dtype())
+					blocks[name] = block
+				yield slice(row, row_stop), blocks
+				row = row_stop
+
+	def _iter_spans(self, names, bounds, read_ahead=0):
+		"""
+		Get flat numpy arrays of named columns, for each range of flat positions in turn.
+
+		Yields the stop position of each range with its arrays.  With
+		`read_ahead`, up to that many of the following ranges are read
+		in a background thread while each range is processed.
+		"""
+		if not read_ahead:
+			for start, stop in bounds:
+				yield stop, self._span_arrays(names, start, stop)
+			return
+		pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='arrowmatrix-read-ahead')
+		try:
+			reads = collections.deque()
+			for start, stop in bounds:
+				reads.append((stop, pool.submit(self._span_arrays, names, start, stop)))
+				if len(reads) > read_ahead:
+					stop, future = reads.popleft()
+					yield stop, future.result()
+			while reads:
+				stop, future = reads.popleft()
+				yield stop, future.result()
+		finally:
+			# stopping the iteration early discards the reads ahead
+			pool.shutdown(wait=True, cancel_futures=True)
+
+	def expr(self, expression, chunk_cells=None, **constants):
+		"""
+		Define a lazy arithmetic expression over matrices.
+
+		Nothing is read until the expression is evaluated, with
+		`evaluate` for the full matrix or `get_rc` for particular
+		cells, and then the input matrices are read and combined one
+		chunk at a time, instead of each being loaded whole.
+
+		Parameters
+		----------
+		expression : str
+			The expression, using matrix names, constants, numbers,
+			operators and a few numpy functions, e.g.
+			"SOV_TIME__AM + 0.5 * SOV_DIST__AM".
+		chunk_cells : int, optional
+			The number of cells to read from each matrix at a time.
+		**constants
+			Values for names in the expression that are not matrices.
+
+		Returns
+		-------
+		MatrixExpression
+		"""
+		from .expr import MatrixExpression
+		return MatrixExpression(self, expression, chunk_cells=chunk_cells, **constants)
+
+	def _read_span(self, names, start, stop):
+		"""
+		Get a pyarrow.Table of named columns, for a contiguous range of flat positions.
+
+		Subclasses can override this to avoid loading rows that
+		are not needed.
+
+		Parameters
+		----------
+		names : Collection[str]
+			Column names to load.
+		start, stop : int
+			The range of flat (row-major) positions to load.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+		if self._routes_to_overlay(names):
+			updated, stored = self._overlay.split(names)
+			tables = [self._overlay.dataset._read_span(updated, start, stop)]
+			if stored:
+				tables.append(self._read_span(stored, start, stop))
+			return self._overlay.combine(names, *tables)
+		return self._get_arrow_table(names=names).slice(start, stop - start)
+
+	def _chunk_bounds(self, chunk_cells):
+		"""
+		Split the flat storage positions into contiguous chunks.
+
+		Subclasses can override this to align chunks to the units
+		in which data is stored (e.g. Parquet row groups).
+
+		Parameters
+		----------
+		chunk_cells : int
+			The approximate number of cells in each chunk.
+
+		Returns
+		-------
+		list[tuple[int, int]]
+			The start and stop positions of each chunk.
+		"""
+		size = int(np.prod(self.shape))
+		return [
+			(start, min(start + chunk_cells, size))
+			for start in range(0, size, chunk_cells)
+		]
+
+	def _span_arrays(self, names, start, stop):
+		"""
+		Get flat numpy arrays of named columns, for a contiguous range of flat positions.
+
+		Arrays are views without copying where possible.
+		"""
+		arrays = {}
+		missing = []
+		for name in names:
+			arr = self._column_array(name)
+			if arr is None:
+				missing.append(name)
+			else:
+				arrays[name] = arr[start:stop]
+		if missing:
+			table = self._read_span(missing, start, stop)
+			for name, column in zip(missing, table.columns):
+				arrays[name] = _column_to_numpy(column)
+		return arrays
 
+	@instrumented('getitem')
 	def __getitem__(self, item):
-		"""Experimental, 2 dim only"""
-		if isinstance(item, tuple):
-			dims = len(self.shape)
-			while len(item) < dims+1:
-				item = item + (slice(None),)
-		names = item[0]
+		"""
+		Select values from matrices by position.
+
+		The first element of `item` selects the matrices, as a name,
+		a list of names, or a slice of the list of matrices (e.g. `:`
+		for all matrices).  The remaining elements index the dimensions
+		of the matrices, as ints, slices, 1-d arrays of positions or
+		boolean masks, and Ellipsis.  Missing trailing dimensions select
+		everything.  Arrays index each dimension independently (like
+		`numpy.ix_`), and int indexes drop their dimension.
+
+		Selections are read as a single contiguous range of the stored
+		data where possible, which needs no `take`, and for contiguous
+		selections of uncompressed data returns read-only views without
+		copying.  For tiled files, the selected cells are taken, so
+		only the tiles covering the selection are read.
+
+		Returns
+		-------
+		numpy.ndarray or pandas.DataFrame
+			For a single matrix name, an array with one dimension for
+			each dimension not indexed by an int.  For multiple names,
+			a DataFrame with one column per matrix, indexed by the
+			positions on every dimension.
+		"""
+		if not isinstance(item, tuple):
+			item = (item,)
+		names, keys = item[0], item[1:]
 		if isinstance(names, (str, bytes)):
 			names = [names]
+		elif isinstance(names, slice):
+			names = list(self.list_matrices())[names]
+		else:
+			names = list(names)
 		add_multiindex = len(names) > 1
-		if isinstance(names, slice):
-			if names.start == None:
-				names = self.list_matrices()
-		slice1 = item[1]
-		if isinstance(slice1, int):
-			slice1 = slice(slice1, slice1+1)
-		slice2 = item[2]
-		if isinstance(slice2, int):
-			slice2 = slice(slice2, slice2+1)
-		takers, takers_shape = _take_array(slice1, slice2, self.shape)
-		result = self._get_rc_by_takers(names, takers)
+		keys = [
+			_normalize_key(key, size)
+			for key, size in zip(_expand_ellipsis(keys, self.ndims), self.shape)
+		]
+		result = self._get_selection(names, keys)
 		if add_multiindex:
-			idx1 = np.broadcast_to(_slice_to_range(slice1, self.shape[0]).reshape(-1,1), takers_shape).reshape(-1)
-			idx2 = np.broadcast_to(_slice_to_range(slice2, self.shape[1]), takers_shape).reshape(-1)
-			result.index = pd.MultiIndex.from_arrays([idx1,idx2])
-			return result
+			positions = [np.atleast_1d(np.asarray(key)) for key in keys]
+			grid = np.meshgrid(*positions, indexing='ij')
+			idx = pd.MultiIndex.from_arrays([g.reshape(-1) for g in grid])
+			return pd.DataFrame(
+				{name: result[name].reshape(-1) for name in names},
+				index=idx,
+			)
 		else:
-			return result.to_numpy().reshape(takers_shape)
-
-def _cap(a,b):
-	if a is None:
-		return b
-	if b is None:
-		return a
-	return min(a,b)
-
-def _slice_to_range(s, size):
-	if isinstance(s, slice):
-		return np.arange(s.start or 0, _cap(s.stop,size), s.step or 1)
-	return np.asarray(s)
-
-def _slice_size(s, size):
-	return (_cap(s.stop,size) - (s.start or 0)) / (s.step or 1)
-
-def _take_array(slice1, slice2, shape):
-	# stride = shape[1]
-	combined = np.add(
-		_slice_to_range(slice1, shape[0]).reshape(-1,1)*shape[1],
-		_slice_to_range(slice2, shape[1]),
-	)
-	return combined.reshape(-1), combined.shape
+			return result[names[0]]
+
+	def _get_selection(self, names, keys):
+		"""
+		Get numpy arrays selected by normalized per-dimension keys.
+
+		Parameters
+		----------
+		names : Collection[str]
+		keys : list
+			One normalized key per dimension, each an int, a range,
+			or an array of positions.
+
+		Returns
+		-------
+		dict
+			Maps names to arrays of the selected values.
+		"""
+		out_shape = tuple(len(key) for key in keys if not isinstance(key, int))
+		out_size = int(np.prod(out_shape))
+		count(columns=len(names), takers=out_size)
+		if out_size == 0:
+			return {
+				name: np.empty(out_shape, dtype=self.schema.field(name).type.to_pandas_dtype())
+				for name in names
+			}
+		strides = _row_major_strides(self.shape)
+		lo = [key if isinstance(key, int) else int(np.min(key)) for key in keys]
+		hi = [key if isinstance(key, int) else int(np.max(key)) for key in keys]
+		start = int(np.dot(lo, strides))
+		stop = int(np.dot(hi, strides)) + 1
+
+		if self._tile is not None:
+			# tiled storage has no contiguous span for a box of cells
+			spanned = []
+		elif stop - start <= SPAN_READ_FACTOR * out_size:
+			spanned = list(names)
+		else:
+			spanned = [name for name in names if self._column_array(name) is not None]
+		result = {}
+		if spanned:
+			box_shape = [h - l + 1 for l, h in zip(lo, hi)]
+			for name, flat in self._span_arrays(spanned, start, stop).items():
+				box = np.lib.stride_tricks.as_strided(
+					flat,
+					shape=box_shape,
+					strides=[st * flat.itemsize for st in strides],
+					writeable=False,
+				)
+				result[name] = timed('take', _outer_index, box, keys, lo)
+		taken = [name for name in names if name not in result]
+		if taken:
+			positions = np.ix_(*[np.atleast_1d(np.asarray(key)) for key in keys])
+			takers = self._flat_positions(positions).reshape(-1)
+			for name in taken:
+				arr = self._column_array(name)
+				if arr is not None:
+					result[name] = timed('take', operator.getitem, arr, takers).reshape(out_shape)
+			taken = [name for name in taken if name not in result]
+		if taken:
+			table = self._take(taken, takers)
+			for name, column in zip(taken, table.columns):
+				result[name] = timed('convert', column.to_numpy).reshape(out_shape)
+		return result
 
+
+# When a selection has no zero-copy numpy view available, a contiguous
+# range of stored data is read and indexed only if it is at most this many
+# times larger than the selection itself, otherwise the selection is taken.
+SPAN_READ_FACTOR = 16
+
+
+# The default number of cells of each matrix in the chunks of `iter_rows`.
+ROWS_CHUNK_CELLS = 1 << 20
+
+
+def _pop_cells(pieces, n):
+	"""Remove the first n cells from a list of flat arrays, and return them as one array."""
+	taken = []
+	while n > 0:
+		piece = pieces[0]
+		if len(piece) <= n:
+			taken.append(pieces.pop(0))
+			n -= len(piece)
+		else:
+			taken.append(piece[:n])
+			pieces[0] = piece[n:]
+			n = 0
+	return taken[0] if len(taken) == 1 else np.concatenate(taken)
+
+
+def _offset_chunk_bounds(offsets, chunk_cells):
+	"""
+	Split flat positions into chunks of whole storage units.
+
+	Consecutive units, which start at `offsets` (ending with the total
+	size), are combined until each chunk holds at least `chunk_cells`
+	cells, so no unit is read and decompressed more than once.
+	"""
+	bounds = []
+	start = 0
+	for stop in offsets[1:]:
+		if stop - start >= chunk_cells:
+			bounds.append((start, int(stop)))
+			start = int(stop)
+	if start < offsets[-1]:
+		bounds.append((start, int(offsets[-1])))
+	return bounds
+
+
+def _row_major_strides(shape):
+	"""The number of cells between consecutive positions on each dimension."""
+	return [int(np.prod(shape[d+1:])) for d in range(len(shape))]
+
+
+def _column_to_numpy(column):
+	"""Convert a pyarrow.ChunkedArray to numpy, without copying if possible."""
+	if column.num_chunks == 1 and column.null_count == 0:
+		try:
+			return column.chunk(0).to_numpy(zero_copy_only=True)
+		except pa.ArrowInvalid:
+			pass
+	return column.to_numpy()
+
+
+def _expand_ellipsis(keys, ndims):
+	"""Replace any Ellipsis in index keys, and fill missing trailing dimensions."""
+	keys = list(keys)
+	n_ellipsis = sum(key is Ellipsis for key in keys)
+	if n_ellipsis > 1:
+		raise IndexError("an index can only have a single ellipsis ('...')")
+	if n_ellipsis:
+		i = [key is Ellipsis for key in keys].index(True)
+		keys[i:i+1] = [slice(None)] * (ndims - len(keys) + 1)
+	if len(keys) > ndims:
+		raise IndexError(f"too many indices: matrix is {ndims}-dimensional, but {len(keys)} were indexed")
+	return keys + [slice(None)] * (ndims - len(keys))
+
+
+def _normalize_key(key, size):
+	"""
+	Normalize an index key for one dimension.
+
+	Returns
+	-------
+	int or range or numpy.ndarray
+		An int for a scalar index, a range for a slice, and otherwise
+		a 1-d array of non-negative positions.
+	"""
+	if isinstance(key, (int, np.integer)):
+		key = int(key)
+		if key < 0:
+			key += size
+		if not 0 <= key < size:
+			raise IndexError(f"index {key} is out of bounds for dimension with size {size}")
+		return key
+	if isinstance(key, slice):
+		return range(*key.indices(size))
+	key = np.asarray(key)
+	if key.ndim != 1:
+		raise IndexError("array indexes must be one dimensional")
+	if key.dtype == bool:
+		if key.size != size:
+			raise IndexError(f"boolean index has size {key.size}, expected {size}")
+		return np.flatnonzero(key)
+	key = key.astype(np.int64)
+	key = np.where(key < 0, key + size, key)
+	if key.size and (key.min() < 0 or key.max() >= size):
+		raise IndexError(f"index out of bounds for dimension with size {size}")
+	return key
+
+
+def _outer_index(box, keys, lo):
+	"""
+	Index an array independently on each dimension.
+
+	Parameters
+	----------
+	box : numpy.ndarray
+		The array to index, covering positions from `lo` on each dimension.
+	keys : list
+		Normalized keys for each dimension, as from `_normalize_key`.
+	lo : list[int]
+		The position of the first element of `box` on each dimension.
+	"""
+	basic = []
+	for key, l in zip(keys, lo):
+		if isinstance(key, int):
+			basic.append(slice(key - l, key - l + 1))
+		elif isinstance(key, range):
+			stop = key.stop - l
+			basic.append(slice(key.start - l, stop if stop >= 0 else None, key.step))
+		else:
+			basic.append(slice(None))
+	result = box[tuple(basic)]
+	for axis, (key, l) in enumerate(zip(keys, lo)):
+		if isinstance(key, np.ndarray):
+			result = np.take(result, key - l, axis=axis)
+	return result[tuple(0 if isinstance(key, int) else slice(None) for key in keys)]
@@ -0,0 +1,437 @@
+"""
+Datasets of matrices split across several arrowmatrix files.
+
+A dataset is a directory of arrowmatrix files that share one shape (and
+tile layout), plus a 'manifest.json' that routes each matrix name to the
+file holding it.  Matrices are organized in named groups, one file per
+group (e.g. 'auto_am', 'transit_am'), so one group can be rewritten
+without touching the others, and reads open only the files they need.
+"""
+
+import os
+import json
+import uuid
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+
+from .common import AbstractArrowMatrix, retile_table
+from .instrument import current_call
+from .statistics import remove_statistics
+
+MANIFEST = 'manifest.json'
+
+MANIFEST_VERSION = 1
+
+# metadata of member files that does not apply to the dataset as a whole
+_MEMBER_METADATA = (b'DOWNCAST', b'STATISTICS', b'AXIS_STATISTICS', b'FOLDED')
+
+
+def _file_extension(cls):
+	from .parquet import ParquetMatrix
+	from .sparse import SparseMatrix
+	if issubclass(cls, ParquetMatrix):
+		return '.pqmx'
+	if issubclass(cls, SparseMatrix):
+		return '.spmx'
+	return '.fmx'
+
+
+class ArrowMatrixDataset(AbstractArrowMatrix):
+	"""
+	Matrices stored in a directory of arrowmatrix files, one per group.
+
+	The dataset has the same read API as a single file (`get_rc`,
+	`get_matrix`, indexing, `expr`, ...).  Reads of several matrices
+	are grouped by file, and the files are read concurrently.
+
+	Parameters
+	----------
+	directory : path-like
+		The dataset directory, containing 'manifest.json'.
+	cache_bytes : int, optional
+		Enable a least-recently-used cache of decoded columns,
+		holding at most this many bytes.
+	max_workers : int, optional
+		The maximum number of files to read concurrently.  Defaults
+		to one thread per file read.
+	**kwargs
+		Other keyword arguments are passed to `open_matrix` for each file.
+	"""
+
+	_updatable = False
+
+	def __init__(self, directory, cache_bytes=None, max_workers=None, **kwargs):
+		self.directory = os.fspath(directory)
+		self.max_workers = max_workers
+		self._open_kwargs = kwargs
+		self._load()
+		super().__init__(
+			filename=self.directory,
+			shape=self._manifest['shape'],
+			omx_version=self._manifest['omx_version'],
+			cache_bytes=cache_bytes,
+		)
+
+	@staticmethod
+	def _read_manifest(directory):
+		with open(os.path.join(directory, MANIFEST)) as f:
+			manifest = json.load(f)
+		if manifest.get('version') != MANIFEST_VERSION:
+			raise ValueError(f"unsupported dataset manifest version {manifest.get('version')}")
+		return manifest
+
+	def _write_manifest(self, manifest):
+		# replace atomically, so readers never see a partial manifest
+		filename = os.path.join(self.directory, MANIFEST)
+		temp = f"{filename}.{uuid.uuid4().hex[:8]}.tmp"
+		with open(temp, 'w') as f:
+			json.dump(manifest, f, indent=1)
+		os.replace(temp, filename)
+
+	def _load(self):
+		"""Open the files in the manifest, and build the routing and schema."""
+		from . import open_matrix
+		manifest = self._read_manifest(self.directory)
+		shape = tuple(manifest['shape'])
+		tile = tuple(manifest['tile']) if manifest.get('tile') else None
+		members = {}
+		routes = {}
+		fields = []
+		downcasts = {}
+		metadata = {
+			b'SHAPE': str(shape).encode(),
+			b'OMX_VERSION': manifest['omx_version'].encode(),
+		}
+		if tile is not None:
+			metadata[b'TILE'] = str(tile).encode()
+		for group, entry in manifest['groups'].items():
+			member = open_matrix(os.path.join(self.directory, entry['file']), **self._open_kwargs)
+			if member.shape != shape or member.tile != tile:
+				raise ValueError(
+					f"{entry['file']} has shape {member.shape} and tile {member.tile}, "
+					f"but the dataset has shape {shape} and tile {tile}"
+				)
+			members[group] = member
+			member_metadata = member.schema.metadata or {}
+			for key, value in member_metadata.items():
+				if key not in metadata and key not in _MEMBER_METADATA:
+					metadata[key] = value
+			recorded = json.loads(member_metadata.get(b'DOWNCAST', b'{}'))
+			for name in entry['matrices']:
+				if name in routes:
+					raise ValueError(f"matrix {name!r} is in groups {routes[name]!r} and {group!r}")
+				routes[name] = group
+				fields.append(member.schema.field(name))
+				if name in recorded:
+					downcasts[name] = recorded[name]
+		if downcasts:
+			metadata[b'DOWNCAST'] = json.dumps(downcasts).encode()
+		self._manifest = manifest
+		self._members = members
+		self._routes = routes
+		self._schema = pa.schema(fields, metadata=metadata)
+
+	@classmethod
+	def create(cls, directory, shape, omx_version=None, tile=None, overwrite=False, **kwargs):
+		"""
+		Create an empty dataset.
+
+		Parameters
+		----------
+		directory : path-like
+			The dataset directory, which is created if needed.
+		shape : tuple
+			The shape of every matrix in the dataset.
+		omx_version : str, optional
+			Defaults to the current OMX version.
+		tile : tuple, optional
+			The tile shape of every file in the dataset, see `from_hdf5`.
+		overwrite : bool, default False
+			Replace any existing manifest.  Files of the existing
+			dataset are not removed.
+		**kwargs
+			Passed to the constructor.
+
+		Returns
+		-------
+		ArrowMatrixDataset
+		"""
+		from .common import OMX_VERSION, normalize_tile
+		directory = os.fspath(directory)
+		os.makedirs(directory, exist_ok=True)
+		filename = os.path.join(directory, MANIFEST)
+		if os.path.exists(filename) and not overwrite:
+			raise FileExistsError(filename)
+		shape = [int(i) for i in ([shape] if isinstance(shape, int) else shape)]
+		tile = normalize_tile(shape, tile)
+		manifest = dict(
+			version=MANIFEST_VERSION,
+			shape=shape,
+			omx_version=omx_version or OMX_VERSION.decode(),
+			tile=None if tile is None else list(tile),
+			groups={},
+		)
+		with open(filename, 'w') as f:
+			json.dump(manifest, f, indent=1)
+		return cls(directory, **kwargs)
+
+	@classmethod
+	def from_arrow(
+			cls, source, directory, groups=None, overwrite=False, file_cls=None,
+			max_workers=None, **kwargs,
+	):
+		"""
+		Copy matrices from another arrowmatrix into a new dataset.
+
+		Parameters
+		----------
+		source : AbstractArrowMatrix
+			The matrices to copy.
+		directory : path-like
+			The dataset directory.
+		groups : Mapping[str, Collection[str]], optional
+			The matrix names to write in each group.  Defaults to a
+			single group, 'matrices', with all the matrices.
+		overwrite : bool, default False
+			Replace any existing dataset manifest.
+		file_cls : type, optional
+			The arrowmatrix class of the files.  Defaults to ParquetMatrix.
+		max_workers : int, optional
+			Read groups of columns from the source in parallel
+			using a pool of this many threads.
+		**kwargs
+			Other keyword arguments are passed to `file_cls.from_arrow`.
+
+		Returns
+		-------
+		ArrowMatrixDataset
+		"""
+		if groups is None:
+			groups = {'matrices': source.list_matrices()}
+		dataset = cls.create(
+			directory, source.shape, omx_version=source.omx_version, tile=source.tile,
+			overwrite=overwrite,
+		)
+		for group, names in groups.items():
+			dataset.write_group(
+				group, source, names=names, file_cls=file_cls, max_workers=max_workers, **kwargs,
+			)
+		return dataset
+
+	@property
+	def _storage_schema(self):
+		return self._schema
+
+	@property
+	def groups(self):
+		"""dict : The matrix names in each group."""
+		return {group: list(entry['matrices']) for group, entry in self._manifest['groups'].items()}
+
+	def group_of(self, name):
+		"""str : The group holding a matrix."""
+		return self._routes[name]
+
+	def write_group(self, group, source, names=None, file_cls=None, max_workers=None, **kwargs):
+		"""
+		Write (or replace) one group of matrices.
+
+		The group is written to a new file, then the manifest is
+		updated, then any previous file of the group is removed, so
+		other groups are not touched, and readers that open the
+		dataset meanwhile see either the old or the new group.
+
+		Parameters
+		----------
+		group : str
+			The name of the group.
+		source : AbstractArrowMatrix or Mapping[str, array-like]
+			The matrices to write, with the shape of the dataset, as
+			another arrowmatrix, or as arrays by matrix name.
+		names : Collection[str], optional
+			The matrices to write.  Defaults to all matrices in `source`.
+			They replace all the matrices previously in the group, and
+			must not be in any other group.
+		file_cls : type, optional
+			The arrowmatrix class of the file.  Defaults to the class
+			of the group's previous file, or ParquetMatrix.
+		max_workers : int, optional
+			Read groups of columns from the source in parallel
+			using a pool of this many threads.
+		**kwargs
+			Other keyword arguments are passed to `file_cls.from_arrow`,
+			or for arrays to the writer, e.g. `compression`.
+		"""
+		if isinstance(source, Mapping):
+			arrays = {name: np.asarray(arr) for name, arr in source.items()}
+			for name, arr in arrays.items():
+				if arr.shape != self.shape:
+					raise ValueError(f"{name} has shape {arr.shape}, the dataset has shape {self.shape}")
+			names = list(arrays if names is None else names)
+		elif tuple(source.shape) != self.shape:
+			raise ValueError(f"source has shape {source.shape}, the dataset has shape {self.shape}")
+		else:
+			names = list(source.list_matrices() if names is None else names)
+		clashes = [name for name in names if self._routes.get(name, group) != group]
+		if clashes:
+			raise ValueError(
+				f"matrices are already in other groups: "
+				f"{ {name: self._routes[name] for name in clashes} }"
+			)
+		old = self._manifest['groups'].get(group)
+		if file_cls is None:
+			from .parquet import ParquetMatrix
+			file_cls = type(self._members[group]) if old is not None else ParquetMatrix
+		filename = f"{group}-{uuid.uuid4().hex[:8]}{_file_extension(file_cls)}"
+		if isinstance(source, Mapping):
+			table = pa.table(
+				{name: arrays[name].reshape(-1) for name in names},
+				metadata={
+					b'SHAPE': str(self.shape).encode(),
+					b'OMX_VERSION': self.omx_version.encode(),
+				},
+			)
+			table = retile_table(table, self.shape, self.tile)
+			file_cls._write_arrow_table(os.path.join(self.directory, filename), table, self.shape, **kwargs)
+		else:
+			file_cls.from_arrow(
+				source, os.path.join(self.directory, filename), names=names,
+				max_workers=max_workers, tile=self.tile, **kwargs,
+			)
+		manifest = self._read_manifest(self.directory)
+		manifest['groups'][group] = dict(file=filename, matrices=names)
+		self._write_manifest(manifest)
+		if old is not None:
+			self._members.pop(group, None)
+			os.remove(os.path.join(self.directory, old['file']))
+			remove_statistics(os.path.join(self.directory, old['file']))
+		self.refresh()
+
+	def remove_group(self, group):
+		"""
+		Remove one group of matrices, and its file.
+
+		Parameters
+		----------
+		group : str
+		"""
+		manifest = self._read_manifest(self.directory)
+		entry = manifest['groups'].pop(group)
+		self._write_manifest(manifest)
+		self._members.pop(group, None)
+		os.remove(os.path.join(self.directory, entry['file']))
+		remove_statistics(os.path.join(self.directory, entry['file']))
+		self.refresh()
+
+	def refresh(self):
+		"""
+		Reload the manifest, e.g. after another process updated a group.
+
+		Cached columns, lookups and statistics are discarded.
+		"""
+		self._load()
+		for attr in ('lookups', 'statistics', '_whole_statistics', 'folded'):
+			self.__dict__.pop(attr, None)
+		self._lookup_indexes = {}
+		if self._cache is not None:
+			self._cache.clear()
+
+	def _read_statistics(self, by_position=True):
+		"""Read the statistics stored with the files of the dataset."""
+		result = {}
+		for group, member in self._members.items():
+			stats = member._read_statistics(by_position)
+			if stats:
+				result.update({
+					key: value for key, value in stats.items()
+					if self._routes.get(key[0]) == group
+				})
+		return result or None
+
+	def _storage_min_max(self, name):
+		return self._members[self._routes[name]]._storage_min_max(name)
+
+	def _column_array(self, name):
+		return self._members[self._routes[name]]._column_array(name)
+
+	def _by_member(self, names, func):
+		"""
+		Call `func(member, names)` for the names in each file, concurrently.
+
+		Returns
+		-------
+		pyarrow.Table
+			The resulting columns, in the order of `names`.
+		"""
+		grouped = {}
+		for name in names:
+			grouped.setdefault(self._routes[name], []).append(name)
+		call = current_call()
+
+		def read(group):
+			if call is not None:
+				call.attach()
+			try:
+				return func(self._members[group], grouped[group])
+			finally:
+				if call is not None:
+					call.detach()
+
+		if len(grouped) == 1:
+			tables = [func(self._members[group], grouped[group]) for group in grouped]
+		else:
+			workers = min(self.max_workers or len(grouped), len(grouped))
+			with ThreadPoolExecutor(max_workers=workers) as pool:
+				tables = list(pool.map(read, grouped))
+		columns = {}
+		for table in tables:
+			columns.update(zip(table.column_names, table.columns))
+		return pa.Table.from_arrays(
+			[columns[name] for name in names],
+			names=list(names),
+			metadata=self.schema.metadata,
+		)
+
+	def _read_arrow_table(self, names=None):
+		"""
+		Read a pyarrow.Table for named columns, from each file concurrently.
+
+		Parameters
+		----------
+		names : Collection[str], optional
+			Column names to load.  If not given, load all columns.
+
+		Returns
+		-------
+		pyarrow.Table
+		"""
+		if names is None:
+			names = self.list_matrices()
+		return self._by_member(names, lambda member, group: member._get_arrow_table(group))
+
+	def _take(self, names, takers):
+		"""
+		Get a pyarrow.Table of named columns, at the given flat positions.
+
+		Each file takes its own columns, concurrently, reading only
+		what its format needs.  If the column cache is enabled, or the
+		columns were prefetched, whole columns are used instead.
+		"""
+		if self._reads_whole_columns(names):
+			return super()._take(names, takers)
+		takers = np.asarray(takers).reshape(-1)
+		return self._by_member(names, lambda member, group: member._take(group, takers))
+
+	def _read_span(self, names, start, stop):
+		if self._reads_whole_columns(names):
+			return super()._read_span(names, start, stop)
+		return self._by_member(names, lambda member, group: member._read_span(group, start, stop))
+
+	@staticmethod
+	def _write_arrow_table(filename, table, shape, **kwargs):
+		raise TypeError("cannot write an ArrowMatrixDataset as one file, use from_arrow or write_group")
+
+	@staticmethod
+	def _open_writer(filename, schema, shape, **kwargs):
+		raise TypeError("cannot write an ArrowMatrixDataset as one file, use from_arrow or write_group")
@@ -0,0 +1,147 @@
+import json
+import numpy as np
+import pyarrow as pa
+
+# Candidate storage types, from narrowest to widest.  Integer types are
+# only used when every value is (within tolerance of) a whole number.
+INTEGER_CANDIDATES = ('int8', 'int16', 'int32', 'int64')
+FLOAT_CANDIDATES = ('float32',)
+
+
+def narrowest_dtype(values, tolerance=0):
+	"""
+	Find the narrowest dtype that can represent an array.
+
+	Parameters
+	----------
+	values : numpy.ndarray
+		The array to check.
+	tolerance : float, default 0
+		The largest absolute change in any value that is acceptable.
+		With the default of zero, only lossless casts are chosen.
+
+	Returns
+	-------
+	numpy.dtype
+		The narrowest acceptable dtype, which may be the original
+		dtype of `values`.
+	"""
+	values = np.asarray(values)
+	original = values.dtype
+	if original.kind not in 'iuf' or values.size == 0:
+		return original
+	if original.kind == 'f':
+		finite = np.isfinite(values).all()
+	else:
+		finite = True
+	if finite:
+		lo, hi = values.min(), values.max()
+		rounded = values if original.kind in 'iu' else np.rint(values)
+		if original.kind in 'iu' or np.abs(rounded - values).max() <= tolerance:
+			for candidate in INTEGER_CANDIDATES:
+				candidate = np.dtype(candidate)
+				if candidate.itemsize >= original.itemsize:
+					break
+				info = np.iinfo(candidate)
+				if info.min <= lo and hi <= info.max:
+					return candidate
+	if original.kind == 'f':
+		for candidate in FLOAT_CANDIDATES:
+			candidate = np.dtype(candidate)
+			if candidate.itemsize >= original.itemsize:
+				break
+			with np.errstate(over='ignore', invalid='ignore'):
+				narrowed = values.astype(candidate).astype(original)
+			if tolerance:
+				ok = np.array_equal(np.isnan(narrowed), np.isnan(values)) and np.all(
+					np.abs(narrowed - values)[~np.isnan(values)] <= tolerance
+				)
+			else:
+				ok = np.array_equal(narrowed, values, equal_nan=True)
+			if ok:
+				return candidate
+	return original
+
+
+def cast_values(values, dtype):
+	"""
+	Cast an array to a (possibly narrower) dtype, rounding for integers.
+
+	Parameters
+	----------
+	values : numpy.ndarray
+	dtype : dtype
+
+	Returns
+	-------
+	numpy.ndarray
+	"""
+	dtype = np.dtype(dtype)
+	if values.dtype == dtype:
+		return values
+	if dtype.kind in 'iu' and values.dtype.kind == 'f':
+		values = np.rint(values)
+	return values.astype(dtype)
+
+
+def downcast_metadata(metadata, casts):
+	"""
+	Record downcasts in schema metadata.
+
+	Parameters
+	----------
+	metadata : dict or None
+		Existing schema metadata.
+	casts : dict
+		Maps column names to the string form of their original type.
+		Columns already recorded as downcast keep their earlier
+		original type.
+
+	Returns
+	-------
+	dict
+	"""
+	metadata = dict(metadata or {})
+	recorded = json.loads(metadata.get(b'DOWNCAST', b'{}'))
+	for name, original in casts.items():
+		recorded.setdefault(name, original)
+	if recorded:
+		metadata[b'DOWNCAST'] = json.dumps(recorded).encode()
+	return metadata
+
+
+def downcast_table(table, tolerance=0):
+	"""
+	Cast each column of a table to the narrowest acceptable type.
+
+	Parameters
+	----------
+	table : pyarrow.Table
+	tolerance : float, default 0
+		The largest absolute change in any value that is acceptable.
+
+	Returns
+	-------
+	pyarrow.Table
+		The table with narrowed columns, and the original type of
+		each narrowed column recorded in the 'DOWNCAST' metadata.
+	"""
+	arrays = []
+	fields = []
+	casts = {}
+	for field, column in zip(table.schema, table.columns):
+		if column.null_count or not (
+				pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+		):
+			arrays.append(column)
+			fields.append(field)
+			continue
+		values = column.to_numpy()
+		dtype = narrowest_dtype(values, tolerance=tolerance)
+		if dtype != values.dtype:
+			column = pa.array(cast_values(values, dtype))
+			casts[field.name] = str(field.type)
+		arrays.append(column)
+		fields.append(pa.field(field.name, column.type))
+	metadata = downcast_metadata(table.schema.metadata, casts)
+	return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
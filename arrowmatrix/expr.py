@@ -0,0 +1,224 @@
+"""
+Lazy arithmetic expressions over the matrices in an arrowmatrix.
+
+    >>> cost = mx.expr("SOV_TIME__AM + SOV_TOLL__AM / vot", vot=20.0)
+    >>> cost.get_rc(orig, dest)      # only the requested cells
+    >>> cost.evaluate()              # the full matrix
+
+Expressions are evaluated with numpy, one chunk of stored cells at a
+time, so no input matrix is ever loaded whole, and peak memory beyond
+the result is proportional to the chunk size.
+"""
+
+import ast
+import numpy as np
+import pandas as pd
+
+from .common import untile_array
+
+# The default number of cells read from each matrix at a time.
+EXPR_CHUNK_CELLS = 1 << 18
+
+# Functions that can be called in expressions.
+FUNCTIONS = {
+	'abs': np.abs,
+	'exp': np.exp,
+	'log': np.log,
+	'sqrt': np.sqrt,
+	'minimum': np.minimum,
+	'maximum': np.maximum,
+	'where': np.where,
+	'clip': np.clip,
+}
+
+_ALLOWED_NODES = (
+	ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call,
+	ast.Name, ast.Load, ast.Constant,
+	ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+	ast.UAdd, ast.USub, ast.Invert, ast.BitAnd, ast.BitOr, ast.BitXor,
+	ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+class MatrixExpression:
+	"""
+	An arithmetic expression over named matrices, evaluated lazily.
+
+	Expressions can use the names of matrices, named constants,
+	numbers, the arithmetic, comparison and bitwise operators, and
+	the functions in `FUNCTIONS` (e.g. `minimum(A, B)`).  Matrices
+	stored with a narrower data type are cast back to their original
+	type, one chunk at a time, before evaluation.
+
+	Parameters
+	----------
+	mx : AbstractArrowMatrix
+		The matrices to evaluate the expression over.
+	expression : str
+		The expression, e.g. "TIME + COST / VOT + 2 * WAIT".
+	chunk_cells : int, optional
+		The number of cells to read from each matrix at a time.
+		Defaults to `EXPR_CHUNK_CELLS`.
+	**constants
+		Values for names in the expression that are not matrices.
+	"""
+
+	def __init__(self, mx, expression, chunk_cells=None, **constants):
+		self.mx = mx
+		self.expression = expression
+		self.chunk_cells = chunk_cells or EXPR_CHUNK_CELLS
+		self.constants = constants
+		tree = ast.parse(expression, mode='eval')
+		matrices = set(mx.list_matrices())
+		names = []
+		for node in ast.walk(tree):
+			if not isinstance(node, _ALLOWED_NODES):
+				raise ValueError(f"{type(node).__name__} is not allowed in matrix expressions")
+			if isinstance(node, ast.Call):
+				if not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+					raise ValueError(f"only the functions {sorted(FUNCTIONS)} can be called")
+				if node.keywords:
+					raise ValueError("keyword arguments are not allowed in matrix expressions")
+			elif isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+				if node.id in matrices:
+					if node.id not in names:
+						names.append(node.id)
+				elif node.id not in constants:
+					raise NameError(f"{node.id!r} is not a matrix or constant")
+		self._names = names
+		self._code = compile(tree, '<matrix expression>', 'eval')
+
+	@property
+	def names(self):
+		"""list[str] : The matrices used by the expression."""
+		return list(self._names)
+
+	def __repr__(self):
+		return f"<MatrixExpression {self.expression!r}>"
+
+	def _evaluate_arrays(self, arrays):
+		downcasts = self.mx.downcasts
+		namespace = dict(FUNCTIONS)
+		namespace.update(self.constants)
+		for name, arr in arrays.items():
+			if name in downcasts:
+				arr = arr.astype(downcasts[name].to_pandas_dtype())
+			namespace[name] = arr
+		return eval(self._code, {'__builtins__': {}}, namespace)
+
+	def _result_array(self, value, size):
+		"""Broadcast the value of one chunk, e.g. if the expression is constant."""
+		return np.broadcast_to(np.asarray(value), (size,))
+
+	def evaluate(self, out=None):
+		"""
+		Evaluate the expression for every cell.
+
+		Parameters
+		----------
+		out : numpy.ndarray, optional
+			An array with the shape of the matrices to fill.
+
+		Returns
+		-------
+		numpy.ndarray
+		"""
+		mx = self.mx
+		shape = mx.shape
+		flat = None
+		for start, stop in mx._chunk_bounds(self.chunk_cells):
+			arrays = mx._span_arrays(self._names, start, stop)
+			values = self._result_array(self._evaluate_arrays(arrays), stop - start)
+			if flat is None:
+				dtype = values.dtype if out is None else out.dtype
+				flat = np.empty(int(np.prod(shape)), dtype=dtype)
+			flat[start:stop] = values
+			del arrays, values
+		if flat is None:
+			flat = np.empty(0, dtype=out.dtype if out is not None else np.float64)
+		if mx.tile is not None:
+			result = untile_array(flat, shape, mx.tile)
+		else:
+			result = flat.reshape(shape)
+		if out is None:
+			return result
+		out[...] = result
+		return out
+
+	def get_rc_array(self, *indexes, dedup=False, by=None):
+		"""
+		Evaluate the expression for particular cells.
+
+		Parameters
+		----------
+		*indexes : array-like or int
+			The various index positions to evaluate.  The number
+			of tuple values must match the number of dimensions.
+		dedup : bool, default False
+			Read each distinct cell only once.
+		by : str or Sequence[str], optional
+			Interpret the indexes as labels of this lookup, as
+			for `AbstractArrowMatrix.get_rc`.
+
+		Returns
+		-------
+		numpy.ndarray
+		"""
+		mx = self.mx
+		takers, _ = mx._takers(*indexes, attach_index=False, by=by)
+		takers = np.asarray(takers).reshape(-1)
+		inverse = None
+		if dedup:
+			takers, inverse = np.unique(takers, return_inverse=True)
+		chunks = []
+		for start in range(0, len(takers), self.chunk_cells):
+			chunk = takers[start:start + self.chunk_cells]
+			arrays = {}
+			missing = []
+			for name in self._names:
+				arr = mx._column_array(name)
+				if arr is None:
+					missing.append(name)
+				else:
+					arrays[name] = arr[chunk]
+			if missing:
+				table = mx._take(missing, chunk)
+				for name, column in zip(missing, table.columns):
+					arrays[name] = column.to_numpy()
+			chunks.append(self._result_array(self._evaluate_arrays(arrays), len(chunk)))
+		if chunks:
+			result = np.concatenate(chunks)
+		else:
+			result = np.empty(0)
+		if inverse is not None:
+			result = result[inverse]
+		return result
+
+	def get_rc(self, *indexes, attach_index=True, dedup=False, by=None):
+		"""
+		Evaluate the expression for particular cells.
+
+		Parameters
+		----------
+		*indexes : array-like or int
+			The various index positions to evaluate.  The number
+			of tuple values must match the number of dimensions.
+		attach_index : bool or tuple
+			Whether to attach a meaningful index to the output,
+			as for `AbstractArrowMatrix.get_rc`.
+		dedup : bool, default False
+			Read each distinct cell only once.
+		by : str or Sequence[str], optional
+			Interpret the indexes as labels of this lookup, as
+			for `AbstractArrowMatrix.get_rc`.
+
+		Returns
+		-------
+		pandas.Series
+		"""
+		_, idx = self.mx._get_rc_preprocess(indexes, attach_index)
+		return pd.Series(
+			self.get_rc_array(*indexes, dedup=dedup, by=by),
+			index=idx,
+			name=self.expression,
+		)
@@ -1,30 +1,219 @@
 import os
 import ast
 import json
+import functools
+import threading
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import pyarrow.feather as pf
 import pyarrow.ipc as ipc
-from .common import AbstractArrowMatrix
+from .common import AbstractArrowMatrix, column_options, table_tile, _offset_chunk_bounds
+from .instrument import timed
+
+
+def _single_option(names, option, label):
+	"""
+	Resolve a per-column writer option, which Feather supports only per file.
+	"""
+	if not isinstance(option, dict):
+		return option
+	resolved = column_options(names, option)
+	values = {resolved.get(name) for name in names}
+	if len(values) > 1:
+		raise ValueError(f"Feather files support only one {label} for all matrices")
+	return values.pop() if values else None
+
+
+# The most readers limited to particular sets of fields kept open by
+# each FeatherMatrix, see `FeatherMatrix._reader_for`.
+MAX_FIELD_READERS = 32
+
+# The target number of cells in each record batch of compressed files
+# written with the default `chunksize`, see `_default_chunksize`.
+RECORD_BATCH_TARGET_CELLS = 1 << 20
+
+
+def _default_chunksize(schema, shape, compression=None):
+	"""
+	The default size of the record batches of a new file.
+
+	Uncompressed files are written as a single record batch, so each
+	column is a single zero-copy array of the mapped file.  Compressed
+	files are written in record batches of whole origin rows (or rows
+	of tiles), of about `RECORD_BATCH_TARGET_CELLS` cells, so reads of
+	a range of rows decompress only the record batches that hold them.
+	"""
+	size = max(1, int(np.prod(shape)))
+	if compression is None:
+		compression = 'lz4' if pa.Codec.is_available('lz4_frame') else 'uncompressed'
+	if compression == 'uncompressed':
+		return size
+	tile = table_tile(schema)
+	band_cells = max(1, int(np.prod(shape[1:])) * (tile[0] if tile is not None else 1))
+	return min(size, max(1, RECORD_BATCH_TARGET_CELLS // band_cells) * band_cells)
+
+
+def _has_compressed_batches(source):
+	"""
+	Whether the record batches of a mapped or in-memory Arrow IPC file are compressed.
+
+	The first column of the first record batch is read, and compared
+	with the start of the body of that record batch in the file, which
+	holds the column's buffers as they are only if they are not
+	compressed (writers use one codec for all batches of a file).
+	Files that cannot be checked are treated as compressed, which
+	only means their columns are read by field, instead of as views.
+	"""
+	try:
+		reader = ipc.open_file(source, options=ipc.IpcReadOptions(included_fields=[0]))
+		if reader.num_record_batches == 0:
+			return False
+		buffers = [buf for buf in reader.get_batch(0).column(0).buffers() if buf is not None and buf.size]
+		if not buffers:
+			return True
+		stream = pa.BufferReader(source) if isinstance(source, pa.Buffer) else source
+		position = stream.tell()
+		try:
+			stream.seek(8)  # the file magic and padding
+			for message in ipc.MessageReader.open_stream(stream):
+				if message.type == 'record batch':
+					body = message.body
+					return body.size < buffers[0].size or not body.slice(0, buffers[0].size).equals(buffers[0])
+		finally:
+			stream.seek(position)
+	except (pa.ArrowException, OSError):
+		pass
+	return True
+
+
+class _FeatherWriter:
+	"""
+	Write consecutive slices of a table to a Feather (Arrow IPC) file.
+	"""
+
+	def __init__(self, filename, schema, compression=None, compression_level=None, chunksize=None):
+		if compression is None:
+			compression = 'lz4' if pa.Codec.is_available('lz4_frame') else 'uncompressed'
+		if compression == 'uncompressed':
+			codec = None
+		else:
+			codec = pa.Codec(compression, compression_level=compression_level)
+		self.chunksize = chunksize
+		self._sink = pa.OSFile(str(filename), 'wb') if isinstance(filename, (str, os.PathLike)) else filename
+		self._writer = ipc.new_file(
+			self._sink, schema, options=ipc.IpcWriteOptions(compression=codec),
+		)
+
+	def write(self, table):
+		self._writer.write_table(table, max_chunksize=self.chunksize)
+
+	def close(self):
+		self._writer.close()
+		if isinstance(self._sink, pa.OSFile):
+			self._sink.close()
 
 
 class FeatherMatrix(AbstractArrowMatrix):
 
-	def __init__(self, filename, memory_map=True):
+	def __init__(self, filename, memory_map=True, zero_copy=False, cache_bytes=None):
+		"""
+		Open a Feather format arrowmatrix.
+
+		Only the schema and the file footer are read when opening, so
+		opening takes the same time regardless of the number of
+		matrices.  Columns are read (and decompressed, if compressed)
+		when they are first accessed.  For files whose columns are
+		decoded by every read (compressed, or not memory-mapped), the
+		most recently decoded column is kept, so repeated reads of the
+		same matrix (e.g. small `get_rc` calls in a simulation loop)
+		decompress it only once.  Give `cache_bytes` to keep more.
+
+		Parameters
+		----------
+		filename : path-like or pyarrow.Buffer or pyarrow.NativeFile
+			The file to open.
+		memory_map : bool, default True
+			Memory map the file, so reads of uncompressed columns are
+			zero-copy views of the mapped file.  Otherwise columns are
+			read into memory as they are accessed.
+		zero_copy : bool, default False
+			Serve `get_rc` and `get_matrix` from cached numpy views
+			over the column buffers, without creating intermediate
+			Arrow or pandas objects.  Arrays returned by `get_matrix`
+			are then read-only views instead of copies.  Columns that
+			cannot be viewed without copying (e.g. compressed, split into
+			multiple chunks, or containing nulls) fall back to the usual
+			path.  Only uncompressed memory-mapped (or in-memory) files
+			have such views.
+		cache_bytes : int, optional
+			Enable a least-recently-used cache of decoded columns,
+			holding at most this many bytes.
+		"""
 		self.filename = filename
-		schema = ipc.open_file(filename).schema
+		self._zero_copy = zero_copy
+		self._arrays = {}
+		if isinstance(filename, (str, os.PathLike)):
+			self._source = pa.memory_map(str(filename)) if memory_map else pa.OSFile(str(filename))
+		else:
+			self._source = filename
+		reader = ipc.open_file(self._source)
+		self._reader = (reader, threading.Lock())
+		self._field_readers = {}
+		self._field_readers_lock = threading.Lock()
+		# record batches of uncompressed mapped or in-memory files are
+		# zero-copy views, but reading only some of their fields copies
+		self._read_fields = (
+			not isinstance(self._source, (pa.Buffer, pa.MemoryMappedFile))
+			or _has_compressed_batches(self._source)
+		)
+		# (name, column) of the most recently decoded column, see `_read_arrow_table`
+		self._last_column = None
+		schema = reader.schema
+		self._schema = schema
 		self._column_defs = schema.names
 		omx_version = schema.metadata[b'OMX_VERSION'].decode()
 		shape = ast.literal_eval(schema.metadata[b'SHAPE'].decode())
-		super().__init__(filename=filename, shape=shape, omx_version=omx_version)
-		self._table = pf.read_table(self.filename, memory_map=memory_map)
+		super().__init__(
+			filename=filename,
+			shape=shape,
+			omx_version=omx_version,
+			cache_bytes=cache_bytes,
+		)
 
-	def list_matrices(self):
-		return self._column_defs
+	@property
+	def _storage_schema(self):
+		return self._schema
 
-	def _get_arrow_table(self, names=None):
+	def _column_array(self, name):
+		if self._routes_to_overlay([name]):
+			return super()._column_array(name)
+		# columns that must be read and decoded go through the cache instead
+		if not self._zero_copy or self._read_fields:
+			return None
+		try:
+			return self._arrays[name]
+		except KeyError:
+			pass
+		column = self._read_arrow_table([name]).column(0)
+		arr = None
+		if column.num_chunks == 1:
+			try:
+				arr = column.chunk(0).to_numpy(zero_copy_only=True)
+			except pa.ArrowInvalid:
+				arr = None
+		self._arrays[name] = arr
+		return arr
+
+	def _read_arrow_table(self, names=None):
 		"""
-		Get a pyarrow.Table for named columns.
+		Read a pyarrow.Table for named columns.
+
+		Uncompressed memory-mapped (or in-memory) files are read
+		once, without copying, and the named columns selected.  Otherwise
+		only the named columns of each record batch are read from the
+		file, and decompressed, except the most recently decoded column,
+		which is kept if there is no cache of decoded columns.
 
 		Parameters
 		----------
@@ -36,9 +225,132 @@ class FeatherMatrix(AbstractArrowMatrix):
 		pyarrow.Table
 		"""
 		if names is None:
-			return self._table
-		else:
-			return self._table.select(names)
+			if not self._read_fields:
+				return self._mapped_table
+			reader, lock = self._reader
+			with lock:
+				return reader.read_all()
+		names = list(names)
+		if not names:
+			return self._schema.empty_table().select([])
+		if not self._read_fields:
+			for name in names:
+				if self._schema.get_field_index(name) < 0:
+					raise KeyError(f'Field "{name}" does not exist in schema')
+			return self._mapped_table.select(names)
+		last = self._last_column
+		if self._cache is not None or last is None or last[0] not in names:
+			reader, lock = self._reader_for(names)
+			with lock:
+				table = reader.read_all()
+			if self._cache is None:
+				self._last_column = (names[-1], table.column(names[-1]))
+			# readers limited to some fields read them in file order
+			return table.select(names)
+		columns = dict([last])
+		others = [name for name in names if name != last[0]]
+		if others:
+			table = self._read_arrow_table(others)
+			columns.update(zip(others, table.columns))
+		schema = pa.schema([self._schema.field(name) for name in names], metadata=self._schema.metadata)
+		return pa.Table.from_arrays([columns[name] for name in names], schema=schema)
+
+	@functools.cached_property
+	def _mapped_table(self):
+		"""All columns of an uncompressed mapped or in-memory file, as views without copying."""
+		reader, lock = self._reader
+		with lock:
+			return reader.read_all()
+
+	def _reader_for(self, names):
+		"""
+		Get an open reader of the file that reads named fields, and a lock for using it.
+
+		Readers limited to particular sets of fields are opened once
+		and kept, up to `MAX_FIELD_READERS`, so the footer and schema
+		are not parsed again for each read.
+		"""
+		indexes = []
+		for name in names:
+			i = self._schema.get_field_index(name)
+			if i < 0:
+				raise KeyError(f'Field "{name}" does not exist in schema')
+			indexes.append(i)
+		if not self._read_fields:
+			return self._reader
+		key = tuple(sorted(set(indexes)))
+		with self._field_readers_lock:
+			entry = self._field_readers.get(key)
+			if entry is None:
+				if len(self._field_readers) >= MAX_FIELD_READERS:
+					self._field_readers.clear()
+				reader = ipc.open_file(self._source, options=ipc.IpcReadOptions(included_fields=list(key)))
+				entry = self._field_readers[key] = (reader, threading.Lock())
+		return entry
+
+	@functools.cached_property
+	def _record_batch_offsets(self):
+		"""
+		The flat position at which each record batch starts, and the total size.
+
+		The footer does not record the lengths of record batches, so
+		if there are several, the first column of each is read once.
+		"""
+		reader, lock = self._reader
+		if reader.num_record_batches <= 1 or not self._column_defs:
+			return np.array([0, int(np.prod(self.shape))])
+		reader, lock = self._reader_for(self._column_defs[:1])
+		with lock:
+			lengths = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+		return np.cumsum([0] + lengths)
+
+	def _read_batches(self, names, batches):
+		reader, lock = self._reader_for(names)
+		with lock:
+			batches = [reader.get_batch(i) for i in batches]
+		return pa.Table.from_batches(batches).select(names)
+
+	def _read_span(self, names, start, stop):
+		"""
+		Get a pyarrow.Table of named columns, for a contiguous range of flat positions.
+
+		Only the record batches that overlap the range are read and
+		decompressed, unless whole columns are already in memory, from
+		the cache or `prefetch`.  Spans of uncompressed mapped files
+		are sliced from the whole columns, which are views.
+		"""
+		names = list(names)
+		if (
+				not self._read_fields or not names or stop <= start
+				or self._has_whole_columns(names) or self._routes_to_overlay(names)
+		):
+			return super()._read_span(names, start, stop)
+		offsets = self._record_batch_offsets
+		if len(offsets) <= 2:
+			return super()._read_span(names, start, stop)
+		first = np.searchsorted(offsets, start, side='right') - 1
+		last = np.searchsorted(offsets, stop - 1, side='right') - 1
+		table = timed('read', self._read_batches, names, range(first, last + 1))
+		return table.slice(start - offsets[first], stop - start)
+
+	def _has_whole_columns(self, names):
+		"""Whether whole columns are already in memory, from the cache or `prefetch`."""
+		if any(name in self._prefetched for name in names):
+			return True
+		return self._cache is not None and all(name in self._cache for name in names)
+
+	def _chunk_bounds(self, chunk_cells):
+		"""
+		Split the flat storage positions into chunks of whole record batches.
+
+		Consecutive record batches are combined until each chunk holds
+		at least `chunk_cells` cells, so no record batch is decompressed
+		more than once.  Uncompressed mapped files are split into chunks
+		of `chunk_cells`, as any slice of them is a view.
+		"""
+		if not self._read_fields:
+			return super()._chunk_bounds(chunk_cells)
+		return _offset_chunk_bounds(self._record_batch_offsets, chunk_cells)
 
 	@staticmethod
 	def _write_arrow_table(filename, table, shape, **kwargs):
@@ -56,17 +368,63 @@ class FeatherMatrix(AbstractArrowMatrix):
 		compression : string, default None
 			Can be one of {"zstd", "lz4", "uncompressed"}. The default of None uses
 			LZ4 for V2 files if it is available, otherwise uncompressed.
+			A dict of wildcard patterns of matrix names is also accepted,
+			but must resolve to the same codec for every matrix.
 		compression_level : int, default None
 			Use a compression level particular to the chosen compressor. If None
 			use the default compression level
 		chunksize : int, default None
 			For V2 files, the internal maximum size of Arrow RecordBatch chunks
-			when writing the Arrow IPC file format. None means use the default,
-			which is currently 64K
+			when writing the Arrow IPC file format.  None means one record
+			batch for uncompressed files, and for compressed files record
+			batches of whole origin rows, of about `RECORD_BATCH_TARGET_CELLS`.
 		version : int, default 2
 			Feather file version. Version 2 is the current. Version 1 is the more
 			limited legacy format
 		"""
+		for key in ('compression', 'compression_level'):
+			if key in kwargs:
+				kwargs[key] = _single_option(table.column_names, kwargs[key], key)
 		if 'chunksize' not in kwargs:
-			kwargs['chunksize'] = np.prod(shape)
+			kwargs['chunksize'] = _default_chunksize(table.schema, shape, kwargs.get('compression'))
 		pf.write_feather(table, filename, **kwargs)
+
+	@staticmethod
+	def _open_writer(filename, schema, shape, compression=None, compression_level=None, chunksize=None, slab_rows=None):
+		"""
+		Open a writer to build a Feather file incrementally.
+
+		Each table written becomes one or more record batches, so
+		a file built this way is split into multiple chunks.
+
+		Parameters
+		----------
+		filename : str
+			Local destination path.
+		schema : pyarrow.Schema
+			The schema of the data, including any required metadata.
+		shape : list-like
+			Dimensions of the matrix being written.
+		compression : string, default None
+			Can be one of {"zstd", "lz4", "uncompressed"}. The default of None uses
+			LZ4 if it is available, otherwise uncompressed.
+		compression_level : int, default None
+			Use a compression level particular to the chosen compressor. If None
+			use the default compression level
+		chunksize : int, default None
+			The maximum size of the record batches written.  None
+			means the same default as `_write_arrow_table`, except
+			that each table written is at least one record batch.
+		slab_rows : int, optional
+			The most origin rows in each table written.  Nothing is
+			buffered, so this is not needed.
+		"""
+		compression = _single_option(schema.names, compression, 'compression')
+		if chunksize is None:
+			chunksize = _default_chunksize(schema, shape, compression)
+		return _FeatherWriter(
+			filename, schema,
+			compression=compression,
+			compression_level=_single_option(schema.names, compression_level, 'compression_level'),
+			chunksize=chunksize,
+		)
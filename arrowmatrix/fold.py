@@ -0,0 +1,162 @@
+"""
+Fold families of matrices that differ only by a name suffix into N-d matrices.
+
+Skims are often split by time period into separately named matrices,
+e.g. 'SOV_TIME__EA', 'SOV_TIME__AM', ... 'SOV_TIME__EV'.  Folding
+combines each such family into a single matrix 'SOV_TIME' with an extra
+last dimension for the period, so that values for trips in different
+periods can be read with one vectorized `get_rc`, using a per-record
+period index.
+
+Matrices that are not part of any family (e.g. 'DIST') are repeated
+along the new dimension, and periods missing from a family are filled
+with NaN.  How the matrices were folded is recorded in the 'FOLDED'
+metadata, and the period labels can be used as a lookup (see
+`AbstractArrowMatrix.get_rc_period`).
+"""
+
+import json
+import numpy as np
+import pyarrow as pa
+
+# The default period suffixes to fold, in order.
+PERIODS = ('EA', 'AM', 'MD', 'PM', 'EV')
+
+# The default name of the folded dimension, usable as a lookup of its labels.
+FOLD_AXIS_NAME = 'PERIOD'
+
+
+def fold_spec(names, labels=PERIODS, separator='__', axis_name=FOLD_AXIS_NAME):
+	"""
+	Work out how to fold matrices by name.
+
+	Parameters
+	----------
+	names : Sequence[str]
+		The matrix names.
+	labels : Sequence[str]
+		The suffixes to fold, in the order of the new dimension.
+	separator : str
+		The separator between the family name and the suffix.
+	axis_name : str
+		The name of the new dimension.
+
+	Returns
+	-------
+	dict
+		With the folded 'columns' in order, each a list of the
+		family name and the original name for each label (None if
+		missing, or the same name for every label if repeated),
+		plus the 'labels', 'separator' and 'axis_name'.
+	"""
+	labels = list(labels)
+	families = {}
+	columns = []
+	for name in names:
+		base, sep, suffix = name.rpartition(separator)
+		if sep and base and suffix in labels:
+			if base not in families:
+				families[base] = [None] * len(labels)
+				columns.append([base, families[base]])
+			families[base][labels.index(suffix)] = name
+		else:
+			columns.append([name, [name] * len(labels)])
+	folded = [base for base, members in columns if base in families]
+	repeated = {base for base, members in columns if base not in families}
+	clashes = set(folded) & repeated
+	if clashes:
+		raise ValueError(f"cannot fold, names are both families and matrices: {sorted(clashes)}")
+	return dict(
+		axis_name=axis_name,
+		labels=labels,
+		separator=separator,
+		columns=columns,
+	)
+
+
+def _folded_type(types, members):
+	"""The storage type of a folded matrix, from the types of its members."""
+	dtypes = [np.dtype(t.to_pandas_dtype()) for t in types]
+	dtype = np.result_type(*dtypes)
+	if any(member is None for member in members) and dtype.kind != 'f':
+		dtype = np.dtype('float64')
+	return pa.from_numpy_dtype(dtype)
+
+
+def fold_schema(schema, spec):
+	"""
+	Get the schema of folded data.
+
+	Parameters
+	----------
+	schema : pyarrow.Schema
+		The schema of the matrices before folding, with SHAPE metadata.
+	spec : dict
+		As given by `fold_spec`.
+
+	Returns
+	-------
+	pyarrow.Schema
+		With the folded matrices, the shape extended by the new last
+		dimension, and the spec recorded in the 'FOLDED' metadata.
+	"""
+	from .common import table_shape
+	fields = []
+	for base, members in spec['columns']:
+		types = [schema.field(member).type for member in members if member is not None]
+		fields.append(pa.field(base, _folded_type(types, members)))
+	metadata = dict(schema.metadata or {})
+	shape = table_shape(schema)
+	metadata[b'SHAPE'] = str((*shape, len(spec['labels']))).encode()
+	metadata[b'FOLDED'] = json.dumps(spec).encode()
+	if b'DOWNCAST' in metadata:
+		recorded = json.loads(metadata[b'DOWNCAST'])
+		folded = {}
+		for base, members in spec['columns']:
+			for member in members:
+				if member in recorded:
+					folded.setdefault(base, recorded[member])
+		metadata[b'DOWNCAST'] = json.dumps(folded).encode()
+	return pa.schema(fields, metadata=metadata)
+
+
+def fold_table(table, spec, schema=None):
+	"""
+	Fold the matrices in a tall table.
+
+	Parameters
+	----------
+	table : pyarrow.Table
+		The data to fold, in row-major order, for any number of
+		whole origin rows.
+	spec : dict
+		As given by `fold_spec`.
+	schema : pyarrow.Schema, optional
+		The folded schema, as given by `fold_schema`.  If not given,
+		it is built from the schema of `table`.
+
+	Returns
+	-------
+	pyarrow.Table
+		The folded data, with each cell followed by its values for
+		each label of the new last dimension.
+	"""
+	if schema is None:
+		schema = fold_schema(table.schema, spec)
+	arrays = []
+	for (base, members), field in zip(spec['columns'], schema):
+		dtype = np.dtype(field.type.to_pandas_dtype())
+		values = {
+			member: table.column(member).to_numpy().astype(dtype, copy=False)
+			for member in set(members) if member is not None
+		}
+		if len(values) == 1 and all(member is not None for member in members):
+			# repeated along the new dimension
+			folded = np.repeat(next(iter(values.values())), len(members))
+		else:
+			folded = np.empty((table.num_rows, len(members)), dtype=dtype)
+			for i, member in enumerate(members):
+				folded[:, i] = np.nan if member is None else values[member]
+			folded = folded.reshape(-1)
+		arrays.append(pa.array(folded, type=field.type))
+	return pa.Table.from_arrays(arrays, schema=schema)
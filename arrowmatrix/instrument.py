@@ -0,0 +1,246 @@
+"""
+Low-overhead instrumentation of reads from an arrowmatrix.
+
+When enabled with `AbstractArrowMatrix.instrument`, each public read
+(`get_rc`, `get_rc_table`, `get_rc_array`, `get_matrix` and indexing)
+reports one event to a callback, with the time spent in each stage:
+
+- 'read': reading (and decompressing) columns or row groups from storage,
+- 'take': gathering the requested cells from what was read, and
+- 'convert': converting Arrow data to pandas or numpy,
+
+plus the decoded bytes read from storage, the numbers of columns and
+takers (cell positions), and column cache hits and misses.  Time not in
+any stage (e.g. building indexes) is the difference between 'seconds'
+and the sum of the stages.  Zero-copy numpy gathers from memory-mapped
+data read pages on demand, so their time counts as 'take', and their
+bytes are not counted as read.
+
+`ReadStats` is a callback that aggregates events by operation, and
+can be exported to a dict, e.g. to collect the stats of worker
+processes with `ReadStats.merge`.  When instrumentation is disabled,
+the cost is an attribute check per call and a thread-local lookup
+per stage.
+"""
+
+import time
+import functools
+import threading
+import pandas as pd
+
+# The stages timed within each call.
+STAGES = ('read', 'take', 'convert')
+
+# The counters of each event, aggregated by `ReadStats`.
+COUNTERS = ('calls', 'seconds', *STAGES, 'bytes_read', 'columns', 'takers', 'cache_hits', 'cache_misses')
+
+_local = threading.local()
+
+
+def current_call():
+	"""The `ReadCall` being recorded in this thread, or None."""
+	return getattr(_local, 'call', None)
+
+
+def timed(stage, func, *args, **kwargs):
+	"""
+	Call a function, adding its duration to a stage of the current call.
+
+	For the 'read' stage, the `nbytes` of the result (e.g. a
+	pyarrow.Table) is also counted as bytes read.  If no call is
+	being recorded, the function is just called.
+	"""
+	call = getattr(_local, 'call', None)
+	if call is None:
+		return func(*args, **kwargs)
+	start = time.perf_counter()
+	result = func(*args, **kwargs)
+	call.add(stage, time.perf_counter() - start, result.nbytes if stage == 'read' else 0)
+	return result
+
+
+class ReadCall:
+	"""
+	A context recording one instrumented call, in the calling thread.
+
+	Worker threads that do part of the call can `attach` to it, so
+	their stages are counted too.
+
+	Parameters
+	----------
+	operation : str
+		The name of the public method called.
+	callback : callable
+		Called with the event dict when the call completes.
+	cache : ColumnCache, optional
+		The column cache, to count hits and misses during the call.
+	"""
+
+	__slots__ = ('operation', 'callback', 'cache', 'event', '_lock', '_start', '_cache_start')
+
+	def __init__(self, operation, callback, cache=None):
+		self.operation = operation
+		self.callback = callback
+		self.cache = cache
+		self.event = dict(
+			operation=operation, seconds=0.0, read=0.0, take=0.0, convert=0.0,
+			bytes_read=0, columns=0, takers=0, cache_hits=0, cache_misses=0,
+		)
+		self._lock = threading.Lock()
+
+	def add(self, stage, seconds, nbytes=0):
+		with self._lock:
+			self.event[stage] += seconds
+			self.event['bytes_read'] += nbytes
+
+	def count(self, columns=0, takers=0):
+		"""Count the columns and takers (cell positions) of the call."""
+		self.event['columns'] += columns
+		self.event['takers'] += takers
+
+	def attach(self):
+		"""Record stages in the current (worker) thread into this call."""
+		_local.call = self
+
+	@staticmethod
+	def detach():
+		_local.call = None
+
+	def __enter__(self):
+		_local.call = self
+		if self.cache is not None:
+			self._cache_start = (self.cache.hits, self.cache.misses)
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.event['seconds'] = time.perf_counter() - self._start
+		_local.call = None
+		if self.cache is not None:
+			self.event['cache_hits'] = self.cache.hits - self._cache_start[0]
+			self.event['cache_misses'] = self.cache.misses - self._cache_start[1]
+		if exc_type is None:
+			self.callback(self.event)
+
+
+def instrumented(operation):
+	"""
+	Decorate a public read method of `AbstractArrowMatrix`, to record its calls.
+
+	Calls are recorded only if the matrix has an instrumentation
+	callback, and are not nested, e.g. `get_rc_period` is recorded
+	as one 'get_rc' call.
+	"""
+	def decorate(method):
+		@functools.wraps(method)
+		def wrapper(self, *args, **kwargs):
+			callback = self._instrumentation
+			if callback is None or getattr(_local, 'call', None) is not None:
+				return method(self, *args, **kwargs)
+			with ReadCall(operation, callback, self._cache):
+				return method(self, *args, **kwargs)
+		return wrapper
+	return decorate
+
+
+def count(columns=0, takers=0):
+	"""Count the columns and takers (cell positions) of the current call, if any."""
+	call = getattr(_local, 'call', None)
+	if call is not None:
+		call.count(columns, takers)
+
+
+class ReadStats:
+	"""
+	Aggregate instrumentation events by operation.
+
+	A `ReadStats` is a callback for `AbstractArrowMatrix.instrument`.
+	It can be shared by several matrices, and across threads.
+
+	Parameters
+	----------
+	keep_events : bool, default False
+		Also keep every event, in `events`.
+	"""
+
+	def __init__(self, keep_events=False):
+		self._lock = threading.Lock()
+		self.totals = {}
+		self.events = [] if keep_events else None
+
+	def __call__(self, event):
+		with self._lock:
+			totals = self.totals.get(event['operation'])
+			if totals is None:
+				totals = self.totals[event['operation']] = dict.fromkeys(COUNTERS, 0)
+			totals['calls'] += 1
+			for key in COUNTERS[1:]:
+				totals[key] += event[key]
+			if self.events is not None:
+				self.events.append(event)
+
+	def reset(self):
+		"""Clear all aggregated stats and events."""
+		with self._lock:
+			self.totals = {}
+			if self.events is not None:
+				self.events = []
+
+	def to_dict(self):
+		"""
+		Export the aggregated stats.
+
+		Returns
+		-------
+		dict
+			Maps each operation to a dict of its `COUNTERS`, all
+			plain ints and floats, e.g. to send to another process
+			or to write as JSON.
+		"""
+		with self._lock:
+			return {operation: dict(totals) for operation, totals in self.totals.items()}
+
+	@classmethod
+	def from_dict(cls, totals):
+		"""Create stats from exported totals, as given by `to_dict`."""
+		stats = cls()
+		stats.merge(totals)
+		return stats
+
+	def merge(self, *others):
+		"""
+		Add the stats of others, e.g. from other processes.
+
+		Parameters
+		----------
+		*others : ReadStats or dict
+			Stats, or totals exported with `to_dict`.
+
+		Returns
+		-------
+		ReadStats
+			This object, with the others added.
+		"""
+		for other in others:
+			if isinstance(other, ReadStats):
+				other = other.to_dict()
+			with self._lock:
+				for operation, totals in other.items():
+					mine = self.totals.setdefault(operation, dict.fromkeys(COUNTERS, 0))
+					for key in COUNTERS:
+						mine[key] += totals.get(key, 0)
+		return self
+
+	def to_frame(self):
+		"""
+		Get the aggregated stats as a DataFrame.
+
+		Returns
+		-------
+		pandas.DataFrame
+			One row per operation, one column per counter.
+		"""
+		return pd.DataFrame.from_dict(self.to_dict(), orient='index', columns=list(COUNTERS))
+
+	def __repr__(self):
+		return f"<ReadStats {self.to_dict()}>"
@@ -0,0 +1,132 @@
+"""
+Zone ID lookups, to index matrices by label instead of by position.
+
+One dimensional lookup arrays (e.g. the TAZ number of each zone) are
+stored in the 'LOOKUP' metadata, as a zstd compressed Feather buffer,
+and are used to translate labels to positions with `LookupIndex`.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as pf
+
+# Integer labels are translated through a dense array of positions when
+# the range of labels is at most this many times the number of labels,
+# otherwise through a hash table.
+DENSE_LOOKUP_FACTOR = 4
+
+
+class LookupIndex:
+	"""
+	A vectorized index from labels to positions.
+
+	Integer labels with a compact range (even if not contiguous) are
+	translated with a single gather from a dense array of positions.
+	Other labels are translated through a hash table (a pandas
+	Index).  Either way, no Python objects are created per label.
+
+	Parameters
+	----------
+	labels : array-like
+		The label at each position.  Labels must be unique.
+	"""
+
+	def __init__(self, labels):
+		labels = np.asarray(labels)
+		self.labels = labels
+		self._dense = None
+		self._hashed = None
+		if labels.size and labels.dtype.kind in 'iu':
+			lo, hi = int(labels.min()), int(labels.max())
+			if hi - lo + 1 <= DENSE_LOOKUP_FACTOR * labels.size + 1024:
+				dense = np.full(hi - lo + 1, -1, dtype=np.int64)
+				dense[labels - lo] = np.arange(labels.size)
+				if np.count_nonzero(dense >= 0) != labels.size:
+					raise ValueError("lookup labels are not unique")
+				self._dense = dense
+				self._lo = lo
+				return
+		hashed = pd.Index(labels)
+		if not hashed.is_unique:
+			raise ValueError("lookup labels are not unique")
+		self._hashed = hashed
+
+	def __len__(self):
+		return self.labels.size
+
+	def positions(self, labels):
+		"""
+		Translate labels to positions.
+
+		Parameters
+		----------
+		labels : array-like
+
+		Returns
+		-------
+		numpy.ndarray
+			The positions, with the same shape as `labels`.
+
+		Raises
+		------
+		KeyError
+			If any label is not in the lookup.
+		"""
+		labels = np.asarray(labels)
+		if self._dense is not None:
+			if labels.dtype.kind not in 'iu':
+				raise KeyError(f"lookup has integer labels, not {labels.dtype}")
+			offsets = labels.astype(np.int64) - self._lo
+			valid = (offsets >= 0) & (offsets < self._dense.size)
+			result = self._dense[np.where(valid, offsets, 0)]
+			found = valid & (result >= 0)
+		else:
+			result = self._hashed.get_indexer(labels.reshape(-1)).reshape(labels.shape)
+			found = result >= 0
+		if not np.all(found):
+			missing = np.unique(labels[~found])
+			raise KeyError(f"labels not found in lookup: {missing[:10].tolist()}")
+		return result
+
+
+def lookup_metadata(metadata, lookups):
+	"""
+	Store lookups in schema metadata.
+
+	Parameters
+	----------
+	metadata : dict or None
+		Existing schema metadata.
+	lookups : pyarrow.Table
+		One column for each lookup.
+
+	Returns
+	-------
+	dict
+	"""
+	from .util import to_simple_buffer
+	metadata = dict(metadata or {})
+	if lookups.num_columns:
+		lookups = lookups.replace_schema_metadata(None)
+		metadata[b'LOOKUP'] = to_simple_buffer(lookups).to_pybytes()
+	return metadata
+
+
+def read_lookups(metadata):
+	"""
+	Read lookups from schema metadata.
+
+	Parameters
+	----------
+	metadata : dict or None
+
+	Returns
+	-------
+	dict
+		Maps lookup names to numpy arrays.
+	"""
+	if not metadata or b'LOOKUP' not in metadata:
+		return {}
+	table = pf.read_table(pa.BufferReader(metadata[b'LOOKUP']))
+	return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
@@ -0,0 +1,163 @@
+"""
+Update matrices in an arrowmatrix file without rewriting it.
+
+`AbstractArrowMatrix.update` writes new or replacement matrices to an
+overlay next to the file, '<filename>.overlay', which is an
+`ArrowMatrixDataset` of uncompressed Feather files, one per update.
+When a file with an overlay is opened, matrices in the overlay hide any
+matrices of the same name in the file, and new matrices are appended,
+so the cost of an update scales with the updated data, not the file.
+`AbstractArrowMatrix.compact` merges the overlay back into the file.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import numpy as np
+import pyarrow as pa
+
+from .statistics import statistics_path, remove_statistics
+
+OVERLAY_SUFFIX = '.overlay'
+
+# The writer options for overlay files.  Uncompressed Feather files are
+# fast to write, and read as zero-copy views of the memory-mapped file.
+OVERLAY_WRITE_OPTIONS = dict(compression='uncompressed')
+
+
+def overlay_path(filename):
+	"""The path of the overlay of a file."""
+	return os.fspath(filename) + OVERLAY_SUFFIX
+
+
+def has_overlay(filename):
+	"""Whether a file (given as a path) has an overlay."""
+	return isinstance(filename, (str, os.PathLike)) and os.path.isdir(overlay_path(filename))
+
+
+class Overlay:
+	"""
+	The updates of a file, and the schema of the file with them applied.
+
+	Matrices in the overlay hide matrices of the same name in the file,
+	and new matrices are added after the others.  Reads of updated
+	matrices are routed here by `AbstractArrowMatrix`.
+
+	Parameters
+	----------
+	filename : path-like
+		The updated file.
+	schema : pyarrow.Schema
+		The schema of the data stored in the file.
+	"""
+
+	def __init__(self, filename, schema):
+		from .dataset import ArrowMatrixDataset
+		self.dataset = ArrowMatrixDataset(overlay_path(filename))
+		overlay_schema = self.dataset.schema
+		updated = set(overlay_schema.names)
+		fields = [
+			overlay_schema.field(name) if name in updated else schema.field(name)
+			for name in schema.names
+		]
+		fields += [field for field in overlay_schema if field.name not in schema.names]
+		metadata = dict(schema.metadata or {})
+		if b'DOWNCAST' in metadata:
+			# updated matrices are stored as given
+			downcasts = {
+				name: original for name, original in json.loads(metadata[b'DOWNCAST']).items()
+				if name not in updated
+			}
+			metadata[b'DOWNCAST'] = json.dumps(downcasts).encode()
+		self.updated = updated
+		self.schema = pa.schema(fields, metadata=metadata)
+
+	def split(self, names):
+		"""Split names into the updated ones, and the ones stored in the file."""
+		updated = [name for name in names if name in self.updated]
+		return updated, [name for name in names if name not in self.updated]
+
+	def combine(self, names, *tables):
+		"""Assemble the named columns from tables of updated and stored columns."""
+		columns = {}
+		for table in tables:
+			columns.update(zip(table.column_names, table.columns))
+		return pa.Table.from_arrays(
+			[columns[name] for name in names],
+			names=list(names),
+			metadata=self.schema.metadata,
+		)
+
+	def read_statistics(self, stats, by_position=True):
+		"""Replace the statistics of updated matrices in statistics of the file."""
+		stats = {
+			key: value for key, value in (stats or {}).items()
+			if key[0] not in self.updated
+		}
+		stats.update(self.dataset._read_statistics(by_position) or {})
+		return stats or None
+
+
+def update(mx, matrices, **kwargs):
+	"""
+	Write new or replacement matrices to the overlay of a file.
+
+	See `AbstractArrowMatrix.update`.
+	"""
+	from .dataset import ArrowMatrixDataset
+	if not mx._updatable or not isinstance(mx.filename, (str, os.PathLike)) or not os.path.isfile(mx.filename):
+		raise TypeError(f"only matrices opened from a file can be updated, not {mx.filename!r}")
+	matrices = {name: np.asarray(arr) for name, arr in matrices.items()}
+	for name, arr in matrices.items():
+		if arr.shape != mx.shape:
+			raise ValueError(f"{name} has shape {arr.shape}, the matrices have shape {mx.shape}")
+	path = overlay_path(mx.filename)
+	if os.path.isdir(path):
+		overlay = ArrowMatrixDataset(path)
+	else:
+		overlay = ArrowMatrixDataset.create(path, mx.shape, omx_version=mx.omx_version, tile=mx.tile)
+	# earlier updates of the same matrices are superseded
+	for group, names in overlay.groups.items():
+		kept = [name for name in names if name not in matrices]
+		if not kept:
+			overlay.remove_group(group)
+		elif len(kept) < len(names):
+			overlay.write_group(group, overlay, names=kept, **OVERLAY_WRITE_OPTIONS)
+	groups = overlay.groups
+	number = 1 + max((int(group.rpartition('-')[2]) for group in groups), default=0)
+	from .feather import FeatherMatrix
+	overlay.write_group(
+		f"update-{number:04d}", matrices, file_cls=FeatherMatrix,
+		**{**OVERLAY_WRITE_OPTIONS, **kwargs},
+	)
+	for name in matrices:
+		with mx._prefetch_lock:
+			mx._prefetched.pop(name, None)
+		if mx._cache is not None:
+			mx._cache.discard(name)
+	mx._overlay = Overlay(mx.filename, mx._storage_schema)
+	mx.__dict__.pop('statistics', None)
+	mx.__dict__.pop('_whole_statistics', None)
+
+
+def compact(mx, to_filename=None, **kwargs):
+	"""
+	Rewrite a file with its overlay merged in.
+
+	See `AbstractArrowMatrix.compact`.
+	"""
+	cls = type(mx)
+	target = os.fspath(to_filename if to_filename is not None else mx.filename)
+	temp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+	if 'statistics' not in kwargs:
+		kwargs['statistics'] = b'STATISTICS' in (mx._storage_schema.metadata or {})
+	cls.from_arrow(mx, temp, names=mx.list_matrices(), tile=mx.tile, **kwargs)
+	os.replace(temp, target)
+	if os.path.exists(statistics_path(temp)):
+		os.replace(statistics_path(temp), statistics_path(target))
+	else:
+		remove_statistics(target)
+	if to_filename is None and has_overlay(mx.filename):
+		shutil.rmtree(overlay_path(mx.filename))
+	return cls(target)
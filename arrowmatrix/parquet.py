@@ -1,11 +1,150 @@
 import os
 import ast
 import warnings
+import itertools
 import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
-from .common import AbstractArrowMatrix
+from .common import AbstractArrowMatrix, column_options, table_tile, tile_sizes, _offset_chunk_bounds
+from .instrument import timed
+
+# Default target number of cells per row group when writing.  Row groups
+# are aligned to whole origin rows, so the actual size is rounded down to
+# a multiple of the number of cells in one origin row (but never less than
+# one origin row).
+ROW_GROUP_TARGET_CELLS = 65536
+
+
+def origin_aligned_row_group_size(shape, origins_per_row_group=None):
+	"""
+	Compute a row group size that holds a whole number of origin rows.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrix being written.
+	origins_per_row_group : int, optional
+		The number of origin rows (i.e. positions on the first
+		dimension) to store in each row group.  If not given, as
+		many whole origin rows as fit in `ROW_GROUP_TARGET_CELLS`
+		are used.
+
+	Returns
+	-------
+	int
+	"""
+	row_cells = int(np.prod(shape[1:]))
+	if origins_per_row_group is None:
+		origins_per_row_group = max(1, ROW_GROUP_TARGET_CELLS // max(row_cells, 1))
+	return int(origins_per_row_group) * row_cells
+
+
+def _resolve_column_options(names, kwargs):
+	if 'compression' in kwargs:
+		kwargs['compression'] = column_options(names, kwargs['compression'], default='snappy')
+	if 'compression_level' in kwargs:
+		kwargs['compression_level'] = column_options(names, kwargs['compression_level'])
+
+
+def tile_row_group_sizes(shape, tile):
+	"""
+	Compute the row group sizes of a tiled file.
+
+	Consecutive tiles are grouped into row groups of up to
+	`ROW_GROUP_TARGET_CELLS` cells (but at least one tile), so reads
+	of a subregion decompress only the groups of tiles that cover it,
+	while the number of row groups, and the size of the footer, stay
+	moderate for files with many small tiles and many matrices.
+	Groups never span two rows of tiles, so that slabs of whole rows
+	of tiles fill whole row groups.
+
+	Parameters
+	----------
+	shape : tuple
+		The shape of the matrix being written.
+	tile : tuple
+		The normalized tile shape.
+
+	Returns
+	-------
+	list[int]
+	"""
+	sizes = tile_sizes(shape, tile)
+	tiles_per_row = len(sizes) // -(-shape[0] // tile[0]) if sizes else 1
+	groups = []
+	for first in range(0, len(sizes), tiles_per_row):
+		group = 0
+		for size in sizes[first:first + tiles_per_row]:
+			if group and group + size > ROW_GROUP_TARGET_CELLS:
+				groups.append(group)
+				group = 0
+			group += size
+		groups.append(group)
+	return groups
+
+
+def _row_group_sizes(schema, shape, origins_per_row_group=None):
+	"""
+	The row group sizes for writing a file, as an int or a list of ints.
+
+	Tiled files get row groups of whole tiles, see `tile_row_group_sizes`.
+	Otherwise row groups are aligned to origin rows.
+	"""
+	tile = table_tile(schema)
+	if tile is not None:
+		return tile_row_group_sizes(shape, tile)
+	return origin_aligned_row_group_size(shape, origins_per_row_group)
+
+
+class _RowGroupWriter:
+	"""
+	Write consecutive slices of a table to Parquet in fixed size row groups.
+
+	Slices are buffered until a full row group is available, so
+	that the row groups in the output file stay aligned to origin
+	rows (or tiles) regardless of the size of the slices written.
+
+	Parameters
+	----------
+	filename : path-like
+	schema : pyarrow.Schema
+	row_group_size : int or Sequence[int]
+		The size of every row group, or of each row group in turn.
+	**kwargs
+		Passed to `pyarrow.parquet.ParquetWriter`.
+	"""
+
+	def __init__(self, filename, schema, row_group_size, **kwargs):
+		if isinstance(row_group_size, (int, np.integer)):
+			self._sizes = itertools.repeat(int(row_group_size))
+		else:
+			self._sizes = iter(row_group_size)
+		self._next_size = next(self._sizes, None)
+		self._writer = pq.ParquetWriter(filename, schema, **kwargs)
+		self._pending = []
+		self._pending_rows = 0
+
+	def write(self, table):
+		self._pending.append(table)
+		self._pending_rows += table.num_rows
+		if self._next_size is not None and self._pending_rows >= self._next_size:
+			pending = pa.concat_tables(self._pending)
+			offset = 0
+			while self._next_size is not None and self._pending_rows - offset >= self._next_size:
+				size = self._next_size
+				self._writer.write_table(pending.slice(offset, size), row_group_size=size)
+				offset += size
+				self._next_size = next(self._sizes, None)
+			self._pending = [pending.slice(offset)]
+			self._pending_rows -= offset
+
+	def close(self):
+		if self._pending_rows:
+			self._writer.write_table(pa.concat_tables(self._pending), row_group_size=self._pending_rows)
+		self._pending = []
+		self._pending_rows = 0
+		self._writer.close()
 
 
 class ParquetMatrix(AbstractArrowMatrix):
@@ -16,25 +155,210 @@ class ParquetMatrix(AbstractArrowMatrix):
 			omx_version=None,
 			shape=None,
 			buffer=False,
+			cache_bytes=None,
+			memory_map=False,
 	):
-		if buffer:
-			filename = pa.py_buffer(pa.input_stream(filename).read())
-		self.parquet_file = pq.ParquetFile(filename)
-		schema = pq.read_schema(filename)
+		"""
+		Open a Parquet format arrowmatrix.
+
+		Parameters
+		----------
+		filename : path-like or pyarrow.NativeFile or pyarrow.Buffer
+			The file to open.  An already open file, such as a
+			`pyarrow.MemoryMappedFile`, can be given.
+		buffer : bool, default False
+			Access the file through a single memory-mapped buffer.
+			The file is not copied into process memory, so many
+			processes opening the same file share the OS page cache.
+		cache_bytes : int, optional
+			Enable a least-recently-used cache of decoded columns,
+			holding at most this many bytes.
+		memory_map : bool, default False
+			Memory map the file when reading it, if `filename` is a path.
+		"""
+		if buffer and isinstance(filename, (str, os.PathLike)):
+			filename = pa.memory_map(str(filename)).read_buffer()
+		self.parquet_file = pq.ParquetFile(filename, memory_map=memory_map)
+		# the schema, with metadata, comes from the footer already parsed above
+		schema = self.parquet_file.schema_arrow
 		shape = ast.literal_eval(schema.metadata[b'SHAPE'].decode())
 		omx_version = schema.metadata[b'OMX_VERSION'].decode()
 		num_rows = self.parquet_file.metadata.num_rows
 		if np.prod(shape) != num_rows:
 			warnings.warn(f"{self.__class__.__name__} shape {shape} not consistent with {num_rows} rows")
-		super().__init__(filename=filename, shape=shape, omx_version=omx_version)
+		metadata = self.parquet_file.metadata
+		self._row_group_offsets = np.cumsum(
+			[0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+		)
+		super().__init__(
+			filename=filename,
+			shape=shape,
+			omx_version=omx_version,
+			cache_bytes=cache_bytes,
+		)
 
-	def _get_arrow_table(self, names=None):
+	@property
+	def _storage_schema(self):
+		return self.parquet_file.schema_arrow
+
+	def _read_arrow_table(self, names=None):
 		return self.parquet_file.read(columns=names)
 
+	def _take(self, names, takers):
+		"""
+		Get a pyarrow.Table of named columns, at the given flat positions.
+
+		Only the row groups that contain at least one of the
+		requested positions are read and decompressed.  If the
+		column cache is enabled, or the columns were prefetched,
+		whole columns are used instead.
+		"""
+		takers = np.asarray(takers).reshape(-1)
+		if takers.size == 0:
+			return self.schema.empty_table().select(list(names))
+		if self._reads_whole_columns(names) or self._routes_to_overlay(names):
+			return super()._take(names, takers)
+		offsets = self._row_group_offsets
+		if len(offsets) <= 2:
+			return super()._take(names, takers)
+		group_of = np.searchsorted(offsets, takers, side='right') - 1
+		groups = np.unique(group_of)
+		if len(groups) == len(offsets) - 1:
+			return super()._take(names, takers)
+		group_sizes = offsets[groups + 1] - offsets[groups]
+		local_starts = np.cumsum(group_sizes) - group_sizes
+		local_takers = (
+			takers
+			- offsets[group_of]
+			+ local_starts[np.searchsorted(groups, group_of)]
+		)
+		table = timed('read', self.parquet_file.read_row_groups, groups, columns=names)
+		return timed('take', table.take, local_takers)
+
+	def _read_span(self, names, start, stop):
+		"""
+		Get a pyarrow.Table of named columns, for a contiguous range of flat positions.
+
+		Only the row groups that overlap the range are read and
+		decompressed, unless whole columns are cached or prefetched.
+		"""
+		offsets = self._row_group_offsets
+		if (
+				self._reads_whole_columns(names) or self._routes_to_overlay(names)
+				or len(offsets) <= 2 or stop <= start
+		):
+			return super()._read_span(names, start, stop)
+		first = np.searchsorted(offsets, start, side='right') - 1
+		last = np.searchsorted(offsets, stop - 1, side='right') - 1
+		table = timed('read', self.parquet_file.read_row_groups, range(first, last + 1), columns=names)
+		return table.slice(start - offsets[first], stop - start)
+
+	def _storage_min_max(self, name):
+		"""
+		Get the minimum and maximum of a matrix from row group statistics.
+
+		Only the file footer is read.  Returns None if any row group
+		lacks statistics for the column.
+		"""
+		metadata = self.parquet_file.metadata
+		column = self._storage_schema.get_field_index(name)
+		mins = []
+		maxs = []
+		for i in range(metadata.num_row_groups):
+			statistics = metadata.row_group(i).column(column).statistics
+			if statistics is None or not statistics.has_min_max:
+				return None
+			mins.append(statistics.min)
+			maxs.append(statistics.max)
+		if not mins:
+			return None
+		return min(mins), max(maxs)
+
+	def _chunk_bounds(self, chunk_cells):
+		"""
+		Split the flat storage positions into chunks of whole row groups.
+
+		Consecutive row groups are combined until each chunk holds at
+		least `chunk_cells` cells, so no row group is decompressed
+		more than once.
+		"""
+		return _offset_chunk_bounds(self._row_group_offsets, chunk_cells)
+
 	@staticmethod
-	def _write_arrow_table(filename, table, shape, **kwargs):
+	def _write_arrow_table(filename, table, shape, origins_per_row_group=None, **kwargs):
+		"""
+		Write to Parquet format.
+
+		Parameters
+		----------
+		filename : str
+			Local destination path.
+		table : pyarrow.Table
+			Data to write out as Parquet format.
+		shape : list-like
+			Dimensions of the matrix being written.
+		origins_per_row_group : int, optional
+			The number of origin rows to store in each row group.
+			Row groups are aligned to whole origin rows, so that
+			`get_rc` can read only the row groups containing the
+			requested cells.  Ignored if `row_group_size` is given,
+			or if the table is tiled, in which case row groups hold
+			whole tiles (see `tile_row_group_sizes`).
+		compression : str or dict, default 'snappy'
+			The compression codec.  Can be given as a dict mapping
+			wildcard patterns of matrix names to codecs, to use
+			different codecs for different matrices.  Matrices that
+			match no pattern use 'snappy'.
+		compression_level : int or dict, optional
+			The compression level, optionally given as a dict mapping
+			wildcard patterns of matrix names to levels.
+		**kwargs
+			Other keyword arguments are passed to `pyarrow.parquet.write_table`.
+		"""
+		_resolve_column_options(table.column_names, kwargs)
+		if 'row_group_size' not in kwargs and table_tile(table) is not None:
+			writer = _RowGroupWriter(filename, table.schema, _row_group_sizes(table.schema, shape), **kwargs)
+			writer.write(table)
+			writer.close()
+			return
+		if 'row_group_size' not in kwargs and shape is not None:
+			kwargs['row_group_size'] = origin_aligned_row_group_size(
+				shape, origins_per_row_group,
+			)
 		pq.write_table(table=table, where=filename, **kwargs)
 
-	def list_matrices(self):
-		return self.parquet_file.schema.names
+	@staticmethod
+	def _open_writer(filename, schema, shape, origins_per_row_group=None, slab_rows=None, **kwargs):
+		"""
+		Open a writer to build a Parquet file incrementally.
+
+		Tables written are buffered until they fill a row group, so
+		row groups are capped at `slab_rows` origin rows, to keep at
+		most one slab in memory.
 
+		Parameters
+		----------
+		filename : str
+			Local destination path.
+		schema : pyarrow.Schema
+			The schema of the data, including any required metadata.
+		shape : list-like
+			Dimensions of the matrix being written.
+		origins_per_row_group : int, optional
+			The number of origin rows to store in each row group.
+			Ignored if `row_group_size` is given, or if the schema
+			is tiled, in which case row groups hold whole tiles.
+		slab_rows : int, optional
+			The most origin rows in each table written.
+		**kwargs
+			Other keyword arguments are passed to `pyarrow.parquet.ParquetWriter`.
+		"""
+		_resolve_column_options(schema.names, kwargs)
+		row_group_size = kwargs.pop('row_group_size', None)
+		if row_group_size is None and slab_rows is not None and table_tile(schema) is None:
+			row_cells = max(1, int(np.prod(shape[1:])))
+			origins = origin_aligned_row_group_size(shape, origins_per_row_group) // row_cells
+			origins_per_row_group = min(origins, slab_rows)
+		if row_group_size is None:
+			row_group_size = _row_group_sizes(schema, shape, origins_per_row_group)
+		return _RowGroupWriter(filename, schema, row_group_size, **kwargs)
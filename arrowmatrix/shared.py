@@ -0,0 +1,253 @@
+"""
+Share decoded matrices between processes through POSIX shared memory.
+
+A parent process publishes matrices from an arrowmatrix file once,
+decoding each matrix into a shared memory block.  Worker processes then
+attach to the published data by name, and read from it through the
+usual `get_rc`, `get_matrix` and `__getitem__` API without copying or
+decoding anything.
+
+    >>> publisher = publish("skims.pmx", names)       # in the parent
+    >>> mx = attach(publisher.name)                   # in each worker
+
+The parent owns the shared memory, and must call `publisher.close()`
+(or use the publisher as a context manager) to release it.  Workers
+should be child processes of the publisher, so that they share its
+resource tracker.
+"""
+
+import os
+import sys
+import json
+import secrets
+import numpy as np
+import pyarrow as pa
+from multiprocessing import shared_memory
+
+from .common import AbstractArrowMatrix
+
+# offsets of each matrix in the data block are aligned to this many bytes
+ALIGNMENT = 64
+
+
+def _attach_shared_memory(name):
+	if sys.version_info >= (3, 13):
+		return shared_memory.SharedMemory(name=name, track=False)
+	return shared_memory.SharedMemory(name=name)
+
+
+def _encode_metadata(metadata):
+	return {
+		k.decode('latin-1'): v.decode('latin-1')
+		for k, v in (metadata or {}).items()
+	}
+
+
+def _decode_metadata(metadata):
+	return {
+		k.encode('latin-1'): v.encode('latin-1')
+		for k, v in metadata.items()
+	}
+
+
+class SharedMatrixPublisher:
+	"""
+	Decoded matrices published to shared memory.
+
+	Parameters
+	----------
+	source : path-like or AbstractArrowMatrix
+		The arrowmatrix to publish.
+	names : Collection[str], optional
+		The matrices to publish.  Defaults to all matrices.
+	name : str, optional
+		The name of the shared memory manifest, which workers use
+		to attach.  A unique name is generated if not given.
+	"""
+
+	def __init__(self, source, names=None, name=None):
+		if not isinstance(source, AbstractArrowMatrix):
+			from . import open_matrix
+			source = open_matrix(source)
+		if names is None:
+			names = source.list_matrices()
+		names = list(names)
+		if name is None:
+			name = f"amx_{os.getpid()}_{secrets.token_hex(4)}"
+		self.name = name
+		size = int(np.prod(source.shape))
+		fields = {field.name: field for field in source.schema}
+		matrices = []
+		offset = 0
+		for matrix_name in names:
+			dtype = np.dtype(fields[matrix_name].type.to_pandas_dtype())
+			matrices.append([matrix_name, dtype.str, offset])
+			offset += -(-size * dtype.itemsize // ALIGNMENT) * ALIGNMENT
+		self._data = shared_memory.SharedMemory(
+			name=f"{name}_data", create=True, size=max(offset, 1),
+		)
+		try:
+			# matrices are decoded and copied one at a time
+			for matrix_name, dtype, offset in matrices:
+				target = np.ndarray(size, dtype=dtype, buffer=self._data.buf, offset=offset)
+				target[:] = source.get_matrix(matrix_name).reshape(-1)
+				del target
+			manifest = json.dumps(dict(
+				data=self._data.name,
+				shape=list(source.shape),
+				omx_version=source.omx_version,
+				# matrices are published in row-major order, even from tiled files
+				metadata=_encode_metadata({
+					k: v for k, v in (source.schema.metadata or {}).items()
+					if k != b'TILE'
+				}),
+				matrices=matrices,
+			)).encode()
+			self._manifest = shared_memory.SharedMemory(
+				name=name, create=True, size=len(manifest),
+			)
+		except BaseException:
+			self._data.close()
+			self._data.unlink()
+			raise
+		self._manifest.buf[:len(manifest)] = manifest
+
+	@property
+	def nbytes(self):
+		"""int : The size of the shared data block."""
+		return self._data.size
+
+	def close(self):
+		"""Release and remove the shared memory.  Attached workers should detach first."""
+		for shm in (self._manifest, self._data):
+			if shm is not None:
+				try:
+					shm.close()
+				except BufferError:
+					# still viewed by a matrix attached in this process
+					pass
+				shm.unlink()
+		self._manifest = self._data = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+
+
+class SharedMatrix(AbstractArrowMatrix):
+	"""
+	A read-only, zero-copy view of matrices published to shared memory.
+
+	Parameters
+	----------
+	name : str
+		The name of the published shared memory manifest.
+	cache_bytes : int, optional
+		Enable a least-recently-used cache of decoded columns,
+		holding at most this many bytes.  This is rarely useful,
+		as shared matrices are already decoded.
+	"""
+
+	_updatable = False
+
+	def __init__(self, name, cache_bytes=None):
+		self._manifest_shm = _attach_shared_memory(name)
+		manifest = json.loads(bytes(self._manifest_shm.buf).rstrip(b'\x00'))
+		self._data_shm = _attach_shared_memory(manifest['data'])
+		shape = tuple(manifest['shape'])
+		size = int(np.prod(shape))
+		self._arrays = {}
+		fields = []
+		for matrix_name, dtype, offset in manifest['matrices']:
+			arr = np.ndarray(size, dtype=dtype, buffer=self._data_shm.buf, offset=offset)
+			arr.flags.writeable = False
+			self._arrays[matrix_name] = arr
+			fields.append(pa.field(matrix_name, pa.from_numpy_dtype(arr.dtype)))
+		self._schema = pa.schema(fields, metadata=_decode_metadata(manifest['metadata']))
+		super().__init__(
+			filename=name,
+			shape=shape,
+			omx_version=manifest['omx_version'],
+			cache_bytes=cache_bytes,
+		)
+
+	@property
+	def _storage_schema(self):
+		return self._schema
+
+	def _column_array(self, name):
+		return self._arrays[name]
+
+	def _read_arrow_table(self, names=None):
+		if names is None:
+			names = self.list_matrices()
+		return pa.Table.from_arrays(
+			[pa.array(self._arrays[name]) for name in names],
+			schema=pa.schema(
+				[self._schema.field(name) for name in names],
+				metadata=self._schema.metadata,
+			),
+		)
+
+	@staticmethod
+	def _write_arrow_table(filename, table, shape, **kwargs):
+		raise TypeError("cannot write a SharedMatrix, use publish instead")
+
+	@staticmethod
+	def _open_writer(filename, schema, shape, **kwargs):
+		raise TypeError("cannot write a SharedMatrix, use publish instead")
+
+	def close(self):
+		"""Detach from the shared memory.  Arrays obtained from this matrix become invalid."""
+		self._arrays = {}
+		if self._cache is not None:
+			self._cache.clear()
+		for shm in (self._manifest_shm, self._data_shm):
+			try:
+				shm.close()
+			except BufferError:
+				# arrays viewing the shared memory are still alive elsewhere,
+				# the mapping is released when they are garbage collected
+				pass
+
+
+def publish(source, names=None, name=None):
+	"""
+	Publish decoded matrices to shared memory.
+
+	Parameters
+	----------
+	source : path-like or AbstractArrowMatrix
+		The arrowmatrix to publish.
+	names : Collection[str], optional
+		The matrices to publish.  Defaults to all matrices.
+	name : str, optional
+		The name of the shared memory manifest, which workers use
+		to attach.  A unique name is generated if not given.
+
+	Returns
+	-------
+	SharedMatrixPublisher
+	"""
+	return SharedMatrixPublisher(source, names=names, name=name)
+
+
+def attach(name, cache_bytes=None):
+	"""
+	Attach to matrices published to shared memory.
+
+	Parameters
+	----------
+	name : str
+		The name of the published shared memory manifest, i.e.
+		`SharedMatrixPublisher.name`.
+	cache_bytes : int, optional
+		Enable a least-recently-used cache of decoded columns.
+
+	Returns
+	-------
+	SharedMatrix
+	"""
+	return SharedMatrix(name, cache_bytes=cache_bytes)
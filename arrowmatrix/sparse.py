@@ -0,0 +1,269 @@
+import ast
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as pf
+from .common import AbstractArrowMatrix, _column_to_numpy
+from .instrument import timed
+
+
+def _exact_cast(dtype, to_dtype):
+	"""Whether every value of a data type can be stored in another without change."""
+	if not np.can_cast(dtype, to_dtype, 'safe'):
+		return False
+	# numpy counts integers as safely cast to floats, even beyond their significand
+	if dtype.kind in 'iu' and to_dtype.kind in 'fc':
+		return dtype.itemsize * 8 <= np.finfo(to_dtype).nmant + 1
+	return True
+
+
+def _value_columns(dtypes):
+	"""
+	Choose the column storing the values of matrices of each data type.
+
+	Values are stored in a single 'value' column of the common type of
+	all matrices, unless that type cannot hold some of them exactly
+	(e.g. int64 with float64, which rounds integers beyond 2**53), in
+	which case those matrices are stored in a 'value_int' column.
+
+	Parameters
+	----------
+	dtypes : Collection[numpy.dtype]
+
+	Returns
+	-------
+	dict, dict
+		The column of each data type, and the data type of each column.
+	"""
+	dtypes = set(dtypes)
+	if not dtypes:
+		return {}, {'value': np.dtype(np.float64)}
+	common = np.result_type(*dtypes)
+	separate = {dtype for dtype in dtypes if not _exact_cast(dtype, common)}
+	groups = {'value': dtypes - separate, 'value_int': separate}
+	column_dtypes = {
+		column: np.result_type(*members)
+		for column, members in groups.items() if members
+	}
+	for column, members in groups.items():
+		for dtype in members:
+			if not _exact_cast(dtype, column_dtypes[column]):
+				raise ValueError(f"cannot store matrices of types {sorted(map(str, dtypes))} without rounding")
+	columns = {dtype: column for column, members in groups.items() for dtype in members}
+	return columns, column_dtypes
+
+
+_NO_STREAMING = "SparseMatrix files cannot be written by streaming, convert without memory_budget or processes"
+
+
+class SparseMatrix(AbstractArrowMatrix):
+	"""
+	An arrowmatrix that stores only the nonzero cells of each matrix.
+
+	The file is a Feather (Arrow IPC) file with two columns, the flat
+	(row-major) `index` of each stored cell and its `value`.  The cells
+	of each matrix are stored as one contiguous run, sorted by index,
+	and the location and data type of each run are recorded in the
+	'SPARSE' metadata.  Values are stored in the common data type of
+	the matrices, except integers that it cannot hold exactly, which
+	are stored in a second column, 'value_int' (see `_value_columns`).
+	Cells that are not stored have the fill value, which is zero.
+	Missing (NaN) values are stored explicitly.
+
+	Lookups find cells with a binary search of the sorted index of
+	each run, so no dense copy of a matrix is ever built by `get_rc`.
+
+	Parameters
+	----------
+	filename : path-like or pyarrow.Buffer
+		The file to open.
+	memory_map : bool, default True
+		Memory map the file instead of reading it into memory.
+	cache_bytes : int, optional
+		Enable a least-recently-used cache of decoded (dense) columns,
+		holding at most this many bytes.
+	"""
+
+	def __init__(self, filename, memory_map=True, cache_bytes=None):
+		self.filename = filename
+		table = pf.read_table(filename, memory_map=memory_map)
+		metadata = table.schema.metadata
+		sparse = json.loads(metadata[b'SPARSE'])
+		self.fill_value = sparse['fill_value']
+		self._index = _column_to_numpy(table.column('index'))
+		self._values = {
+			column: _column_to_numpy(table.column(column))
+			for column in table.column_names if column != 'index'
+		}
+		# runs name their value column only if it is not 'value'
+		self._runs = {
+			name: (np.dtype(dtype), start, stop, column[0] if column else 'value')
+			for name, dtype, start, stop, *column in sparse['matrices']
+		}
+		self._schema = pa.schema(
+			[
+				pa.field(name, pa.from_numpy_dtype(dtype))
+				for name, (dtype, *_) in self._runs.items()
+			],
+			metadata={k: v for k, v in metadata.items() if k != b'SPARSE'},
+		)
+		omx_version = metadata[b'OMX_VERSION'].decode()
+		shape = ast.literal_eval(metadata[b'SHAPE'].decode())
+		super().__init__(
+			filename=filename,
+			shape=shape,
+			omx_version=omx_version,
+			cache_bytes=cache_bytes,
+		)
+
+	@property
+	def _storage_schema(self):
+		return self._schema
+
+	def nnz(self, name):
+		"""int : The number of stored cells of a matrix."""
+		dtype, start, stop, column = self._runs[name]
+		return stop - start
+
+	def _run(self, name):
+		dtype, start, stop, column = self._runs[name]
+		return dtype, self._index[start:stop], self._values[column][start:stop]
+
+	def _dense_span(self, name, start, stop):
+		dtype, index, value = self._run(name)
+		lo, hi = np.searchsorted(index, [start, stop])
+		result = np.full(stop - start, self.fill_value, dtype=dtype)
+		result[index[lo:hi] - start] = value[lo:hi]
+		return result
+
+	def _read_arrow_table(self, names=None):
+		if names is None:
+			names = list(self._runs)
+		size = int(np.prod(self.shape))
+		return self._table_from_arrays(names, [self._dense_span(name, 0, size) for name in names])
+
+	def _read_span(self, names, start, stop):
+		if self._routes_to_overlay(names):
+			return super()._read_span(names, start, stop)
+		return timed('read', lambda: self._table_from_arrays(
+			names, [self._dense_span(name, start, stop) for name in names],
+		))
+
+	def _take(self, names, takers):
+		"""
+		Get a pyarrow.Table of named columns, at the given flat positions.
+
+		Each position is found by a binary search of the stored
+		indexes of each matrix.  If the column cache is enabled, or
+		the columns were prefetched, dense whole columns are used
+		instead.
+		"""
+		if self._reads_whole_columns(names) or self._routes_to_overlay(names):
+			return super()._take(names, takers)
+		return timed('take', self._search, names, np.asarray(takers).reshape(-1))
+
+	def _search(self, names, takers):
+		arrays = []
+		for name in names:
+			dtype, index, value = self._run(name)
+			pos = np.searchsorted(index, takers)
+			found = pos < len(index)
+			found[found] = index[pos[found]] == takers[found]
+			result = np.full(len(takers), self.fill_value, dtype=dtype)
+			result[found] = value[pos[found]]
+			arrays.append(result)
+		return self._table_from_arrays(names, arrays)
+
+	def _table_from_arrays(self, names, arrays):
+		return pa.Table.from_arrays(
+			[pa.array(arr) for arr in arrays],
+			schema=pa.schema(
+				[self._schema.field(name) for name in names],
+				metadata=self._schema.metadata,
+			),
+		)
+
+	@classmethod
+	def from_hdf5(cls, omx_file, to_filename, *, memory_budget=None, processes=None, **kwargs):
+		"""
+		Convert an HDF5 OMX file to a sparse arrowmatrix file.
+
+		The cells of each matrix are stored as one run, so the whole
+		file is loaded into memory and written at once; streaming with
+		`memory_budget` or `processes` is not supported.  See
+		`AbstractArrowMatrix.from_hdf5` for the other parameters.
+		"""
+		if memory_budget is not None or processes:
+			# before anything at `to_filename` is overwritten
+			raise TypeError(_NO_STREAMING)
+		return super().from_hdf5(omx_file, to_filename, **kwargs)
+
+	@staticmethod
+	def _write_arrow_table(filename, table, shape, **kwargs):
+		"""
+		Write to sparse Feather format.
+
+		Parameters
+		----------
+		filename : str
+			Local destination path.
+		table : pyarrow.Table
+			Dense data to write out in sparse format.
+		shape : list-like
+			Dimensions of the matrix being written.
+		compression : string, default None
+			Can be one of {"zstd", "lz4", "uncompressed"}. The default of None uses
+			LZ4 if it is available, otherwise uncompressed.
+		compression_level : int, default None
+			Use a compression level particular to the chosen compressor. If None
+			use the default compression level
+		"""
+		size = int(np.prod(shape))
+		index_dtype = np.int32 if size < 2**31 else np.int64
+		value_columns, column_dtypes = _value_columns(
+			[np.dtype(field.type.to_pandas_dtype()) for field in table.schema]
+		)
+		indexes = []
+		values = {column: [] for column in column_dtypes}
+		matrices = []
+		start = 0
+		for field, column in zip(table.schema, table.columns):
+			arr = column.to_numpy()
+			stored = arr != 0
+			if arr.dtype.kind == 'f':
+				stored |= np.isnan(arr)
+			index = np.flatnonzero(stored).astype(index_dtype)
+			indexes.append(index)
+			value_column = value_columns[np.dtype(field.type.to_pandas_dtype())]
+			for other, other_dtype in column_dtypes.items():
+				if other == value_column:
+					values[other].append(arr[index])
+				else:
+					# the other value column is zero in this run
+					values[other].append(np.zeros(len(index), other_dtype))
+			run = [field.name, arr.dtype.str, start, start + len(index)]
+			if value_column != 'value':
+				run.append(value_column)
+			matrices.append(run)
+			start += len(index)
+		metadata = {
+			k: v for k, v in (table.schema.metadata or {}).items()
+			if k != b'pandas'
+		}
+		metadata[b'SPARSE'] = json.dumps(dict(fill_value=0, matrices=matrices)).encode()
+		sparse_table = pa.table(
+			{
+				'index': np.concatenate(indexes) if indexes else np.empty(0, index_dtype),
+				**{
+					column: np.concatenate(values[column]).astype(column_dtypes[column])
+					if values[column] else np.empty(0, column_dtypes[column])
+					for column in column_dtypes
+				},
+			},
+		).replace_schema_metadata(metadata)
+		kwargs.setdefault('chunksize', max(sparse_table.num_rows, 1))
+		pf.write_feather(sparse_table, filename, **kwargs)
+
+	@staticmethod
+	def _open_writer(filename, schema, shape, **kwargs):
+		raise TypeError(_NO_STREAMING)
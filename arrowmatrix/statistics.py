@@ -0,0 +1,231 @@
+"""
+Precomputed statistics of the matrices in an arrowmatrix file.
+
+Statistics are computed when a file is written with `statistics=True`.
+For each matrix they hold the minimum, maximum, sum and count of nonzero
+values, for the whole matrix and for each position on each dimension
+(e.g. row sums and column maximums), so that queries like "max travel
+time from zone i" need not read any matrix data.
+
+The statistics of whole matrices are stored in the 'STATISTICS' metadata
+as a zstd compressed Feather buffer.  The statistics by position, which
+grow with the number of zones, are not: the schema metadata is read
+whenever a file is opened, and Parquet limits the size of the footer.
+Instead they are written to a zstd compressed Feather file next to the
+data file, '<filename>.stats', which is read only when needed, and is
+matched to the data file by a token in the 'AXIS_STATISTICS' metadata.
+
+Missing (NaN) values are ignored by every statistic.
+"""
+
+import os
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as pf
+
+STATISTICS = ('min', 'max', 'sum', 'count')
+
+STATISTICS_SUFFIX = '.stats'
+
+
+class StatisticsAccumulator:
+	"""
+	Accumulate statistics from consecutive slabs of origin rows.
+
+	Parameters
+	----------
+	names : Collection[str]
+		The names of the matrices.
+	shape : tuple
+		The shape of the matrices.
+	"""
+
+	def __init__(self, names, shape):
+		self.shape = tuple(shape)
+		self._stats = {
+			name: [
+				dict(
+					min=np.full(size, np.nan),
+					max=np.full(size, np.nan),
+					sum=np.zeros(size),
+					count=np.zeros(size, dtype=np.int64),
+				)
+				for size in self.shape
+			]
+			for name in names
+		}
+
+	def add(self, start, stop, arrays):
+		"""
+		Add the values of a slab.
+
+		Parameters
+		----------
+		start, stop : int
+			The origin rows (positions on the first dimension) in the slab.
+		arrays : Mapping[str, numpy.ndarray]
+			The values of each matrix for these rows, in row-major order.
+		"""
+		slab_shape = (stop - start, *self.shape[1:])
+		ndims = len(self.shape)
+		for name, values in arrays.items():
+			values = np.asarray(values).reshape(slab_shape)
+			if values.dtype.kind == 'f':
+				nonzero = (values != 0) & ~np.isnan(values)
+			else:
+				nonzero = values != 0
+			for d, stats in enumerate(self._stats[name]):
+				axes = tuple(a for a in range(ndims) if a != d)
+				target = slice(start, stop) if d == 0 else slice(None)
+				stats['min'][target] = np.fmin(stats['min'][target], np.fmin.reduce(values, axis=axes))
+				stats['max'][target] = np.fmax(stats['max'][target], np.fmax.reduce(values, axis=axes))
+				stats['sum'][target] += np.nansum(values, axis=axes)
+				stats['count'][target] += np.count_nonzero(nonzero, axis=axes)
+
+	def get(self, name, axis=None):
+		"""
+		Get the accumulated statistics of one matrix.
+
+		Parameters
+		----------
+		name : str
+		axis : int, optional
+			The dimension to get statistics by position on.  If
+			not given, get statistics of the whole matrix.
+
+		Returns
+		-------
+		dict
+			Maps each statistic to an array, with one value per
+			position on `axis`, or a single value.
+		"""
+		if axis is not None:
+			return dict(self._stats[name][axis])
+		row_stats = self._stats[name][0]
+		return dict(
+			min=np.fmin.reduce(row_stats['min'], keepdims=True),
+			max=np.fmax.reduce(row_stats['max'], keepdims=True),
+			sum=row_stats['sum'].sum(keepdims=True),
+			count=row_stats['count'].sum(keepdims=True),
+		)
+
+	def to_table(self):
+		"""
+		Get the accumulated statistics.
+
+		Returns
+		-------
+		pyarrow.Table
+			With one row per matrix and position on each dimension,
+			where `axis` is the dimension, plus one row for the whole
+			of each matrix, with `axis` and `position` of -1.
+		"""
+		frames = []
+		for name in self._stats:
+			for axis in [None, *range(len(self.shape))]:
+				stats = self.get(name, axis)
+				frames.append(pd.DataFrame(dict(
+					matrix=name,
+					axis=np.int8(-1 if axis is None else axis),
+					position=np.arange(len(stats['min']), dtype=np.int64) if axis is not None else np.int64(-1),
+					**stats,
+				)))
+		df = pd.concat(frames, ignore_index=True)
+		df['axis'] = df['axis'].astype(np.int8)
+		return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+
+
+def statistics_path(filename):
+	"""The path of the file of statistics by position of a data file."""
+	return os.fspath(filename) + STATISTICS_SUFFIX
+
+
+def statistics_metadata(metadata, statistics, filename=None):
+	"""
+	Store statistics of a file being written.
+
+	The statistics of whole matrices are stored in schema metadata.
+	The statistics by position are written to '<filename>.stats' if
+	`filename` is a path, and otherwise are not stored.
+
+	Parameters
+	----------
+	metadata : dict or None
+		Existing schema metadata.
+	statistics : pyarrow.Table
+		As given by `StatisticsAccumulator.to_table`.
+	filename : path-like, optional
+		The data file being written.
+
+	Returns
+	-------
+	dict
+	"""
+	from .util import to_simple_buffer
+	metadata = {
+		k: v for k, v in (metadata or {}).items()
+		if k not in (b'STATISTICS', b'AXIS_STATISTICS')
+	}
+	whole = pc.less(statistics['axis'], 0)
+	metadata[b'STATISTICS'] = to_simple_buffer(statistics.filter(whole)).to_pybytes()
+	if isinstance(filename, (str, os.PathLike)):
+		token = uuid.uuid4().hex.encode()
+		by_position = statistics.filter(pc.invert(whole))
+		pf.write_feather(
+			by_position.replace_schema_metadata({b'AXIS_STATISTICS': token}),
+			statistics_path(filename), compression='zstd',
+		)
+		metadata[b'AXIS_STATISTICS'] = token
+	return metadata
+
+
+def _statistics_dict(table, result):
+	df = table.to_pandas()
+	for (name, axis), group in df.groupby(['matrix', 'axis'], sort=False):
+		group = group.sort_values('position')
+		result[name, None if axis < 0 else int(axis)] = {
+			stat: group[stat].to_numpy() for stat in STATISTICS
+		}
+	return result
+
+
+def read_statistics(metadata, filename=None):
+	"""
+	Read statistics stored with a file.
+
+	Parameters
+	----------
+	metadata : dict or None
+		The schema metadata of the file.
+	filename : path-like, optional
+		The data file, to also read its statistics by position.
+		Otherwise only the statistics of whole matrices are read.
+
+	Returns
+	-------
+	dict or None
+		Maps (matrix name, axis) to a dict of arrays of each
+		statistic, ordered by position.  The whole matrix has
+		axis None.  None if there are no stored statistics.
+	"""
+	if not metadata or b'STATISTICS' not in metadata:
+		return None
+	result = _statistics_dict(pf.read_table(pa.BufferReader(metadata[b'STATISTICS'])), {})
+	token = metadata.get(b'AXIS_STATISTICS')
+	if token is not None and isinstance(filename, (str, os.PathLike)):
+		path = statistics_path(filename)
+		if os.path.exists(path):
+			table = pf.read_table(path)
+			# a file left by an earlier data file of the same name is ignored
+			if (table.schema.metadata or {}).get(b'AXIS_STATISTICS') == token:
+				_statistics_dict(table, result)
+	return result
+
+
+def remove_statistics(filename):
+	"""Remove the file of statistics by position of a data file, if any."""
+	if isinstance(filename, (str, os.PathLike)) and os.path.exists(statistics_path(filename)):
+		os.remove(statistics_path(filename))
@@ -31,13 +31,13 @@ def si_units(x, kind='B', f="{:.3g} {}{}"):
 
 class MemoryUsage:
 
-	def __init__(self):
+	def __init__(self, silent=False):
 		self.memory_history = [0,]
 		self.max_memory_history = [0,]
 		self.pid = os.getpid()  # the current process identifier, to track memory usage
 		if psutil is None:
 			raise ModuleNotFoundError("pstil")
-		self.check()
+		self.check(silent=silent)
 
 	def check(self, silent=False, gc=False, time_checkpoint=None):
 		if gc:
@@ -67,7 +67,7 @@ class MemoryUsage:
 		_gc.collect()
 
 
-resource_usage = MemoryUsage()
+resource_usage = MemoryUsage(silent=True) if psutil is not None else None
 
 
 def timing(stmt, setup='pass', repeat=10, globals=None, quiet=False):
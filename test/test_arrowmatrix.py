@@ -5,14 +5,23 @@ import numpy as np
 import openmatrix as omx
 import arrowmatrix as amx
 
-@pytest.fixture(scope="module", params=["feather","parquet"])
+@pytest.fixture(scope="module", params=["feather","feather_zero_copy","parquet","sparse"])
 def arrow_matrix(request):
 	if request.param == 'feather':
 		filename = "temp_skims.feathermatrix"
 		cls = amx.FeatherMatrix
+	elif request.param == 'feather_zero_copy':
+		filename = "temp_skims_zero_copy.feathermatrix"
+		if os.path.exists(filename):
+			os.remove(filename)
+		amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", filename)
+		return amx.FeatherMatrix(filename, zero_copy=True)
 	elif request.param == 'parquet':
 		filename = "temp_skims.pqmx"
 		cls = amx.ParquetMatrix
+	elif request.param == 'sparse':
+		filename = "temp_skims.spmx"
+		cls = amx.SparseMatrix
 	else:
 		raise ValueError
 	if os.path.exists(filename):
@@ -78,3 +87,891 @@ def test_basic_metadata(arrow_matrix):
 				'DRV_COM_WLK_BOARDS__EA',
 			]
 		)
+
+
+def test_parquet_row_groups():
+	filename = "temp_skims_rowgroups.pqmx"
+	if os.path.exists(filename):
+		os.remove(filename)
+	source = amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", "temp_skims_rowgroups.fmx", overwrite=True)
+	pqmx = amx.ParquetMatrix.from_arrow(
+		source, filename, names=['DIST', 'SOV_TIME__AM'], origins_per_row_group=2,
+	)
+	assert pqmx.parquet_file.metadata.num_row_groups == 13
+	assert pqmx.parquet_file.metadata.row_group(0).num_rows == 50
+	o = [1, 2, 3, 4, 8, 6, 24]
+	d = [9, 7, 5, 6, 3, 0, 24]
+	ref = source.get_matrix('SOV_TIME__AM')
+	np.testing.assert_array_equal(
+		pqmx.get_rc('SOV_TIME__AM', o, d, attach_index=False).to_numpy(),
+		ref[o, d],
+	)
+	pd.testing.assert_frame_equal(
+		pqmx.get_rc(['DIST', 'SOV_TIME__AM'], o, d),
+		source.get_rc(['DIST', 'SOV_TIME__AM'], o, d),
+	)
+	# no positions are taken without reading any data
+	for mx in (pqmx, source):
+		mx._read_arrow_table = None
+		empty = mx._take(['SOV_TIME__AM', 'DIST'], np.array([], dtype=np.int64))
+		del mx._read_arrow_table
+		assert empty.num_rows == 0
+		assert empty.schema == mx.schema.empty_table().select(['SOV_TIME__AM', 'DIST']).schema
+
+
+def test_feather_zero_copy():
+	filename = "temp_skims_zero_copy.fmx"
+	amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, compression='uncompressed')
+	fmx = amx.FeatherMatrix(filename, zero_copy=True)
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	m = fmx.get_matrix('SOV_TIME__AM')
+	assert not m.flags.writeable
+	np.testing.assert_array_equal(ref_matrix.get_node("/data/SOV_TIME__AM")[:], m)
+	assert fmx.get_matrix('SOV_TIME__AM').base is m.base
+	# compressed columns are decoded through the cache, not kept as views
+	amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, compression='lz4')
+	fmx = amx.FeatherMatrix(filename, zero_copy=True, cache_bytes=25 * 25 * 8)
+	for name in ['SOV_TIME__AM', 'SOV_TIME__PM', 'DIST']:
+		np.testing.assert_array_equal(fmx.get_matrix(name), ref_matrix[name][:])
+	assert fmx._arrays == {}
+	assert len(fmx.cache) == 1
+	ref_matrix.close()
+
+
+def test_rc_array(arrow_matrix):
+	names = ['SOV_TIME__AM', 'DIST']
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	ref = arrow_matrix.get_rc(names, o, d, attach_index=False).to_numpy()
+	np.testing.assert_array_equal(arrow_matrix.get_rc_array(names, o, d), ref)
+	out = np.zeros((6, 2), dtype='float32')
+	result = arrow_matrix.get_rc_array(names, o, d, out=out)
+	assert result is out
+	np.testing.assert_array_equal(out, ref.astype('float32'))
+	with pytest.raises(ValueError):
+		arrow_matrix.get_rc_array(names, o, d, out=np.zeros((6, 3)))
+
+
+def test_column_cache():
+	filename = "temp_skims_cache.pqmx"
+	amx.ParquetMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True)
+	column_bytes = amx.ParquetMatrix(filename)._get_arrow_table(['DIST']).column(0).nbytes
+	pqmx = amx.ParquetMatrix(filename, cache_bytes=3 * column_bytes)
+	names = ['SOV_TIME__EA', 'SOV_TIME__AM']
+	o = [1, 2, 3]
+	d = [9, 7, 5]
+	first = pqmx.get_rc(names, o, d)
+	assert pqmx.cache.info()['misses'] == 2
+	assert pqmx.cache.info()['hits'] == 0
+	pd.testing.assert_frame_equal(first, pqmx.get_rc(names, o, d))
+	assert pqmx.cache.hits == 2
+	pqmx.get_rc(['SOV_TIME__AM', 'SOV_TIME__MD', 'SOV_TIME__PM'], o, d)
+	assert pqmx.cache.hits == 3
+	assert pqmx.cache.misses == 4
+	assert pqmx.cache.evictions == 1
+	assert 'SOV_TIME__EA' not in pqmx.cache
+	assert pqmx.cache.nbytes == 3 * column_bytes
+	copied = amx.FeatherMatrix.from_arrow(pqmx, "temp_skims_cache.fmx", names=names, overwrite=True)
+	assert copied.shape == (25, 25)
+
+
+def test_rc_max_workers(arrow_matrix):
+	names = arrow_matrix.list_matrices()[:40]
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	pd.testing.assert_frame_equal(
+		arrow_matrix.get_rc(names, o, d),
+		arrow_matrix.get_rc(names, o, d, max_workers=4),
+	)
+	assert arrow_matrix.get_rc_table(names, o, d, max_workers=3).column_names == names
+
+
+@pytest.mark.parametrize("cls", [amx.FeatherMatrix, amx.ParquetMatrix])
+def test_streaming_from_hdf5(cls):
+	filename = "temp_skims_streamed.amx"
+	streamed = cls.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True, memory_budget=826 * 25 * 8 * 4,
+	)
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	assert streamed.shape == (25, 25)
+	assert streamed.list_matrices() == [node.name for node in ref_matrix.list_nodes("/data")]
+	for name in ['DIST', 'SOV_TIME__AM', 'WLK_TRN_WLK_IVT__PM']:
+		np.testing.assert_array_equal(
+			ref_matrix.get_node(f"/data/{name}")[:],
+			streamed.get_matrix(name),
+		)
+
+
+def test_streaming_parquet_row_groups(monkeypatch):
+	import pyarrow as pa
+	pending = []
+	write = amx.parquet._RowGroupWriter.write
+
+	def recording_write(self, table):
+		write(self, table)
+		pending.append(self._pending_rows)
+
+	monkeypatch.setattr(amx.parquet._RowGroupWriter, 'write', recording_write)
+	filename = "temp_skims_streamed_groups.pqmx"
+	memory_budget = 826 * 25 * 8 * 4
+	pqmx = amx.ParquetMatrix.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True, memory_budget=memory_budget,
+	)
+	slab_rows = amx.common.rows_per_slab(pqmx.schema, memory_budget)
+	# row groups hold no more than one slab, so only one slab is buffered
+	assert pqmx.parquet_file.metadata.num_row_groups > 1
+	assert pqmx.parquet_file.metadata.row_group(0).num_rows == slab_rows * 25
+	assert pending and max(pending) <= slab_rows * 25
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	np.testing.assert_array_equal(ref_matrix.get_node("/data/DIST")[:], pqmx.get_matrix('DIST'))
+	ref_matrix.close()
+	# decoded bool columns take a byte per cell
+	flags = pa.schema([('FLAG', pa.bool_()), ('DIST', pa.float32())], metadata={'SHAPE': '(25, 25)'})
+	assert amx.common.rows_per_slab(flags, 25 * 5 * 10) == 10
+
+
+def test_parallel_from_hdf5_compression():
+	filename = "temp_skims_parallel.pqmx"
+	pqmx = amx.ParquetMatrix.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True,
+		processes=2, memory_budget=826 * 25 * 8 * 10,
+		compression={'DIST*': 'zstd', '*_BOARDS__*': 'lz4'},
+		compression_level={'DIST*': 9},
+	)
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	for name in ['DIST', 'SOV_TIME__AM', 'WLK_TRN_WLK_IVT__PM']:
+		np.testing.assert_array_equal(
+			ref_matrix.get_node(f"/data/{name}")[:],
+			pqmx.get_matrix(name),
+		)
+	row_group = pqmx.parquet_file.metadata.row_group(0)
+	codecs = {
+		row_group.column(i).path_in_schema: row_group.column(i).compression
+		for i in range(row_group.num_columns)
+	}
+	assert codecs['DISTBIKE'] == 'ZSTD'
+	assert codecs['DRV_COM_WLK_BOARDS__AM'] == 'LZ4'
+	assert codecs['SOV_TIME__AM'] == 'SNAPPY'
+	with pytest.raises(ValueError):
+		amx.FeatherMatrix.from_hdf5(
+			"data/tiny-skims.omx", "temp_skims_parallel.fmx", overwrite=True,
+			compression={'DIST*': 'zstd', '*': 'lz4'},
+		)
+
+
+@pytest.mark.parametrize("memory_budget", [None, 826 * 25 * 8 * 5])
+def test_downcast(memory_budget):
+	filename = "temp_skims_downcast.pqmx"
+	pqmx = amx.ParquetMatrix.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True,
+		downcast=True, memory_budget=memory_budget,
+	)
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	downcasts = pqmx.downcasts
+	assert len(downcasts) > 0
+	assert all(str(t) == 'double' for t in downcasts.values())
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	for name in ['DIST', 'SOV_TIME__AM', 'DRV_COM_WLK_BOARDS__AM']:
+		ref = ref_matrix.get_node(f"/data/{name}")[:]
+		stored = pqmx.get_matrix(name)
+		np.testing.assert_array_equal(ref, stored)
+		assert pqmx.get_matrix(name, upcast=True).dtype == ref.dtype
+		rc = pqmx.get_rc(name, o, d, upcast=True)
+		assert rc.dtype == ref.dtype
+		np.testing.assert_array_equal(rc.to_numpy(), ref[o, d])
+	assert pqmx.get_matrix('DRV_COM_WLK_BOARDS__AM').dtype.itemsize < 8
+
+
+def test_narrowest_dtype():
+	from arrowmatrix.downcast import narrowest_dtype
+	assert narrowest_dtype(np.array([0., 1., 100.])) == np.int8
+	assert narrowest_dtype(np.array([0., 1., 1000.])) == np.int16
+	assert narrowest_dtype(np.array([0., 1.5, np.nan])) == np.float32
+	assert narrowest_dtype(np.array([0., 0.1])) == np.float64
+	assert narrowest_dtype(np.array([0., 0.1]), tolerance=1e-6) == np.float32
+	assert narrowest_dtype(np.array([0., 1.00001]), tolerance=1e-3) == np.int8
+
+
+def test_parquet_open_options():
+	import pyarrow as pa
+	filename = "temp_skims_open.pqmx"
+	ref = amx.ParquetMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True)
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	expected = ref.get_rc(['DIST', 'SOV_TIME__AM'], o, d)
+	for pqmx in [
+		amx.ParquetMatrix(filename, memory_map=True),
+		amx.ParquetMatrix(filename, buffer=True),
+		amx.ParquetMatrix(pa.memory_map(filename)),
+	]:
+		assert pqmx.shape == (25, 25)
+		assert pqmx.omx_version == ref.omx_version
+		pd.testing.assert_frame_equal(expected, pqmx.get_rc(['DIST', 'SOV_TIME__AM'], o, d))
+
+
+def _shared_worker(name, o, d):
+	mx = amx.shared.attach(name)
+	result = mx.get_rc('SOV_TIME__AM', o, d, attach_index=False).to_numpy()
+	mx.close()
+	return result
+
+
+def test_shared_memory(arrow_matrix):
+	import multiprocessing
+	names = ['DIST', 'SOV_TIME__AM']
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	with amx.shared.publish(arrow_matrix, names) as publisher:
+		mx = amx.shared.attach(publisher.name)
+		assert mx.shape == arrow_matrix.shape
+		assert mx.list_matrices() == names
+		with pytest.raises(TypeError):
+			mx.update({'DIST': arrow_matrix.get_matrix('DIST')})
+		m = mx.get_matrix('DIST')
+		assert not m.flags.writeable
+		np.testing.assert_array_equal(m, arrow_matrix.get_matrix('DIST'))
+		pd.testing.assert_frame_equal(mx.get_rc(names, o, d), arrow_matrix.get_rc(names, o, d))
+		with multiprocessing.get_context('fork').Pool(1) as pool:
+			np.testing.assert_array_equal(
+				pool.apply(_shared_worker, (publisher.name, o, d)),
+				arrow_matrix.get_matrix('SOV_TIME__AM')[o, d],
+			)
+		del m
+		mx.close()
+
+
+def test_getitem(arrow_matrix):
+	ref = omx.open_file("data/tiny-skims.omx").get_node("/data/SOV_TIME__AM")[:]
+	mask = np.arange(25) % 3 == 0
+	for key, expected in [
+		((slice(None), slice(None)), ref),
+		((slice(10, 20), slice(None)), ref[10:20]),
+		((3, slice(None)), ref[3]),
+		((slice(None), 7), ref[:, 7]),
+		((3, 7), ref[3, 7]),
+		((-1, slice(2, 20, 3)), ref[-1, 2:20:3]),
+		((slice(20, 2, -4), slice(None, None, -1)), ref[20:2:-4, ::-1]),
+		(([4, 1, 1, 9], slice(5, 8)), ref[[4, 1, 1, 9], 5:8]),
+		((slice(2, 4), [24, 0, 3]), ref[2:4][:, [24, 0, 3]]),
+		(([2, 3], [4, 5, 6]), ref[np.ix_([2, 3], [4, 5, 6])]),
+		((Ellipsis, 5), ref[..., 5]),
+		((mask, Ellipsis), ref[mask]),
+		(([0, 24], [24, 0]), ref[np.ix_([0, 24], [24, 0])]),
+	]:
+		np.testing.assert_array_equal(arrow_matrix[('SOV_TIME__AM',) + key], expected)
+	np.testing.assert_array_equal(arrow_matrix['SOV_TIME__AM', 3], ref[3])
+	df = arrow_matrix[['SOV_TIME__AM', 'DIST'], 2:4, [24, 0]]
+	assert df.index.nlevels == 2
+	np.testing.assert_array_equal(df.index.get_level_values(0), [2, 2, 3, 3])
+	np.testing.assert_array_equal(df.index.get_level_values(1), [24, 0, 24, 0])
+	np.testing.assert_array_equal(df['SOV_TIME__AM'], ref[2:4][:, [24, 0]].reshape(-1))
+	with pytest.raises(IndexError):
+		arrow_matrix['SOV_TIME__AM', 25]
+
+
+def test_getitem_3d():
+	values = np.arange(4 * 5 * 6, dtype='float64')
+	df = pd.DataFrame({'A': values, 'B': values * 2})
+	mx = amx.ParquetMatrix.from_dataframe(
+		df, "temp_3d.pqmx", overwrite=True, shape=[4, 5, 6],
+	)
+	ref = values.reshape(4, 5, 6)
+	assert mx.shape == (4, 5, 6)
+	np.testing.assert_array_equal(mx['A', 1:3], ref[1:3])
+	np.testing.assert_array_equal(mx['A', ..., 2], ref[..., 2])
+	np.testing.assert_array_equal(mx['B', 1, :, [0, 5]], 2 * ref[1][:, [0, 5]])
+	np.testing.assert_array_equal(mx['A', [3, 0], 1:4, ::2], ref[[3, 0]][:, 1:4, ::2])
+
+
+def test_rc_dedup(arrow_matrix):
+	names = ['SOV_TIME__AM', 'DIST']
+	o = [1, 2, 3, 4, 1, 6, 24, 2, 1]
+	d = [9, 7, 5, 6, 9, 0, 24, 7, 9]
+	pd.testing.assert_frame_equal(
+		arrow_matrix.get_rc(names, o, d, dedup=True),
+		arrow_matrix.get_rc(names, o, d),
+	)
+	pd.testing.assert_series_equal(
+		arrow_matrix.get_rc('DIST', o, d, attach_index=False, dedup=True),
+		arrow_matrix.get_rc('DIST', o, d, attach_index=False),
+	)
+	np.testing.assert_array_equal(
+		arrow_matrix.get_rc_array(names, o, d, dedup=True),
+		arrow_matrix.get_rc_array(names, o, d),
+	)
+	assert arrow_matrix.get_rc_table(names, o, d, dedup=True).equals(
+		arrow_matrix.get_rc_table(names, o, d)
+	)
+
+
+def test_async_and_prefetch(arrow_matrix):
+	import asyncio
+	names = ['SOV_TIME__AM', 'DIST']
+	o = [1, 2, 3, 4, 8, 6]
+	d = [9, 7, 5, 6, 3, 0]
+	expected = arrow_matrix.get_rc(names, o, d)
+
+	async def run():
+		return await asyncio.gather(
+			arrow_matrix.aget_rc(names, o, d),
+			arrow_matrix.aget_rc('DIST', o, d, attach_index=False),
+		)
+
+	both, single = asyncio.run(run())
+	pd.testing.assert_frame_equal(both, expected)
+	np.testing.assert_array_equal(single, expected['DIST'])
+	arrow_matrix.prefetch(names)
+	if arrow_matrix._column_array('DIST') is None:
+		assert set(arrow_matrix._prefetched) == set(names)
+	pd.testing.assert_frame_equal(arrow_matrix.get_rc(names, o, d), expected)
+	assert not arrow_matrix._prefetched
+	arrow_matrix.prefetch('SOV_TIME__AM')
+	np.testing.assert_array_equal(
+		arrow_matrix.get_matrix('SOV_TIME__AM'),
+		omx.open_file("data/tiny-skims.omx").get_node("/data/SOV_TIME__AM")[:],
+	)
+
+
+def test_sparse():
+	rng = np.random.default_rng(0)
+	shape = (40, 50)
+	dense = np.zeros(np.prod(shape))
+	stored = rng.choice(dense.size, size=100, replace=False)
+	dense[stored] = rng.random(100)
+	dense[stored[0]] = np.nan
+	counts = np.zeros(dense.size, dtype='int16')
+	counts[stored[:10]] = 7
+	df = pd.DataFrame({'TIME': dense, 'COUNT': counts})
+	mx = amx.SparseMatrix.from_dataframe(df, "temp_sparse.spmx", overwrite=True, shape=list(shape))
+	assert isinstance(amx.open_matrix("temp_sparse.spmx"), amx.SparseMatrix)
+	assert mx.nnz('TIME') == 100
+	assert mx.nnz('COUNT') == 10
+	assert mx.schema.field('COUNT').type == 'int16'
+	np.testing.assert_array_equal(mx.get_matrix('TIME'), dense.reshape(shape))
+	np.testing.assert_array_equal(mx.get_matrix('COUNT'), counts.reshape(shape))
+	o, d = np.unravel_index(np.concatenate([stored[:20], [0, dense.size - 1]]), shape)
+	rc = mx.get_rc(['TIME', 'COUNT'], o, d, dtype=None)
+	np.testing.assert_array_equal(rc['TIME'], dense.reshape(shape)[o, d])
+	np.testing.assert_array_equal(rc['COUNT'], counts.reshape(shape)[o, d])
+	np.testing.assert_array_equal(mx['TIME', 3:7, ::3], dense.reshape(shape)[3:7, ::3])
+	# int64 values beyond the significand of float64 are not rounded
+	ids = np.zeros(dense.size, dtype=np.int64)
+	ids[stored[:5]] = 2**53 + np.arange(1, 6)
+	df = pd.DataFrame({'TIME': dense, 'COUNT': counts, 'ID': ids})
+	mx = amx.SparseMatrix.from_dataframe(df, "temp_sparse.spmx", overwrite=True, shape=list(shape))
+	np.testing.assert_array_equal(mx.get_matrix('ID'), ids.reshape(shape))
+	np.testing.assert_array_equal(mx.get_rc('ID', o, d, dtype=None), ids.reshape(shape)[o, d])
+	np.testing.assert_array_equal(mx.get_matrix('COUNT'), counts.reshape(shape))
+	np.testing.assert_array_equal(mx.get_matrix('TIME'), dense.reshape(shape))
+	assert amx.sparse._value_columns([np.dtype('int16'), np.dtype('float32')])[1] == {'value': np.dtype('float32')}
+
+
+def test_sparse_streaming_rejected():
+	filename = "temp_sparse_streaming.spmx"
+	mx = amx.SparseMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True)
+	updated = mx.get_matrix('DIST') + 1
+	mx.update({'DIST': updated})
+	for options in [dict(memory_budget=826 * 25 * 8 * 4), dict(processes=2)]:
+		with pytest.raises(TypeError):
+			amx.SparseMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, **options)
+	# the file and its updates are untouched
+	np.testing.assert_array_equal(amx.SparseMatrix(filename).get_matrix('DIST'), updated)
+
+
+def test_tile_row_group_sizes(monkeypatch):
+	sizes = amx.parquet.tile_row_group_sizes((3000, 3000), (50, 50))
+	assert len(sizes) == 60 * 3
+	assert sum(sizes) == 3000 * 3000
+	assert max(sizes) <= amx.parquet.ROW_GROUP_TARGET_CELLS
+	monkeypatch.setattr(amx.parquet, 'ROW_GROUP_TARGET_CELLS', 160)
+	# clipped edge tiles, and groups that do not span rows of tiles
+	assert amx.parquet.tile_row_group_sizes((25, 25), (10, 8)) == [160, 90, 160, 90, 125]
+
+
+def test_tiled_positions():
+	shape = (7, 5, 6)
+	tile = amx.common.normalize_tile(shape, (3, 2, 4))
+	values = np.arange(np.prod(shape)).reshape(shape)
+	stored = amx.common.tile_array(values, tile)
+	positions = amx.common.tiled_positions(np.indices(shape), shape, tile)
+	np.testing.assert_array_equal(stored[positions], values)
+	np.testing.assert_array_equal(amx.common.untile_array(stored, shape, tile), values)
+	assert amx.common.normalize_tile(shape, (2, None)) is None
+	assert amx.common.normalize_tile((25, 25), 10) == (10, 10)
+
+
+@pytest.mark.parametrize("cls", [amx.ParquetMatrix, amx.FeatherMatrix, amx.SparseMatrix])
+def test_tiled(cls):
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	ref = ref_matrix['SOV_TIME__AM'][:]
+	ref_dist = ref_matrix['DIST'][:]
+	ref_matrix.close()
+	filename = f"temp_skims_tiled{cls.__name__}.amx"
+	mx = cls.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, tile=(10, 8))
+	assert mx.tile == (10, 8)
+	if cls is amx.ParquetMatrix:
+		# the tiles of each row of tiles are grouped
+		assert mx.parquet_file.metadata.num_row_groups == 3
+	np.testing.assert_array_equal(mx.get_matrix('SOV_TIME__AM'), ref)
+	o = [1, 2, 3, 24, 8, 16]
+	d = [9, 7, 5, 6, 24, 0]
+	np.testing.assert_array_equal(mx.get_rc('DIST', o, d), ref_dist[o, d])
+	np.testing.assert_array_equal(mx['SOV_TIME__AM', :, 8:16], ref[:, 8:16])
+	np.testing.assert_array_equal(mx['DIST', 22, [3, 0, 17]], ref_dist[22, [3, 0, 17]])
+	np.testing.assert_allclose(mx.expr("DIST * 2", chunk_cells=64).evaluate(), ref_dist * 2)
+	if cls is not amx.SparseMatrix:
+		mx = cls.from_hdf5(
+			"data/tiny-skims.omx", filename, overwrite=True, tile=(10, 8), memory_budget=1,
+		)
+		np.testing.assert_array_equal(mx.get_matrix('DIST'), ref_dist)
+	untiled = amx.FeatherMatrix.from_arrow(mx, "temp_skims_untiled.fmx", overwrite=True)
+	assert untiled.tile is None
+	np.testing.assert_array_equal(untiled.get_matrix('DIST'), ref_dist)
+	np.testing.assert_array_equal(untiled['DIST', 3:5], ref_dist[3:5])
+
+
+def test_expr(arrow_matrix):
+	time = arrow_matrix.get_matrix('SOV_TIME__AM')
+	dist = arrow_matrix.get_matrix('DIST')
+	vot = 4.0
+	expected = time + dist / vot
+	cost = arrow_matrix.expr("SOV_TIME__AM + DIST / vot", chunk_cells=100, vot=vot)
+	assert cost.names == ['SOV_TIME__AM', 'DIST']
+	np.testing.assert_allclose(cost.evaluate(), expected)
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	rc = cost.get_rc(o, d)
+	np.testing.assert_allclose(rc, expected[o, d])
+	assert rc.index.nlevels == 2
+	np.testing.assert_allclose(cost.get_rc_array(o, d, dedup=True), expected[o, d])
+	np.testing.assert_array_equal(
+		arrow_matrix.expr("maximum(DIST, 1) > 5").evaluate(),
+		np.maximum(dist, 1) > 5,
+	)
+	with pytest.raises(NameError):
+		arrow_matrix.expr("DIST + nope")
+	with pytest.raises(ValueError):
+		arrow_matrix.expr("DIST.__class__")
+	with pytest.raises(ValueError):
+		arrow_matrix.expr("open('x')")
+
+
+@pytest.mark.parametrize("cls", [amx.ParquetMatrix, amx.FeatherMatrix])
+@pytest.mark.parametrize("memory_budget", [None, 1000])
+def test_statistics(cls, memory_budget):
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	ref = ref_matrix['SOV_TIME__AM'][:]
+	ref_matrix.close()
+	filename = f"temp_skims_stats{cls.__name__}.amx"
+	mx = cls.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True, statistics=True,
+		memory_budget=memory_budget, tile=(10, 10),
+	)
+	assert mx.aggregate('SOV_TIME__AM', 'max') == ref.max()
+	# statistics by position are kept out of the schema metadata
+	assert os.path.exists(filename + ".stats")
+	assert 'statistics' not in mx.__dict__
+	whole = amx.statistics.read_statistics(mx.schema.metadata)
+	assert all(axis is None for _, axis in whole)
+	assert mx.statistics is not None
+	np.testing.assert_allclose(mx.aggregate('SOV_TIME__AM', 'sum', axis=0), ref.sum(axis=1))
+	np.testing.assert_array_equal(mx.aggregate('SOV_TIME__AM', 'min', axis=1), ref.min(axis=0))
+	np.testing.assert_array_equal(
+		mx.aggregate('SOV_TIME__AM', 'count', axis=-1), np.count_nonzero(ref, axis=0),
+	)
+	plain = cls.from_arrow(mx, filename + "2", overwrite=True)
+	assert plain.statistics is None
+	assert plain.aggregate('SOV_TIME__AM', 'min') == ref.min()
+	np.testing.assert_allclose(plain.aggregate('SOV_TIME__AM', 'sum', axis=0), ref.sum(axis=1))
+	with pytest.raises(ValueError):
+		plain.aggregate('SOV_TIME__AM', 'mean')
+	# statistics by position of another file are not used
+	cls.from_arrow(mx, filename + "2", overwrite=True, statistics=True)
+	os.replace(filename + ".stats", filename + "2.stats")
+	assert set(cls(filename + "2").statistics) == set(whole)
+
+
+def test_lookup_index():
+	dense = amx.lookup.LookupIndex(np.array([101, 105, 103, 110]))
+	np.testing.assert_array_equal(dense.positions([110, 101, 103]), [3, 0, 2])
+	sparse = amx.lookup.LookupIndex(np.array([7, 10**9, -5]))
+	np.testing.assert_array_equal(sparse.positions([-5, 10**9]), [2, 1])
+	names = amx.lookup.LookupIndex(np.array(['b', 'a']))
+	np.testing.assert_array_equal(names.positions(['a', 'b', 'a']), [1, 0, 1])
+	for index in (dense, sparse):
+		with pytest.raises(KeyError):
+			index.positions([104])
+	with pytest.raises(ValueError):
+		amx.lookup.LookupIndex(np.array([1, 2, 1]))
+
+
+@pytest.mark.parametrize("cls", [amx.ParquetMatrix, amx.FeatherMatrix])
+@pytest.mark.parametrize("memory_budget", [None, 1000])
+def test_lookup(cls, memory_budget):
+	with omx.open_file("data/tiny-skims.omx") as source:
+		ref = source['DIST'][:]
+		with omx.open_file("temp_lookup.omx", 'w') as f:
+			f['DIST'] = ref
+			taz = np.arange(25) * 10 + 1000
+			f.create_mapping('TAZ', taz)
+	mx = cls.from_hdf5(
+		"temp_lookup.omx", f"temp_lookup{cls.__name__}.amx", overwrite=True,
+		memory_budget=memory_budget,
+	)
+	np.testing.assert_array_equal(mx.lookups['TAZ'], taz)
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	rc = mx.get_rc('DIST', taz[o], taz[d], by='TAZ')
+	np.testing.assert_array_equal(rc, ref[o, d])
+	np.testing.assert_array_equal(rc.index.get_level_values(0), taz[o])
+	np.testing.assert_array_equal(mx.get_rc_array(['DIST'], taz[o], d, by=('TAZ', None))[:, 0], ref[o, d])
+	with pytest.raises(KeyError):
+		mx.get_rc('DIST', [1], [1], by='TAZ')
+	with pytest.raises(KeyError):
+		mx.get_rc('DIST', [1], [1], by='MAZ')
+
+
+@pytest.mark.parametrize("memory_budget", [None, 100000])
+def test_fold_periods(memory_budget):
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	names = [node.name for node in ref_matrix.list_nodes("/data")]
+	ref_time = {p: ref_matrix[f'SOV_TIME__{p}'][:] for p in amx.fold.PERIODS}
+	ref_dist = ref_matrix['DIST'][:]
+	spec = amx.fold.fold_spec(names)
+	partial = next(
+		(base, members) for base, members in spec['columns']
+		if None in members
+	)
+	ref_partial = [
+		None if member is None else ref_matrix[member][:] for member in partial[1]
+	]
+	ref_matrix.close()
+	mx = amx.ParquetMatrix.from_hdf5(
+		"data/tiny-skims.omx", "temp_skims_folded.pqmx", overwrite=True,
+		fold=True, memory_budget=memory_budget,
+	)
+	assert mx.shape == (25, 25, 5)
+	assert 'SOV_TIME__AM' not in mx.list_matrices()
+	assert mx.folded['labels'] == list(amx.fold.PERIODS)
+	time = mx.get_matrix('SOV_TIME')
+	for i, p in enumerate(amx.fold.PERIODS):
+		np.testing.assert_array_equal(time[..., i], ref_time[p])
+		np.testing.assert_array_equal(mx.get_matrix('DIST')[..., i], ref_dist)
+	folded_partial = mx.get_matrix(partial[0])
+	for i, values in enumerate(ref_partial):
+		if values is None:
+			assert np.isnan(folded_partial[..., i]).all()
+		else:
+			np.testing.assert_array_equal(folded_partial[..., i], values)
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	period = ['AM', 'EA', 'EV', 'PM', 'AM', 'MD']
+	rc = mx.get_rc_period(['SOV_TIME', 'DIST'], o, d, period=period)
+	np.testing.assert_array_equal(rc['SOV_TIME'], [ref_time[p][i, j] for i, j, p in zip(o, d, period)])
+	np.testing.assert_array_equal(rc['DIST'], ref_dist[o, d])
+	positions = [amx.fold.PERIODS.index(p) for p in period]
+	np.testing.assert_array_equal(
+		mx.get_rc_period('SOV_TIME', o, d, period=positions, attach_index=False),
+		rc['SOV_TIME'],
+	)
+
+
+def test_bench_suite(tmp_path):
+	import json
+	from arrowmatrix.bench import bench_suite, synthetic_skims
+	skims = synthetic_skims((12, 10, 2), n_columns=3)
+	assert skims.num_rows == 240
+	assert skims.schema.metadata[b'SHAPE'] == b'(12, 10, 2)'
+	result = bench_suite(
+		shape=(20, 20), n_columns=2, codecs=['zstd'], chunk_cells=[None, 100],
+		rc_sizes=[10], repeat=1, conversion=False, workdir=tmp_path,
+	)
+	json.dumps(result)
+	operations = {
+		(r['format'], r['chunk_cells'], r['operation']) for r in result['results']
+	}
+	for fmt in ('feather', 'parquet'):
+		for cells in (None, 100):
+			for operation in ('open', 'get_matrix', 'get_rc', 'getitem_rows', 'getitem_columns'):
+				assert (fmt, cells, operation) in operations
+	assert all(r['file_size'] > 0 and r['min'] >= 0 for r in result['results'])
+
+
+def test_instrument(arrow_matrix):
+	import json
+	names = arrow_matrix.list_matrices()[:4]
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	assert arrow_matrix.instrumentation is None
+	expected = arrow_matrix.get_rc(names, o, d)
+	stats = arrow_matrix.instrument()
+	assert arrow_matrix.instrumentation is stats
+	pd.testing.assert_frame_equal(arrow_matrix.get_rc(names, o, d), expected)
+	arrow_matrix.get_rc(names, o, d, max_workers=2)
+	arrow_matrix.get_rc_array(names[0], o, d)
+	arrow_matrix.get_matrix(names[1])
+	arrow_matrix[names[:2], :5, 3]
+	totals = stats.to_dict()
+	assert set(totals) == {'get_rc', 'get_rc_array', 'get_matrix', 'getitem'}
+	assert totals['get_rc']['calls'] == 2
+	assert totals['get_rc']['columns'] == 8
+	assert totals['get_rc']['takers'] == 12
+	assert totals['getitem']['takers'] == 5
+	for operation, counters in totals.items():
+		stages = counters['read'] + counters['take'] + counters['convert']
+		assert 0 <= stages <= counters['seconds']
+	if arrow_matrix._column_array(names[0]) is None:
+		assert totals['get_matrix']['bytes_read'] > 0
+	# exported totals from other processes can be merged
+	merged = amx.instrument.ReadStats.from_dict(json.loads(json.dumps(totals))).merge(stats)
+	assert merged.to_dict()['get_rc']['calls'] == 4
+	assert merged.to_frame().loc['get_matrix', 'calls'] == 2
+	# nested calls are recorded once, by a custom callback
+	events = []
+	arrow_matrix.instrument(events.append)
+	arrow_matrix.get_rc_table(names, o, d, dedup=True)
+	assert [e['operation'] for e in events] == ['get_rc_table']
+	assert events[0]['takers'] == 5
+	arrow_matrix.instrument(False)
+	arrow_matrix.get_rc(names, o, d)
+	assert len(events) == 1
+	assert stats.to_dict() == totals
+
+
+@pytest.mark.parametrize("memory_map", [True, False])
+def test_feather_lazy_open(memory_map):
+	import pyarrow as pa
+	filename = "temp_skims_lazy.fmx"
+	amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, compression='zstd')
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	fmx = amx.FeatherMatrix(filename, memory_map=memory_map)
+	names = ['SOV_TIME__PM', 'DIST', 'SOV_TIME__AM']
+	table = fmx._read_arrow_table(names)
+	assert table.column_names == names
+	assert table.schema.metadata[b'SHAPE'] == fmx.schema.metadata[b'SHAPE']
+	for name in names:
+		np.testing.assert_array_equal(fmx.get_matrix(name), ref_matrix[name][:])
+	o = [1, 2, 3]
+	d = [9, 7, 5]
+	np.testing.assert_array_equal(
+		fmx.get_rc('DIST', o, d, attach_index=False).to_numpy(), ref_matrix['DIST'][:][o, d],
+	)
+	# the most recently decoded column is not read again
+	assert fmx._last_column[0] == 'DIST'
+	fmx._reader_for = None
+	np.testing.assert_array_equal(
+		fmx.get_rc('DIST', d, o, attach_index=False).to_numpy(), ref_matrix['DIST'][:][d, o],
+	)
+	del fmx._reader_for
+	assert fmx._read_arrow_table([]).num_columns == 0
+	assert fmx._read_arrow_table().column_names == fmx.list_matrices()
+	with pytest.raises(KeyError):
+		fmx._read_arrow_table(['NOT_A_MATRIX'])
+	buffered = amx.FeatherMatrix(pa.memory_map(filename).read_buffer())
+	np.testing.assert_array_equal(buffered.get_matrix('DIST'), ref_matrix['DIST'][:])
+	ref_matrix.close()
+
+
+@pytest.mark.parametrize("compression", ['uncompressed', 'zstd'])
+def test_feather_read_allocation(compression):
+	import pyarrow as pa
+	filename = "temp_skims_allocation.fmx"
+	amx.FeatherMatrix.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, compression=compression)
+	fmx = amx.FeatherMatrix(filename)
+	# only compressed files need their columns read by field
+	assert fmx._read_fields == (compression != 'uncompressed')
+	file_bytes = 825 * 25 * 25 * 8
+	before = pa.total_allocated_bytes()
+	table = fmx._read_arrow_table(['DIST', 'SOV_TIME__AM'])
+	allocated = pa.total_allocated_bytes() - before
+	if compression == 'uncompressed':
+		# zero-copy views of the memory-mapped file
+		assert allocated == 0
+	assert allocated < file_bytes / 10
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	np.testing.assert_array_equal(table.column('DIST').to_numpy().reshape(25, 25), ref_matrix['DIST'][:])
+	ref_matrix.close()
+	# readers are opened once and kept
+	assert fmx._reader_for(['DIST', 'SOV_TIME__AM']) is fmx._reader_for(['SOV_TIME__AM', 'DIST'])
+
+
+def test_dataset(tmp_path):
+	import json
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	source = amx.ParquetMatrix.from_hdf5(
+		"data/tiny-skims.omx", "temp_skims_dataset.pqmx", overwrite=True, statistics=True,
+	)
+	names = source.list_matrices()
+	groups = {
+		'am': [name for name in names if name.endswith('__AM')],
+		'pm': [name for name in names if name.endswith('__PM')],
+	}
+	directory = tmp_path / "skims"
+	ds = amx.ArrowMatrixDataset.from_arrow(source, directory, groups=groups, statistics=True)
+	assert isinstance(amx.open_matrix(directory), amx.ArrowMatrixDataset)
+	assert ds.shape == (25, 25)
+	assert ds.groups == groups
+	assert ds.list_matrices() == groups['am'] + groups['pm']
+	am, pm = groups['am'][0], groups['pm'][0]
+	assert ds.group_of(pm) == 'pm'
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	for kwargs in [{}, dict(max_workers=2)]:
+		rc = ds.get_rc([am, pm], o, d, **kwargs)
+		np.testing.assert_array_equal(rc[am], ref_matrix[am][:][o, d])
+		np.testing.assert_array_equal(rc[pm], ref_matrix[pm][:][o, d])
+	np.testing.assert_array_equal(ds.get_matrix(pm), ref_matrix[pm][:])
+	np.testing.assert_array_equal(ds[am, 3:7, 5], ref_matrix[am][:][3:7, 5])
+	np.testing.assert_array_equal(ds.expr(f"{am} - {pm}").evaluate(), ref_matrix[am][:] - ref_matrix[pm][:])
+	assert ds.aggregate(pm, 'max') == np.nanmax(ref_matrix[pm][:])
+	cached = amx.ArrowMatrixDataset(directory, cache_bytes=1 << 20)
+	pd.testing.assert_frame_equal(cached.get_rc([am, pm], o, d), ds.get_rc([am, pm], o, d))
+
+	# replacing one group leaves the other's file alone
+	manifest = json.loads((directory / "manifest.json").read_text())
+	am_file = manifest['groups']['am']['file']
+	am_mtime = os.path.getmtime(directory / am_file)
+	doubled = amx.FeatherMatrix.from_dataframe(
+		pd.DataFrame({pm: ref_matrix[pm][:].reshape(-1) * 2}),
+		"temp_skims_doubled.fmx", shape=[25, 25], overwrite=True,
+	)
+	ds.write_group('pm', doubled, names=[pm])
+	assert ds.groups['pm'] == [pm]
+	np.testing.assert_array_equal(ds.get_matrix(pm), ref_matrix[pm][:] * 2)
+	assert ds.statistics.get((pm, None)) is None
+	assert os.path.getmtime(directory / am_file) == am_mtime
+	assert not (directory / manifest['groups']['pm']['file']).exists()
+	cached.refresh()
+	np.testing.assert_array_equal(cached.get_rc(pm, o, d), ref_matrix[pm][:][o, d] * 2)
+	with pytest.raises(ValueError):
+		ds.write_group('other', source, names=[am])
+	ds.remove_group('pm')
+	assert ds.list_matrices() == groups['am']
+	ref_matrix.close()
+
+
+@pytest.mark.parametrize("cls", [amx.ParquetMatrix, amx.FeatherMatrix, amx.SparseMatrix])
+@pytest.mark.parametrize("tile", [None, (10, 10)])
+def test_update(cls, tile):
+	filename = f"temp_skims_update_{cls.__name__}.amx"
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	mx = cls.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True, tile=tile, downcast=True, statistics=True,
+	)
+	names = mx.list_matrices()
+	replaced, kept = names[0], names[1]
+	values = np.arange(625.).reshape(25, 25)
+	mx.update({replaced: values, 'NEW_SKIM': values * 2})
+	assert type(mx) is cls
+	assert mx.list_matrices() == names + ['NEW_SKIM']
+	assert replaced not in mx.downcasts
+	# storage statistics of the file do not cover updated matrices
+	assert mx.aggregate(replaced, 'max') == values.max()
+	o = [1, 2, 3, 24, 8, 3]
+	d = [9, 7, 5, 6, 24, 5]
+	for reopened in [mx, amx.open_matrix(filename), cls(filename)]:
+		assert type(reopened) is type(mx)
+		rc = reopened.get_rc([replaced, kept, 'NEW_SKIM'], o, d)
+		np.testing.assert_array_equal(rc[replaced], values[o, d])
+		np.testing.assert_array_equal(rc[kept], ref_matrix[kept][:][o, d])
+		np.testing.assert_array_equal(rc['NEW_SKIM'], values[o, d] * 2)
+		np.testing.assert_array_equal(reopened.get_matrix(replaced), values)
+		np.testing.assert_array_equal(reopened[[kept, 'NEW_SKIM'], 3:7, 2]['NEW_SKIM'], values[3:7, 2] * 2)
+	# later updates supersede earlier ones, rewriting only the overlay
+	mx.update({'NEW_SKIM': values * 3})
+	assert sorted(mx.overlay.list_matrices()) == sorted([replaced, 'NEW_SKIM'])
+	np.testing.assert_array_equal(cls(filename).get_matrix('NEW_SKIM'), values * 3)
+	np.testing.assert_array_equal(mx.expr(f"NEW_SKIM - {replaced}").evaluate(), values * 2)
+	with pytest.raises(ValueError):
+		mx.update({'BAD': values[:5]})
+	compacted = mx.compact()
+	assert type(compacted) is cls
+	assert not os.path.exists(filename + ".overlay")
+	assert compacted.list_matrices() == names + ['NEW_SKIM']
+	assert compacted.tile == mx.tile
+	np.testing.assert_array_equal(compacted.get_matrix('NEW_SKIM'), values * 3)
+	np.testing.assert_array_equal(compacted.get_matrix(kept), ref_matrix[kept][:])
+	# statistics are kept, and cover the merged updates
+	assert compacted.aggregate('NEW_SKIM', 'max') == (values * 3).max()
+	assert compacted.statistics[('NEW_SKIM', 0)]['max'].shape == (25,)
+	# a stale file of statistics by position is removed
+	compacted = compacted.compact(statistics=False)
+	assert compacted.statistics is None
+	assert not os.path.exists(filename + ".stats")
+	# overwriting a file discards its updates
+	compacted.update({'NEW_SKIM': values})
+	rewritten = cls.from_hdf5("data/tiny-skims.omx", filename, overwrite=True)
+	assert rewritten.list_matrices() == names
+	assert not os.path.exists(filename + ".overlay")
+	ref_matrix.close()
+
+
+@pytest.mark.parametrize("cls, kwargs", [
+	(amx.ParquetMatrix, dict(origins_per_row_group=4)),
+	(amx.FeatherMatrix, dict(chunksize=90)),
+	(amx.SparseMatrix, {}),
+])
+@pytest.mark.parametrize("tile", [None, (10, 10)])
+def test_iter_rows(cls, kwargs, tile):
+	filename = f"temp_skims_iter_rows_{cls.__name__}.amx"
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	if tile is not None:
+		kwargs = {}
+	mx = cls.from_hdf5("data/tiny-skims.omx", filename, overwrite=True, tile=tile, downcast=True, **kwargs)
+	names = mx.list_matrices()[:3]
+	for rows_per_chunk, read_ahead in [(1, 0), (3, 2), (7, 1), (None, 0)]:
+		rows = []
+		for origins, blocks in mx.iter_rows(names, rows_per_chunk=rows_per_chunk, read_ahead=read_ahead, upcast=True):
+			rows.append(origins)
+			assert list(blocks) == names
+			for name in names:
+				assert blocks[name].shape == (origins.stop - origins.start, 25)
+				np.testing.assert_array_equal(blocks[name], ref_matrix[name][origins, :])
+				assert blocks[name].dtype == ref_matrix[name].dtype
+		assert rows[0].start == 0 and rows[-1].stop == 25
+		assert all(a.stop == b.start for a, b in zip(rows, rows[1:]))
+		if tile is not None:
+			assert all((r.stop - r.start) % 10 == 0 for r in rows[:-1])
+		elif rows_per_chunk is not None:
+			assert all(r.stop - r.start == rows_per_chunk for r in rows[:-1])
+	# stopping early
+	origins, blocks = next(mx.iter_rows(names[0], rows_per_chunk=2, read_ahead=3))
+	np.testing.assert_array_equal(blocks[names[0]], ref_matrix[names[0]][origins, :])
+	assert origins == slice(0, 2 if tile is None else 10)
+	with pytest.raises(ValueError):
+		next(mx.iter_rows(names, rows_per_chunk=0))
+	ref_matrix.close()
+
+
+@pytest.mark.parametrize("compression", ['uncompressed', 'lz4'])
+def test_feather_default_chunks(monkeypatch, compression):
+	monkeypatch.setattr(amx.feather, 'RECORD_BATCH_TARGET_CELLS', 100)
+	filename = "temp_skims_chunks.fmx"
+	fmx = amx.FeatherMatrix.from_hdf5(
+		"data/tiny-skims.omx", filename, overwrite=True, compression=compression,
+	)
+	ref_matrix = omx.open_file("data/tiny-skims.omx")
+	batches = fmx._record_batch_offsets
+	if compression == 'uncompressed':
+		# one zero-copy record batch, split freely
+		assert list(batches) == [0, 625]
+		assert fmx._chunk_bounds(50)[:2] == [(0, 50), (50, 100)]
+	else:
+		# record batches of whole origin rows, read one at a time
+		assert list(batches) == list(range(0, 625, 100)) + [625]
+		assert fmx._chunk_bounds(50)[:2] == [(0, 100), (100, 200)]
+	read = []
+
+	def read_batches(names, batches):
+		read.append(list(batches))
+		return amx.FeatherMatrix._read_batches(fmx, names, batches)
+
+	monkeypatch.setattr(fmx, '_read_batches', read_batches)
+	for origins, blocks in fmx.iter_rows(['DIST', 'SOV_TIME__AM'], rows_per_chunk=2):
+		np.testing.assert_array_equal(blocks['DIST'], ref_matrix['DIST'][origins, :])
+	if compression == 'lz4':
+		assert read == [[i] for i in range(7)]
+	result = fmx.expr("DIST + SOV_TIME__AM", chunk_cells=50).evaluate()
+	np.testing.assert_allclose(result, ref_matrix['DIST'][:] + ref_matrix['SOV_TIME__AM'][:])
+	ref_matrix.close()